@@ -0,0 +1,19 @@
+-- 月度渠道绩效汇总脚本
+-- 在 Supabase Dashboard -> SQL Editor 中执行此脚本
+-- 执行前请确保已执行过 init_supabase.sql、add_channels_tables.sql 和 add_report_dirty_cells_table.sql
+
+-- 1. 月度渠道绩效表增加投手日报记录数（/api/channels/stats 的完整月份直接读取此表）
+ALTER TABLE monthly_channel_performance ADD COLUMN IF NOT EXISTS record_count INTEGER NOT NULL DEFAULT 0;
+
+-- 2. 用已有数据初始化月度渠道绩效（之后由生成月度报表、刷新待刷新单元维护）
+INSERT INTO monthly_channel_performance (channel_id, month, total_spend, active_accounts, record_count)
+SELECT channel_id, date_trunc('month', spend_date)::date, SUM(amount_usdt), COUNT(DISTINCT operator_id), COUNT(*)
+FROM ad_spend_daily
+GROUP BY channel_id, date_trunc('month', spend_date)::date
+ON CONFLICT (channel_id, month) DO UPDATE SET
+    total_spend = EXCLUDED.total_spend,
+    active_accounts = EXCLUDED.active_accounts,
+    record_count = EXCLUDED.record_count;
+
+-- 完成提示
+SELECT '月度渠道绩效汇总完成！' AS message;
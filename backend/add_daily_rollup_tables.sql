@@ -0,0 +1,62 @@
+-- 日汇总表创建脚本
+-- 在 Supabase Dashboard -> SQL Editor 中执行此脚本
+-- 执行前请确保已执行过 init_supabase.sql 和 add_channels_tables.sql
+
+-- 1. 创建投手日报日汇总表（写入投手日报、变更状态时增量维护）
+CREATE TABLE IF NOT EXISTS daily_spend_rollup (
+    id SERIAL PRIMARY KEY,
+    project_id INTEGER NOT NULL,
+    operator_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    day DATE NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    amount_usdt NUMERIC(15, 2) NOT NULL DEFAULT 0,
+    record_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    CONSTRAINT uq_daily_spend_rollup UNIQUE (project_id, operator_id, channel_id, day, status)
+);
+
+-- 为 daily_spend_rollup 表创建索引
+CREATE INDEX IF NOT EXISTS idx_daily_spend_rollup_day ON daily_spend_rollup(day);
+CREATE INDEX IF NOT EXISTS idx_daily_spend_rollup_operator ON daily_spend_rollup(operator_id);
+CREATE INDEX IF NOT EXISTS idx_daily_spend_rollup_channel ON daily_spend_rollup(channel_id);
+
+-- 2. 创建财务记录日汇总表（写入财务记录时增量维护，project_id = 0 表示未关联项目）
+CREATE TABLE IF NOT EXISTS daily_ledger_rollup (
+    id SERIAL PRIMARY KEY,
+    project_id INTEGER NOT NULL,
+    direction VARCHAR(20) NOT NULL,
+    currency VARCHAR(10) NOT NULL,
+    day DATE NOT NULL,
+    amount NUMERIC(15, 2) NOT NULL DEFAULT 0,
+    fee_amount NUMERIC(15, 2) NOT NULL DEFAULT 0,
+    record_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    CONSTRAINT uq_daily_ledger_rollup UNIQUE (project_id, direction, currency, day)
+);
+
+-- 为 daily_ledger_rollup 表创建索引
+CREATE INDEX IF NOT EXISTS idx_daily_ledger_rollup_day ON daily_ledger_rollup(day);
+
+-- 为日汇总表添加更新时间触发器
+CREATE TRIGGER update_daily_spend_rollup_updated_at BEFORE UPDATE ON daily_spend_rollup
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+CREATE TRIGGER update_daily_ledger_rollup_updated_at BEFORE UPDATE ON daily_ledger_rollup
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+-- 3. 用已有数据初始化日汇总（之后也可以运行 python rebuild_daily_rollups.py 重建）
+INSERT INTO daily_spend_rollup (project_id, operator_id, channel_id, day, status, amount_usdt, record_count)
+SELECT project_id, operator_id, channel_id, spend_date, COALESCE(status, ''), SUM(amount_usdt), COUNT(*)
+FROM ad_spend_daily
+GROUP BY project_id, operator_id, channel_id, spend_date, COALESCE(status, '')
+ON CONFLICT (project_id, operator_id, channel_id, day, status) DO NOTHING;
+
+INSERT INTO daily_ledger_rollup (project_id, direction, currency, day, amount, fee_amount, record_count)
+SELECT COALESCE(project_id, 0), direction, COALESCE(currency, ''), tx_date, SUM(amount), COALESCE(SUM(fee_amount), 0), COUNT(*)
+FROM ledger_transactions
+GROUP BY COALESCE(project_id, 0), direction, COALESCE(currency, ''), tx_date
+ON CONFLICT (project_id, direction, currency, day) DO NOTHING;
+
+-- 完成提示
+SELECT '日汇总表创建完成！' AS message;
@@ -0,0 +1,24 @@
+-- 汇率表创建脚本
+-- 在 Supabase Dashboard -> SQL Editor 中执行此脚本
+-- 执行前请确保已执行过 init_supabase.sql
+
+-- 1. 创建汇率表（某天的汇率取该日期及之前最近一次生效的汇率，USDT 固定为 1，不需要录入）
+CREATE TABLE IF NOT EXISTS exchange_rates (
+    id SERIAL PRIMARY KEY,
+    currency VARCHAR(10) NOT NULL,
+    rate_date DATE NOT NULL,
+    rate_to_usdt NUMERIC(18, 8) NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ,
+    CONSTRAINT uq_exchange_rate_currency_date UNIQUE (currency, rate_date)
+);
+
+-- 为 exchange_rates 表添加更新时间触发器
+CREATE TRIGGER update_exchange_rates_updated_at BEFORE UPDATE ON exchange_rates
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+-- 2. 初始汇率示例（1 CNY = 1/7 USDT，与之前固定的 1 USDT = 7 CNY 一致，按需修改生效日期）
+-- INSERT INTO exchange_rates (currency, rate_date, rate_to_usdt) VALUES ('CNY', '2024-01-01', 0.14285714);
+
+-- 完成提示
+SELECT '汇率表创建完成！' AS message;
@@ -0,0 +1,12 @@
+-- 对账记录拆分付款分组字段脚本
+-- 在 Supabase Dashboard -> SQL Editor 中执行此脚本
+-- 执行前请确保已执行过 init_supabase.sql
+
+-- 1. 对账记录增加拆分付款分组ID（一笔财务记录匹配多条投手日报时，这些对账记录共享同一个分组ID）
+ALTER TABLE reconciliation ADD COLUMN IF NOT EXISTS group_id VARCHAR(32);
+
+-- 2. 按分组查询同一笔拆分付款的全部对账记录
+CREATE INDEX IF NOT EXISTS idx_reconciliation_group_id ON reconciliation(group_id);
+
+-- 完成提示
+SELECT '对账记录拆分付款分组字段添加完成！' AS message;
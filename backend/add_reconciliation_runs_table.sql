@@ -0,0 +1,44 @@
+-- 对账运行记录表创建脚本
+-- 在 Supabase Dashboard -> SQL Editor 中执行此脚本
+-- 执行前请确保已执行过 init_supabase.sql
+
+-- 1. 创建对账运行记录表（每次对账一条，记录各阶段耗时和资源统计）
+CREATE TABLE IF NOT EXISTS reconciliation_runs (
+    id SERIAL PRIMARY KEY,
+    trigger VARCHAR(20) NOT NULL,
+    mode VARCHAR(20) NOT NULL,
+    strategy VARCHAR(20),
+    assignment VARCHAR(20),
+    status VARCHAR(20) NOT NULL,
+    error VARCHAR(500),
+    started_at TIMESTAMPTZ NOT NULL,
+    total_ms INTEGER DEFAULT 0,
+    load_spends_ms INTEGER DEFAULT 0,
+    load_ledgers_ms INTEGER DEFAULT 0,
+    match_ms INTEGER DEFAULT 0,
+    flush_ms INTEGER DEFAULT 0,
+    commit_ms INTEGER DEFAULT 0,
+    spends_loaded INTEGER DEFAULT 0,
+    ledgers_loaded INTEGER DEFAULT 0,
+    candidate_pairs INTEGER DEFAULT 0,
+    assignment_split_blocks INTEGER DEFAULT 0,
+    assignment_greedy_blocks INTEGER DEFAULT 0,
+    matched_count INTEGER,
+    unmatched_count INTEGER,
+    deferred_count INTEGER,
+    sql_statement_count INTEGER,
+    peak_rss_kb INTEGER,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- 2. 已创建过该表时补充 optimal 分配的统计字段
+ALTER TABLE reconciliation_runs ADD COLUMN IF NOT EXISTS assignment_split_blocks INTEGER DEFAULT 0;
+ALTER TABLE reconciliation_runs ADD COLUMN IF NOT EXISTS assignment_greedy_blocks INTEGER DEFAULT 0;
+
+-- 为 reconciliation_runs 表创建索引
+CREATE INDEX IF NOT EXISTS idx_reconciliation_runs_started_at ON reconciliation_runs(started_at);
+CREATE INDEX IF NOT EXISTS idx_reconciliation_runs_trigger ON reconciliation_runs(trigger);
+CREATE INDEX IF NOT EXISTS idx_reconciliation_runs_status ON reconciliation_runs(status);
+
+-- 完成提示
+SELECT '对账运行记录表创建完成！' AS message;
@@ -0,0 +1,22 @@
+-- 对账水位线表创建脚本
+-- 在 Supabase Dashboard -> SQL Editor 中执行此脚本
+-- 执行前请确保已执行过 init_supabase.sql
+
+-- 1. 创建对账水位线表（每个项目一条，记录财务记录已参与对账到的时间点）
+CREATE TABLE IF NOT EXISTS reconciliation_watermarks (
+    project_id INTEGER PRIMARY KEY REFERENCES projects(id) ON DELETE CASCADE,
+    ledgers_synced_at TIMESTAMPTZ NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ
+);
+
+-- 2. 对账只加载尚未匹配的支出记录，按项目和交易日期过滤
+CREATE INDEX IF NOT EXISTS idx_ledger_unmatched_expense ON ledger_transactions(project_id, tx_date)
+    WHERE direction = 'expense' AND status IS DISTINCT FROM 'matched';
+
+-- 为 reconciliation_watermarks 表添加更新时间触发器
+CREATE TRIGGER update_reconciliation_watermarks_updated_at BEFORE UPDATE ON reconciliation_watermarks
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+-- 完成提示
+SELECT '对账水位线表创建完成！' AS message;
@@ -0,0 +1,37 @@
+-- 报表缓存表创建脚本
+-- 在 Supabase Dashboard -> SQL Editor 中执行此脚本
+-- 执行前请确保已执行过 init_supabase.sql
+
+-- 1. 创建报表数据版本表（每个月一个计数器，year = 0 且 month = 0 表示项目、投手等与月份无关的数据）
+CREATE TABLE IF NOT EXISTS report_data_versions (
+    id SERIAL PRIMARY KEY,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    CONSTRAINT uq_report_data_version_year_month UNIQUE (year, month)
+);
+
+-- 2. 创建报表快照表（设置 REPORT_SNAPSHOT_ENABLED=true 后使用，多个进程共享诊断报告的生成结果）
+CREATE TABLE IF NOT EXISTS report_snapshots (
+    id SERIAL PRIMARY KEY,
+    report_type VARCHAR(20) NOT NULL,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    format VARCHAR(10) NOT NULL,
+    data_version VARCHAR(100) NOT NULL,
+    payload BYTEA NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ,
+    CONSTRAINT uq_report_snapshot UNIQUE (report_type, year, month, format)
+);
+
+-- 为报表缓存表添加更新时间触发器
+CREATE TRIGGER update_report_data_versions_updated_at BEFORE UPDATE ON report_data_versions
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+CREATE TRIGGER update_report_snapshots_updated_at BEFORE UPDATE ON report_snapshots
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+-- 完成提示
+SELECT '报表缓存表创建完成！' AS message;
@@ -0,0 +1,20 @@
+-- 月度绩效待刷新单元表创建脚本
+-- 在 Supabase Dashboard -> SQL Editor 中执行此脚本
+-- 执行前请确保已执行过 init_supabase.sql
+
+-- 1. 创建待刷新单元表（写入投手日报、财务记录、投手工资时标记，POST /api/reports/monthly/refresh-dirty 刷新后删除）
+CREATE TABLE IF NOT EXISTS report_dirty_cells (
+    id SERIAL PRIMARY KEY,
+    entity_type VARCHAR(20) NOT NULL,
+    entity_id INTEGER NOT NULL,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    marked_at TIMESTAMPTZ DEFAULT NOW(),
+    CONSTRAINT uq_report_dirty_cell UNIQUE (entity_type, entity_id, year, month)
+);
+
+-- 为 report_dirty_cells 表创建索引
+CREATE INDEX IF NOT EXISTS idx_report_dirty_cells_year_month ON report_dirty_cells(year, month);
+
+-- 完成提示
+SELECT '月度绩效待刷新单元表创建完成！' AS message;
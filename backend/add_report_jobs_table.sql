@@ -0,0 +1,36 @@
+-- 报表生成任务表创建脚本
+-- 在 Supabase Dashboard -> SQL Editor 中执行此脚本
+-- 执行前请确保已执行过 init_supabase.sql
+
+-- 1. 创建报表生成任务表（POST /api/reports/monthly 提交后在后台执行，GET /api/reports/jobs/{id} 查询）
+CREATE TABLE IF NOT EXISTS report_jobs (
+    id SERIAL PRIMARY KEY,
+    job_type VARCHAR(20) NOT NULL,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    result TEXT,
+    error VARCHAR(500),
+    worker VARCHAR(100),
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ
+);
+
+-- 2. 已创建过该表时补充执行进程字段
+ALTER TABLE report_jobs ADD COLUMN IF NOT EXISTS worker VARCHAR(100);
+
+-- 为 report_jobs 表创建索引
+CREATE INDEX IF NOT EXISTS idx_report_jobs_status ON report_jobs(status);
+
+-- 同一类型、同一月份同时只有一个未结束的任务（重复提交时返回已有任务）
+CREATE UNIQUE INDEX IF NOT EXISTS uq_report_jobs_active ON report_jobs(job_type, year, month)
+    WHERE status IN ('queued', 'running');
+
+-- 为 report_jobs 表添加更新时间触发器
+CREATE TRIGGER update_report_jobs_updated_at BEFORE UPDATE ON report_jobs
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+-- 完成提示
+SELECT '报表生成任务表创建完成！' AS message;
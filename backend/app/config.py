@@ -21,6 +21,20 @@ class Settings(BaseSettings):
     api_v1_str: str = "/api"
     project_name: str = "广告投手消耗上报系统"
 
+    # 对账配置
+    reconcile_chunk_size: int = 2000  # 分块对账时每块处理的投手日报数
+    reconcile_workers: int = 4  # 并行对账的进程数
+    reconcile_use_copy: bool = False  # PostgreSQL 上是否用 COPY 写入对账结果
+    reconcile_on_insert: bool = True  # 新建投手日报/财务记录后是否在后台增量对账
+    reconcile_split_payments: bool = False  # 一对一匹配后是否尝试拆分付款匹配（一笔财务记录对应多条投手日报），默认关闭，开启后原本 need_review 的记录可能被合并匹配
+    reconcile_lookback_days: int = 30  # 回看窗口：交易日期在此天数内的未匹配财务记录每次都参与对账；设为 0 时不限制（每次加载全部未匹配记录）
+
+    # 报表任务配置
+    report_job_workers: int = 2  # 后台生成报表的线程数（与处理请求的线程池分开）
+    report_job_timeout_minutes: int = 30  # 未结束的任务超过此时间视为已中断（进程重启等），可以重新提交
+    report_cache_size: int = 128  # 进程内缓存的诊断报告数量（按最近使用淘汰）
+    report_snapshot_enabled: bool = False  # 是否把诊断报告快照写入 report_snapshots 表（多个进程共享，需先执行 add_report_cache_tables.sql）
+
     class Config:
         env_file = ".env"
         case_sensitive = False
@@ -0,0 +1,47 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# 当前上下文中正在计数的 SQL 语句计数器
+_current_counter: ContextVar = ContextVar("sql_statement_counter", default=None)
+
+
+class StatementCounter:
+    """SQL 语句计数器，嵌套使用时外层计数器同样会累加"""
+
+    def __init__(self, parent=None):
+        self.count = 0
+        self.parent = parent
+
+    def increment(self):
+        counter = self
+        while counter is not None:
+            counter.count += 1
+            counter = counter.parent
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    """所有引擎执行 SQL 前都会经过这里，只在 count_statements() 范围内计数"""
+    counter = _current_counter.get()
+    if counter is not None:
+        counter.increment()
+
+
+@contextmanager
+def count_statements():
+    """
+    统计代码块内发出的 SQL 语句数量
+
+    用法:
+        with count_statements() as statements:
+            ...
+        print(statements.count)
+    """
+    counter = StatementCounter(parent=_current_counter.get())
+    token = _current_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _current_counter.reset(token)
@@ -0,0 +1,66 @@
+from sqlalchemy import func as sql_func, literal_column, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+# 每条 INSERT ... ON CONFLICT 语句最多写入的行数，保证绑定参数数量不超过上限
+UPSERT_BATCH_ROWS = 1000
+
+
+def _batches(rows: list, size: int):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def upsert_rows(db: Session, model, rows: list, conflict_columns: tuple, accumulate: bool = False) -> tuple:
+    """
+    批量写入或更新（INSERT ... ON CONFLICT (conflict_columns) DO UPDATE，不提交）
+
+    参数:
+        model: ORM 模型，conflict_columns 必须对应表上的唯一约束
+        rows: 列名 -> 值 的字典列表，每行的列相同；冲突时用新值覆盖除 conflict_columns 外的列
+        accumulate: 为 True 时冲突的行把新值累加到已有值上（汇总表的增量维护）
+    表有 updated_at 列时，更新的行同时把 updated_at 设为当前时间。
+    PostgreSQL 上用 RETURNING (xmax = 0) 区分新插入和被更新的行，每批只有一条语句；
+    SQLite 上先用一条查询找出已存在的唯一键，再执行 ON CONFLICT 写入。
+    不经过 ORM，会话中已加载的对应对象不会刷新。
+    返回 (created_count, updated_count)
+    """
+    if not rows:
+        return 0, 0
+
+    table = model.__table__
+    update_columns = [name for name in rows[0] if name not in conflict_columns]
+    is_postgresql = db.get_bind().dialect.name == "postgresql"
+    insert = pg_insert if is_postgresql else sqlite_insert
+
+    created_count = 0
+    updated_count = 0
+    for batch in _batches(rows, UPSERT_BATCH_ROWS):
+        stmt = insert(table).values(batch)
+        if accumulate:
+            set_ = {name: table.c[name] + stmt.excluded[name] for name in update_columns}
+        else:
+            set_ = {name: stmt.excluded[name] for name in update_columns}
+        if "updated_at" in table.c:
+            set_["updated_at"] = sql_func.now()
+        stmt = stmt.on_conflict_do_update(index_elements=list(conflict_columns), set_=set_)
+
+        if is_postgresql:
+            # xmax 为 0 的是本语句新插入的行，被更新的行 xmax 是当前事务 ID
+            inserted_flags = db.execute(
+                stmt.returning(literal_column("xmax = 0").label("inserted"))
+            ).scalars().all()
+            created = sum(1 for inserted in inserted_flags if inserted)
+            created_count += created
+            updated_count += len(inserted_flags) - created
+            continue
+
+        key_columns = [table.c[name] for name in conflict_columns]
+        keys = {tuple(row[name] for name in conflict_columns) for row in batch}
+        existing = db.query(*key_columns).filter(tuple_(*key_columns).in_(sorted(keys))).count()
+        db.execute(stmt)
+        created_count += len(keys) - existing
+        updated_count += existing
+
+    return created_count, updated_count
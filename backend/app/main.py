@@ -1,11 +1,37 @@
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.routers import ad_spend, ledger, reconciliation, analytics, channels, projects, operators
+from app.services.report_job_service import fail_orphaned_jobs, resume_queued_jobs
+
+logger = logging.getLogger(__name__)
+
+
+def resume_report_jobs() -> None:
+    """
+    处理上次进程退出前遗留的报表任务：本机已退出的进程执行到一半的任务标记为失败，
+    已提交、尚未开始的任务继续执行（数据库暂时不可用或尚未建表时记录错误日志，不影响启动）
+    """
+    try:
+        failed = fail_orphaned_jobs()
+        resumed = resume_queued_jobs()
+        logger.info("报表任务：%d 个中断的任务已标记失败，%d 个排队的任务继续执行", failed, resumed)
+    except Exception:
+        logger.exception("启动时处理遗留的报表任务失败")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    resume_report_jobs()
+    yield
+
 
 app = FastAPI(
     title="广告投手消耗上报系统",
     description="广告投手消耗上报 + 财务收支录入 + 自动对账 + 月度分析系统",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # 配置 CORS
@@ -2,10 +2,14 @@ from app.models.project import Project
 from app.models.operator import Operator
 from app.models.spend_report import AdSpendDaily
 from app.models.finance_ledger import LedgerTransaction
-from app.models.reconciliation import Reconciliation
+from app.models.reconciliation import Reconciliation, ReconciliationRun, ReconciliationWatermark
 from app.models.operator_salary import OperatorSalary
-from app.models.monthly_reports import MonthlyProjectPerformance, MonthlyOperatorPerformance
+from app.models.monthly_reports import MonthlyProjectPerformance, MonthlyOperatorPerformance, ReportDirtyCell
 from app.models.channel import Channel, MonthlyChannelPerformance
+from app.models.daily_rollup import DailySpendRollup, DailyLedgerRollup
+from app.models.exchange_rate import ExchangeRate
+from app.models.report_job import ReportJob
+from app.models.report_cache import ReportDataVersion, ReportSnapshot
 
 __all__ = [
     "Project",
@@ -13,10 +17,19 @@ __all__ = [
     "AdSpendDaily",
     "LedgerTransaction",
     "Reconciliation",
+    "ReconciliationRun",
+    "ReconciliationWatermark",
     "OperatorSalary",
     "MonthlyProjectPerformance",
     "MonthlyOperatorPerformance",
+    "ReportDirtyCell",
     "Channel",
     "MonthlyChannelPerformance",
+    "DailySpendRollup",
+    "DailyLedgerRollup",
+    "ExchangeRate",
+    "ReportJob",
+    "ReportDataVersion",
+    "ReportSnapshot",
 ]
 
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Numeric, Date, DateTime, ForeignKey, Table
+from sqlalchemy import Column, Integer, String, Numeric, Date, DateTime, ForeignKey, Table, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db.base import Base
@@ -45,10 +45,16 @@ class MonthlyChannelPerformance(Base):
     channel_id = Column(Integer, ForeignKey("channels.id", ondelete="CASCADE"), nullable=False, index=True, comment="渠道ID")
     month = Column(Date, nullable=False, index=True, comment="月份（日期格式，如2024-11-01）")
     total_spend = Column(Numeric(15, 2), default=0, comment="总消耗")
-    active_accounts = Column(Integer, default=0, comment="活跃账户数")
+    active_accounts = Column(Integer, default=0, comment="活跃账户数（有消耗的投手数）")
+    record_count = Column(Integer, nullable=False, default=0, comment="投手日报记录数")
     created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
     updated_at = Column(DateTime(timezone=True), onupdate=func.now(), comment="更新时间")
 
     # 关系
     channel = relationship("Channel", back_populates="monthly_performances")
 
+    # 唯一约束：每个渠道每月只有一条记录（与 add_channels_tables.sql 中的 UNIQUE(channel_id, month) 一致）
+    __table_args__ = (
+        UniqueConstraint('channel_id', 'month', name='monthly_channel_performance_channel_id_month_key'),
+    )
+
@@ -0,0 +1,43 @@
+from sqlalchemy import Column, Integer, String, Numeric, Date, DateTime, UniqueConstraint
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+
+class DailySpendRollup(Base):
+    """投手日报日汇总表（写入投手日报、变更状态时增量维护，月度报表从这里汇总）"""
+    __tablename__ = "daily_spend_rollup"
+
+    id = Column(Integer, primary_key=True, index=True, comment="ID")
+    project_id = Column(Integer, nullable=False, comment="项目ID")
+    operator_id = Column(Integer, nullable=False, index=True, comment="投手ID")
+    channel_id = Column(Integer, nullable=False, index=True, comment="渠道ID")
+    day = Column(Date, nullable=False, index=True, comment="消耗日期")
+    status = Column(String(20), nullable=False, comment="投手日报状态（空状态记为空字符串）")
+    amount_usdt = Column(Numeric(15, 2), nullable=False, default=0, comment="消耗金额合计(USDT)")
+    record_count = Column(Integer, nullable=False, default=0, comment="投手日报条数")
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), comment="更新时间")
+
+    # 唯一约束：每个项目/投手/渠道/日期/状态一条汇总
+    __table_args__ = (
+        UniqueConstraint('project_id', 'operator_id', 'channel_id', 'day', 'status', name='uq_daily_spend_rollup'),
+    )
+
+
+class DailyLedgerRollup(Base):
+    """财务收支日汇总表（写入财务记录时增量维护，月度报表和诊断报告从这里汇总）"""
+    __tablename__ = "daily_ledger_rollup"
+
+    id = Column(Integer, primary_key=True, index=True, comment="ID")
+    project_id = Column(Integer, nullable=False, comment="项目ID（0 表示未关联项目）")
+    direction = Column(String(20), nullable=False, comment="方向：income/expense")
+    currency = Column(String(10), nullable=False, comment="币种（空币种记为空字符串）")
+    day = Column(Date, nullable=False, index=True, comment="交易日期")
+    amount = Column(Numeric(15, 2), nullable=False, default=0, comment="金额合计")
+    fee_amount = Column(Numeric(15, 2), nullable=False, default=0, comment="手续费合计")
+    record_count = Column(Integer, nullable=False, default=0, comment="财务记录条数")
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), comment="更新时间")
+
+    # 唯一约束：每个项目/方向/币种/日期一条汇总
+    __table_args__ = (
+        UniqueConstraint('project_id', 'direction', 'currency', 'day', name='uq_daily_ledger_rollup'),
+    )
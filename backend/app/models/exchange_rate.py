@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, String, Numeric, Date, DateTime, UniqueConstraint
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+
+class ExchangeRate(Base):
+    """汇率表（按生效日期记录，某天的汇率取该日期及之前最近一次生效的汇率）"""
+    __tablename__ = "exchange_rates"
+
+    id = Column(Integer, primary_key=True, index=True, comment="ID")
+    currency = Column(String(10), nullable=False, comment="币种，如 CNY")
+    rate_date = Column(Date, nullable=False, comment="生效日期")
+    rate_to_usdt = Column(Numeric(18, 8), nullable=False, comment="1 单位该币种折合的 USDT")
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), comment="更新时间")
+
+    # 唯一约束：每个币种每个生效日期一条汇率
+    __table_args__ = (
+        UniqueConstraint('currency', 'rate_date', name='uq_exchange_rate_currency_date'),
+    )
@@ -54,4 +54,18 @@ class MonthlyOperatorPerformance(Base):
     operator = relationship("Operator", backref="monthly_performances")
 
 
+class ReportDirtyCell(Base):
+    """月度报表待刷新单元（投手日报、财务记录、投手工资变动后标记，刷新后删除）"""
+    __tablename__ = "report_dirty_cells"
 
+    id = Column(Integer, primary_key=True, index=True, comment="ID")
+    entity_type = Column(String(20), nullable=False, comment="绩效类型：project/operator/channel")
+    entity_id = Column(Integer, nullable=False, comment="项目ID、投手ID或渠道ID")
+    year = Column(Integer, nullable=False, comment="年份")
+    month = Column(Integer, nullable=False, comment="月份")
+    marked_at = Column(DateTime(timezone=True), server_default=func.now(), comment="首次标记时间（再次标记同一单元时不更新）")
+
+    # 唯一约束：同一绩效单元只记录一次
+    __table_args__ = (
+        UniqueConstraint('entity_type', 'entity_id', 'year', 'month', name='uq_report_dirty_cell'),
+    )
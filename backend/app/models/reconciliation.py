@@ -16,6 +16,7 @@ class Reconciliation(Base):
     match_score = Column(Numeric(5, 2), comment="匹配度(0-100)")
     status = Column(String(20), default="matched", comment="状态：matched/unmatched/manual")
     reason = Column(String(500), comment="对账原因/备注")
+    group_id = Column(String(32), index=True, comment="拆分付款分组ID（一笔财务记录匹配多条投手日报时共享）")
     created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
 
     # 关系
@@ -24,3 +25,44 @@ class Reconciliation(Base):
 
 
 
+
+
+class ReconciliationRun(Base):
+    """对账运行记录表（每次对账的阶段耗时和资源统计）"""
+    __tablename__ = "reconciliation_runs"
+
+    id = Column(Integer, primary_key=True, index=True, comment="ID")
+    trigger = Column(String(20), nullable=False, index=True, comment="触发方式：api/insert")
+    mode = Column(String(20), nullable=False, comment="执行方式：batch/streaming/parallel/incremental")
+    strategy = Column(String(20), comment="执行策略：python/sql")
+    assignment = Column(String(20), comment="分配方式：greedy/optimal")
+    status = Column(String(20), nullable=False, index=True, comment="状态：success/failed")
+    error = Column(String(500), comment="失败原因")
+    started_at = Column(DateTime(timezone=True), nullable=False, index=True, comment="开始时间")
+    total_ms = Column(Integer, default=0, comment="总耗时(毫秒)")
+    load_spends_ms = Column(Integer, default=0, comment="加载投手日报耗时(毫秒)")
+    load_ledgers_ms = Column(Integer, default=0, comment="加载财务记录耗时(毫秒)")
+    match_ms = Column(Integer, default=0, comment="匹配耗时(毫秒)")
+    flush_ms = Column(Integer, default=0, comment="写入对账结果耗时(毫秒)")
+    commit_ms = Column(Integer, default=0, comment="提交耗时(毫秒)")
+    spends_loaded = Column(Integer, default=0, comment="加载的投手日报数")
+    ledgers_loaded = Column(Integer, default=0, comment="加载的财务记录数")
+    candidate_pairs = Column(Integer, default=0, comment="检查过的候选对数量")
+    assignment_split_blocks = Column(Integer, default=0, comment="optimal 分配时超过上限、按日期窗口切分求解的连通块数")
+    assignment_greedy_blocks = Column(Integer, default=0, comment="optimal 分配时退回贪心匹配的连通块或窗口数")
+    matched_count = Column(Integer, comment="匹配成功数量")
+    unmatched_count = Column(Integer, comment="匹配失败数量")
+    deferred_count = Column(Integer, comment="推迟到下次处理的数量")
+    sql_statement_count = Column(Integer, comment="SQL 语句数")
+    peak_rss_kb = Column(Integer, comment="本次对账期间的进程内存峰值(KB)，并行对账时取各进程中最大的一个；无法单独统计时为空")
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
+
+
+class ReconciliationWatermark(Base):
+    """对账水位线表（每个项目一条）"""
+    __tablename__ = "reconciliation_watermarks"
+
+    project_id = Column(Integer, ForeignKey("projects.id"), primary_key=True, comment="项目ID")
+    ledgers_synced_at = Column(DateTime(timezone=True), nullable=False, comment="财务记录水位线：此前新建或修改的记录都已参与过对账")
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), comment="更新时间")
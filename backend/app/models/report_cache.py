@@ -0,0 +1,39 @@
+from sqlalchemy import Column, Integer, BigInteger, String, LargeBinary, DateTime, UniqueConstraint
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+
+class ReportDataVersion(Base):
+    """报表数据版本表（每个月一个计数器，该月的月度绩效重新生成或刷新时加 1）"""
+    __tablename__ = "report_data_versions"
+
+    id = Column(Integer, primary_key=True, index=True, comment="ID")
+    year = Column(Integer, nullable=False, comment="年份（0 表示与月份无关的数据，如项目、投手信息）")
+    month = Column(Integer, nullable=False, comment="月份（0 表示与月份无关的数据）")
+    version = Column(BigInteger, nullable=False, default=0, comment="数据版本")
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), comment="更新时间")
+
+    # 唯一约束：每个月份一条
+    __table_args__ = (
+        UniqueConstraint('year', 'month', name='uq_report_data_version_year_month'),
+    )
+
+
+class ReportSnapshot(Base):
+    """报表快照表（诊断报告等的生成结果，zlib 压缩的 JSON，数据版本一致时直接返回）"""
+    __tablename__ = "report_snapshots"
+
+    id = Column(Integer, primary_key=True, index=True, comment="ID")
+    report_type = Column(String(20), nullable=False, comment="报表类型：diagnostic")
+    year = Column(Integer, nullable=False, comment="年份")
+    month = Column(Integer, nullable=False, comment="月份")
+    format = Column(String(10), nullable=False, comment="返回格式：json/text")
+    data_version = Column(String(100), nullable=False, comment="生成时的数据版本")
+    payload = Column(LargeBinary, nullable=False, comment="生成结果（zlib 压缩的 JSON）")
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), comment="更新时间")
+
+    # 唯一约束：每种报表、每个月份、每种格式一条
+    __table_args__ = (
+        UniqueConstraint('report_type', 'year', 'month', 'format', name='uq_report_snapshot'),
+    )
@@ -0,0 +1,35 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, Index, text
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+# 未结束的任务状态（同一报表同时只能有一个）
+ACTIVE_JOB_STATUSES = ("queued", "running")
+
+
+class ReportJob(Base):
+    """报表生成任务表（后台执行，通过任务 ID 查询状态和结果）"""
+    __tablename__ = "report_jobs"
+
+    id = Column(Integer, primary_key=True, index=True, comment="ID")
+    job_type = Column(String(20), nullable=False, comment="任务类型：monthly")
+    year = Column(Integer, nullable=False, comment="年份")
+    month = Column(Integer, nullable=False, comment="月份")
+    status = Column(String(20), nullable=False, default="queued", index=True, comment="状态：queued/running/success/failed")
+    result = Column(Text, comment="生成结果（JSON）")
+    error = Column(String(500), comment="失败原因")
+    worker = Column(String(100), comment="执行任务的进程（主机名:进程号），启动时据此找出本机已退出的进程遗留的任务")
+    started_at = Column(DateTime(timezone=True), comment="开始执行时间")
+    finished_at = Column(DateTime(timezone=True), comment="结束时间")
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="提交时间")
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), comment="更新时间")
+
+    # 部分唯一索引：同一类型、同一月份同时只有一个未结束的任务（重复提交时返回已有任务）
+    __table_args__ = (
+        Index(
+            "uq_report_jobs_active",
+            "job_type", "year", "month",
+            unique=True,
+            postgresql_where=text("status IN ('queued', 'running')"),
+            sqlite_where=text("status IN ('queued', 'running')")
+        ),
+    )
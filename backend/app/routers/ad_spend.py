@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
 from typing import Optional
 from datetime import date
+from app.config import settings
 from app.db.session import get_db
+from app.services.daily_rollup_service import add_spends_to_rollup
+from app.services.reconciliation_incremental import reconcile_new_spend
 from app.models.spend_report import AdSpendDaily
 from app.schemas.spend_report import (
     AdSpendCreate,
@@ -82,6 +85,7 @@ def get_ad_spend(
 @router.post("", response_model=dict)
 def create_ad_spend(
     spend_data: AdSpendCreate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """创建投手消耗上报"""
@@ -146,9 +150,14 @@ def create_ad_spend(
         )
 
         db.add(new_spend)
+        add_spends_to_rollup(db, [new_spend])
         db.commit()
         db.refresh(new_spend)
 
+        # 响应返回后在后台尝试增量对账
+        if settings.reconcile_on_insert:
+            background_tasks.add_task(reconcile_new_spend, new_spend.id)
+
         # 构建响应
         response_data = AdSpendResponse(
             id=new_spend.id,
@@ -1,11 +1,15 @@
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
 from app.db.session import get_db
-from app.services.monthly_report_service import generate_monthly_report
-from app.services.diagnostic_report_service import generate_diagnostic_report
-from app.services.diagnostic_report_formatter import format_diagnostic_report
+from app.services.monthly_report_service import (
+    generate_monthly_report_range,
+    refresh_dirty_cells
+)
+from app.services.report_job_service import get_report_job, job_to_dict, submit_monthly_report_job
+from app.services.report_cache_service import get_diagnostic_report as get_cached_diagnostic_report
 from app.schemas.analytics import (
     MonthlyReportRequest,
+    MonthlyReportRangeRequest,
     MonthlyReportApiResponse,
     DiagnosticReportApiResponse
 )
@@ -19,23 +23,123 @@ def create_monthly_report(
     db: Session = Depends(get_db)
 ):
     """
-    生成月度汇总报表
-    
+    提交月度汇总报表生成任务，立即返回任务信息，通过 GET /reports/jobs/{job_id} 查询状态和结果
+
+    报表在后台线程池中生成，不占用处理请求的线程和数据库连接；
+    同一月份已有未结束的任务时返回该任务（meta.deduplicated 为 true），不重复生成。
+
     汇总本月所有 matched 的 ad_spend_daily → 得到每个项目、每个投手的广告消耗(USDT)
-    汇总本月所有收入类的 ledger_transactions → 得到每个项目的收入(USDT)
+    汇总本月所有收入类的 ledger_transactions → 得到每个项目的收入(非 USDT 按 exchange_rates 当天汇率折算为 USDT)
     查询本月投手工资/提成表 → 得到每个投手的人力成本(CNY)
-    按照 1USDT=7CNY 折算，生成两张表：monthly_project_performance 和 monthly_operator_performance
+    按月末生效的 CNY 汇率折算（未录入时 1USDT=7CNY），生成两张表：monthly_project_performance 和 monthly_operator_performance
     """
     try:
-        result = generate_monthly_report(db, request.year, request.month)
+        job, created = submit_monthly_report_job(db, request.year, request.month)
 
         return {
-            "data": result,
+            "data": job_to_dict(job),
             "error": None,
             "meta": {
-                "message": f"{request.year}年{request.month}月报表生成成功",
+                "message": (
+                    f"{request.year}年{request.month}月报表生成任务已提交" if created
+                    else f"{request.year}年{request.month}月报表已有未完成的生成任务"
+                ),
                 "year": request.year,
-                "month": request.month
+                "month": request.month,
+                "job_id": job.id,
+                "deduplicated": not created
+            }
+        }
+    except Exception as e:
+        return {
+            "data": None,
+            "error": str(e),
+            "meta": None
+        }
+
+
+@router.get("/jobs/{job_id}", response_model=dict)
+def get_report_job_status(
+    job_id: int,
+    db: Session = Depends(get_db)
+):
+    """
+    查询报表生成任务的状态和结果
+
+    status: queued（排队中）/ running（生成中）/ success（result 为生成结果）/ failed（error 为失败原因）
+    """
+    try:
+        job = get_report_job(db, job_id)
+        if not job:
+            return {
+                "data": None,
+                "error": f"任务ID {job_id} 不存在",
+                "meta": None
+            }
+
+        return {
+            "data": job_to_dict(job),
+            "error": None,
+            "meta": {
+                "status": job.status
+            }
+        }
+    except Exception as e:
+        return {
+            "data": None,
+            "error": str(e),
+            "meta": None
+        }
+
+
+@router.post("/monthly/range", response_model=dict)
+def create_monthly_report_range(
+    request: MonthlyReportRangeRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    批量生成连续多个月的月度汇总报表（例如 start=2025-01, end=2025-12）
+
+    整个范围的投手日报、财务记录各汇总一次（按月份分组），所有月份的绩效在同一事务中批量写入。
+    """
+    try:
+        start_year, start_month = (int(part) for part in request.start.split("-"))
+        end_year, end_month = (int(part) for part in request.end.split("-"))
+        result = generate_monthly_report_range(db, start_year, start_month, end_year, end_month)
+
+        return {
+            "data": result,
+            "error": None,
+            "meta": {
+                "message": f"{request.start} 至 {request.end} 共 {len(result['months'])} 个月报表生成成功",
+                "start": request.start,
+                "end": request.end
+            }
+        }
+    except Exception as e:
+        return {
+            "data": None,
+            "error": str(e),
+            "meta": None
+        }
+
+
+@router.post("/monthly/refresh-dirty", response_model=dict)
+def refresh_dirty_monthly_report(db: Session = Depends(get_db)):
+    """
+    只刷新有变动的月度绩效
+
+    投手日报、财务记录、投手工资写入或修改后，会标记受影响的 (月份, 项目/投手)。
+    这里只重新计算这些项目和投手在对应月份的绩效，其余绩效行不变。
+    """
+    try:
+        result = refresh_dirty_cells(db)
+
+        return {
+            "data": result,
+            "error": None,
+            "meta": {
+                "message": f"已刷新 {result['dirty_cell_count']} 个绩效单元"
             }
         }
     except Exception as e:
@@ -65,34 +169,26 @@ def get_diagnostic_report(
     
     参数：
     - format: json 返回结构化数据，text 返回格式化文本报告
+
+    结果按 (年, 月, 格式) 缓存，本月、上月的月度绩效重新生成、刷新或项目、投手信息变化后失效；
+    本月、上月有待刷新单元时（见 POST /monthly/refresh-dirty）每次重新生成，不使用缓存。
+    meta 中返回缓存是否命中（cache、cache_tier）、是否有待刷新单元（dirty）和命中统计（cache_stats）。
     """
     try:
-        result = generate_diagnostic_report(db, year, month)
+        report_format = "text" if format == "text" else "json"
+        data, cache_meta = get_cached_diagnostic_report(db, year, month, report_format)
 
-        if format == "text":
-            from app.services.diagnostic_report_formatter import format_diagnostic_report
-            formatted_text = format_diagnostic_report(result)
-            return {
-                "data": {"report_text": formatted_text},
-                "error": None,
-                "meta": {
-                    "message": f"{year}年{month}月诊断报告生成成功",
-                    "year": year,
-                    "month": month,
-                    "format": "text"
-                }
-            }
-        else:
-            return {
-                "data": result,
-                "error": None,
-                "meta": {
-                    "message": f"{year}年{month}月诊断报告生成成功",
-                    "year": year,
-                    "month": month,
-                    "format": "json"
-                }
+        return {
+            "data": data,
+            "error": None,
+            "meta": {
+                "message": f"{year}年{month}月诊断报告生成成功",
+                "year": year,
+                "month": month,
+                "format": report_format,
+                **cache_meta
             }
+        }
     except Exception as e:
         return {
             "data": None,
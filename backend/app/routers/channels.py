@@ -6,6 +6,7 @@ from datetime import date
 from app.db.session import get_db
 from app.models.channel import Channel, MonthlyChannelPerformance, project_channels
 from app.models.project import Project
+from app.services.channel_stats_service import get_channel_spend_stats
 from app.schemas.channel import (
     ChannelCreate,
     ChannelUpdate,
@@ -63,6 +64,30 @@ def get_channels(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/stats", response_model=dict)
+def get_channel_stats(
+    start_date: Optional[date] = Query(None, description="开始日期"),
+    end_date: Optional[date] = Query(None, description="结束日期"),
+    channel_id: Optional[int] = Query(None, description="渠道ID（可选）"),
+    db: Session = Depends(get_db)
+):
+    """
+    获取渠道统计数据
+
+    完整月份读月度渠道绩效表（生成月度报表时写入），首尾不满一个月的部分从日汇总表汇总
+    """
+    try:
+        data = get_channel_spend_stats(db, start_date, end_date, channel_id)
+
+        return {
+            "data": data,
+            "error": None,
+            "meta": {"count": len(data)}
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/{channel_id}", response_model=dict)
 def get_channel(
     channel_id: int,
@@ -367,49 +392,3 @@ def get_project_channels(
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-
-
-@router.get("/stats", response_model=dict)
-def get_channel_stats(
-    start_date: Optional[date] = Query(None, description="开始日期"),
-    end_date: Optional[date] = Query(None, description="结束日期"),
-    channel_id: Optional[int] = Query(None, description="渠道ID（可选）"),
-    db: Session = Depends(get_db)
-):
-    """获取渠道统计数据"""
-    try:
-        from app.models.spend_report import AdSpendDaily
-        from sqlalchemy import func
-
-        query = db.query(
-            AdSpendDaily.channel_id,
-            func.sum(AdSpendDaily.amount_usdt).label("total_spend"),
-            func.count(AdSpendDaily.id).label("record_count")
-        ).filter(AdSpendDaily.channel_id.isnot(None))
-
-        if channel_id:
-            query = query.filter(AdSpendDaily.channel_id == channel_id)
-        if start_date:
-            query = query.filter(AdSpendDaily.spend_date >= start_date)
-        if end_date:
-            query = query.filter(AdSpendDaily.spend_date <= end_date)
-
-        results = query.group_by(AdSpendDaily.channel_id).all()
-
-        data = [
-            {
-                "channel_id": result.channel_id,
-                "total_spend": float(result.total_spend or 0),
-                "record_count": result.record_count
-            }
-            for result in results
-        ]
-
-        return {
-            "data": data,
-            "error": None,
-            "meta": {"count": len(data)}
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
 from typing import Optional
 from datetime import date
+from app.config import settings
 from app.db.session import get_db
+from app.services.daily_rollup_service import add_ledgers_to_rollup
+from app.services.reconciliation_incremental import reconcile_new_ledger
 from app.models.finance_ledger import LedgerTransaction
 from app.schemas.finance_ledger import (
     LedgerTransactionCreate,
@@ -83,6 +86,7 @@ def get_ledger(
 @router.post("", response_model=dict)
 def create_ledger(
     ledger_data: LedgerTransactionCreate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """创建财务收支记录"""
@@ -132,9 +136,14 @@ def create_ledger(
         )
 
         db.add(new_ledger)
+        add_ledgers_to_rollup(db, [new_ledger])
         db.commit()
         db.refresh(new_ledger)
 
+        # 响应返回后在后台尝试增量对账
+        if settings.reconcile_on_insert:
+            background_tasks.add_task(reconcile_new_ledger, new_ledger.id)
+
         # 构建响应
         response_data = LedgerTransactionResponse(
             id=new_ledger.id,
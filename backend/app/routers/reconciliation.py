@@ -3,16 +3,20 @@ from sqlalchemy.orm import Session
 from sqlalchemy import desc
 from typing import Optional
 from app.db.session import get_db
-from app.models.reconciliation import Reconciliation
+from app.models.reconciliation import Reconciliation, ReconciliationRun
 from app.models.spend_report import AdSpendDaily
 from app.models.finance_ledger import LedgerTransaction
 from app.models.operator import Operator
 from app.models.project import Project
-from app.services.reconciliation_service import run_reconciliation
+from app.config import settings
+from app.services.reconciliation_service import run_reconciliation, ReconciliationChunkError
+from app.services.reconciliation_incremental import invalidate_candidate_cache
+from app.services.reconciliation_writer import update_statuses
 from app.schemas.reconciliation import (
     ReconciliationRunResponse,
     ReconciliationListResponse,
     ReconciliationDetailResponse,
+    ReconciliationRunDetail,
     ReconciliationUpdate
 )
 
@@ -20,16 +24,37 @@ router = APIRouter(prefix="/reconcile", tags=["对账"])
 
 
 @router.post("/run", response_model=dict)
-def run_reconcile(db: Session = Depends(get_db)):
+def run_reconcile(
+    strategy: str = Query("python", description="执行策略：python（内存匹配）或 sql（数据库端生成候选对）"),
+    assignment: str = Query("greedy", description="分配方式：greedy（逐条贪心）或 optimal（全局最优分配）"),
+    streaming: bool = Query(False, description="是否分块流式对账（每块单独提交）"),
+    chunk_size: Optional[int] = Query(None, ge=1, le=100000, description="分块大小，默认取配置 reconcile_chunk_size"),
+    resume_after: Optional[str] = Query(None, description="分块对账断点（project_id:spend_date:id），从该位置之后继续"),
+    parallel: bool = Query(False, description="是否按项目分片多进程并行对账（进程数取配置 reconcile_workers）"),
+    db: Session = Depends(get_db)
+):
     """
     手动触发对账
     
     从 ad_spend_daily 里取出状态为 pending 的记录
-    从 ledger_transactions 里取出最近7天内、方向为支出的记录
-    进行匹配并生成对账结果
+    从 ledger_transactions 里取出这些项目尚未匹配的支出记录：回看窗口（reconcile_lookback_days）内的记录、
+    项目水位线之后新建或修改过的记录，以及迟报投手日报日期附近的记录（回看窗口设为 0 时不限制）
+    进行匹配并生成对账结果，每次执行都会写入一条运行记录（见 GET /reconcile/runs）
+
+    可在多个 worker / 实例上同时执行：各自按项目认领记录（FOR NO KEY UPDATE SKIP LOCKED），
+    不会重复匹配；同时执行时建议使用分块对账，各 worker 交替认领项目。
     """
     try:
-        result = run_reconciliation(db)
+        if streaming or chunk_size or resume_after:
+            chunk_size = chunk_size or settings.reconcile_chunk_size
+        result = run_reconciliation(
+            db,
+            strategy=strategy,
+            assignment=assignment,
+            chunk_size=chunk_size,
+            resume_after=resume_after,
+            workers=settings.reconcile_workers if parallel else None
+        )
 
         return {
             "data": result,
@@ -39,6 +64,13 @@ def run_reconcile(db: Session = Depends(get_db)):
                 "success_rate": f"{(result['matched_count'] / result['total_processed'] * 100):.2f}%" if result['total_processed'] > 0 else "0%"
             }
         }
+    except ReconciliationChunkError as e:
+        # 已提交的分块不会回滚，可从断点继续
+        return {
+            "data": None,
+            "error": str(e),
+            "meta": {"resume_after": e.watermark}
+        }
     except Exception as e:
         return {
             "data": None,
@@ -108,6 +140,7 @@ def get_reconciliations(
                 match_score=record.match_score,
                 status=record.status,
                 reason=record.reason,
+                group_id=record.group_id,
                 created_at=record.created_at.isoformat() if record.created_at else None,
                 ad_spend=ad_spend_info,
                 ledger_transaction=ledger_info
@@ -127,6 +160,53 @@ def get_reconciliations(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/runs", response_model=dict)
+def get_reconciliation_runs(
+    skip: int = Query(0, ge=0, description="跳过记录数"),
+    limit: int = Query(50, ge=1, le=500, description="返回记录数"),
+    trigger: Optional[str] = Query(None, description="触发方式筛选：api/insert"),
+    status: Optional[str] = Query(None, description="状态筛选：success/failed"),
+    db: Session = Depends(get_db)
+):
+    """获取对账运行记录（各阶段耗时、加载行数、候选对数量、SQL 语句数、内存峰值），按开始时间倒序"""
+    try:
+        query = db.query(ReconciliationRun)
+        if trigger:
+            query = query.filter(ReconciliationRun.trigger == trigger)
+        if status:
+            query = query.filter(ReconciliationRun.status == status)
+
+        total = query.count()
+        runs = query.order_by(
+            desc(ReconciliationRun.started_at), desc(ReconciliationRun.id)
+        ).offset(skip).limit(limit).all()
+
+        data = [
+            ReconciliationRunDetail.model_validate({
+                **{column.name: getattr(run, column.name) for column in ReconciliationRun.__table__.columns},
+                "started_at": run.started_at.isoformat() if run.started_at else None,
+            }).model_dump()
+            for run in runs
+        ]
+
+        return {
+            "data": data,
+            "error": None,
+            "meta": {
+                "total": total,
+                "skip": skip,
+                "limit": limit,
+                "has_more": (skip + limit) < total
+            }
+        }
+    except Exception as e:
+        return {
+            "data": None,
+            "error": str(e),
+            "meta": None
+        }
+
+
 @router.patch("/{reconciliation_id}", response_model=dict)
 def update_reconciliation(
     reconciliation_id: int,
@@ -152,22 +232,12 @@ def update_reconciliation(
 
         # 如果状态改为 matched，同时更新关联记录的状态
         if update_data.status == "matched":
-            # 更新投手日报状态
-            ad_spend = db.query(AdSpendDaily).filter(
-                AdSpendDaily.id == reconciliation.ad_spend_id
-            ).first()
-            if ad_spend:
-                ad_spend.status = "matched"
-
-            # 更新财务记录状态
-            ledger = db.query(LedgerTransaction).filter(
-                LedgerTransaction.id == reconciliation.ledger_id
-            ).first()
-            if ledger:
-                ledger.status = "matched"
+            update_statuses(db, AdSpendDaily, {"matched": [reconciliation.ad_spend_id]})
+            update_statuses(db, LedgerTransaction, {"matched": [reconciliation.ledger_id]})
 
         db.commit()
         db.refresh(reconciliation)
+        invalidate_candidate_cache()
 
         return {
             "data": {
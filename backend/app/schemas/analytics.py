@@ -9,6 +9,12 @@ class MonthlyReportRequest(BaseModel):
     month: int = Field(..., ge=1, le=12, description="月份")
 
 
+class MonthlyReportRangeRequest(BaseModel):
+    """批量生成月度报表请求（含开始、结束月份）"""
+    start: str = Field(..., pattern=r"^\d{4}-(0[1-9]|1[0-2])$", description="开始月份 YYYY-MM")
+    end: str = Field(..., pattern=r"^\d{4}-(0[1-9]|1[0-2])$", description="结束月份 YYYY-MM")
+
+
 class MonthlyReportSummary(BaseModel):
     """月度报表汇总"""
     total_spend_usdt: float
@@ -29,6 +35,9 @@ class MonthlyReportResponse(BaseModel):
     project_performance_updated: int
     operator_performance_created: int
     operator_performance_updated: int
+    channel_performance_created: Optional[int] = None
+    channel_performance_updated: Optional[int] = None
+    channel_spend_usdt: Optional[dict] = None  # 各渠道的消耗(USDT)：{channel_id: 消耗}
     summary: MonthlyReportSummary
 
     class Config:
@@ -9,7 +9,8 @@ class ReconciliationResponse(BaseModel):
     matched_count: int
     unmatched_count: int
     total_processed: int
-    processed_spend_ids: list[int]
+    processed_spend_ids: Optional[list[int]] = None  # 分块对账只返回数量
+    sql_statement_count: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -32,6 +33,7 @@ class ReconciliationDetailResponse(BaseModel):
     match_score: Optional[Decimal]
     status: str
     reason: Optional[str]
+    group_id: Optional[str] = None  # 拆分付款分组ID，同组的投手日报合计匹配同一笔财务记录
     created_at: str
     # 关联的投手日报信息
     ad_spend: Optional[dict] = None
@@ -55,3 +57,34 @@ class ReconciliationUpdate(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class ReconciliationRunDetail(BaseModel):
+    """对账运行记录（各阶段耗时单位为毫秒）"""
+    id: int
+    trigger: str
+    mode: str
+    strategy: Optional[str]
+    assignment: Optional[str]
+    status: str
+    error: Optional[str]
+    started_at: str
+    total_ms: int
+    load_spends_ms: int
+    load_ledgers_ms: int
+    match_ms: int
+    flush_ms: int
+    commit_ms: int
+    spends_loaded: int
+    ledgers_loaded: int
+    candidate_pairs: int
+    assignment_split_blocks: Optional[int]
+    assignment_greedy_blocks: Optional[int]
+    matched_count: Optional[int]
+    unmatched_count: Optional[int]
+    deferred_count: Optional[int]
+    sql_statement_count: Optional[int]
+    peak_rss_kb: Optional[int]
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,130 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Optional
+from sqlalchemy import and_, func as sql_func, or_, tuple_
+from sqlalchemy.orm import Session
+from app.models.channel import MonthlyChannelPerformance
+from app.models.daily_rollup import DailySpendRollup
+from app.models.monthly_reports import ReportDirtyCell
+from app.services.report_dirty_service import CHANNEL_CELL
+
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _next_month(day: date) -> date:
+    if day.month == 12:
+        return date(day.year + 1, 1, 1)
+    return date(day.year, day.month + 1, 1)
+
+
+def _dirty_channel_months(db: Session, whole_start: Optional[date], whole_end: Optional[date], channel_id: Optional[int]) -> dict:
+    """整月范围内被标记待刷新的渠道月份：{月份第一天: {channel_id}}"""
+    query = db.query(ReportDirtyCell.entity_id, ReportDirtyCell.year, ReportDirtyCell.month).filter(
+        ReportDirtyCell.entity_type == CHANNEL_CELL
+    )
+    if channel_id:
+        query = query.filter(ReportDirtyCell.entity_id == channel_id)
+
+    dirty = defaultdict(set)
+    for cell in query.all():
+        month = date(cell.year, cell.month, 1)
+        if (whole_start is None or month >= whole_start) and (whole_end is None or month < whole_end):
+            dirty[month].add(cell.entity_id)
+    return dict(dirty)
+
+
+def get_channel_spend_stats(
+    db: Session,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    channel_id: Optional[int] = None
+) -> list:
+    """
+    各渠道在 [start_date, end_date]（含两端，不传表示不限）内的消耗和投手日报记录数
+
+    完整月份读月度渠道绩效表 monthly_channel_performance（生成月度报表时写入）；
+    首尾不满一个月的部分，以及完整月份中被标记待刷新（生成报表后又有投手日报变动）的渠道，
+    从日汇总表 daily_spend_rollup 汇总。两部分各一条查询，不扫描 ad_spend_daily。
+    返回 [{"channel_id", "total_spend", "record_count"}]，按渠道 ID 排序
+    """
+    # 完整月份范围 [whole_start, whole_end)
+    end_exclusive = end_date + timedelta(days=1) if end_date is not None else None
+    whole_start = None
+    if start_date is not None:
+        whole_start = start_date if start_date.day == 1 else _next_month(start_date)
+    whole_end = _month_start(end_exclusive) if end_exclusive is not None else None
+
+    # 需要从日汇总表汇总的日期范围：首尾不满一个月的部分（范围内没有完整月份时为整个范围）
+    partial_ranges = []
+    if whole_start is not None and whole_end is not None and whole_start >= whole_end:
+        partial_ranges.append((start_date, end_exclusive))
+        whole_start = whole_end = None
+        has_whole_months = False
+    else:
+        has_whole_months = True
+        if start_date is not None and start_date < whole_start:
+            partial_ranges.append((start_date, whole_start))
+        if end_exclusive is not None and whole_end < end_exclusive:
+            partial_ranges.append((whole_end, end_exclusive))
+
+    totals = defaultdict(lambda: {"total_spend": Decimal("0"), "record_count": 0})
+
+    daily_conditions = [and_(DailySpendRollup.day >= start, DailySpendRollup.day < end) for start, end in partial_ranges]
+    if has_whole_months:
+        dirty_months = _dirty_channel_months(db, whole_start, whole_end, channel_id)
+        for month, channel_ids in sorted(dirty_months.items()):
+            daily_conditions.append(and_(
+                DailySpendRollup.day >= month,
+                DailySpendRollup.day < _next_month(month),
+                DailySpendRollup.channel_id.in_(sorted(channel_ids))
+            ))
+
+        # 1. 完整月份（跳过待刷新的渠道月份）读月度渠道绩效表
+        monthly_query = db.query(
+            MonthlyChannelPerformance.channel_id,
+            sql_func.sum(MonthlyChannelPerformance.total_spend).label("total_spend"),
+            sql_func.sum(MonthlyChannelPerformance.record_count).label("record_count")
+        )
+        if whole_start is not None:
+            monthly_query = monthly_query.filter(MonthlyChannelPerformance.month >= whole_start)
+        if whole_end is not None:
+            monthly_query = monthly_query.filter(MonthlyChannelPerformance.month < whole_end)
+        if channel_id:
+            monthly_query = monthly_query.filter(MonthlyChannelPerformance.channel_id == channel_id)
+        dirty_pairs = [(dirty_id, month) for month, channel_ids in dirty_months.items() for dirty_id in channel_ids]
+        if dirty_pairs:
+            monthly_query = monthly_query.filter(
+                ~tuple_(MonthlyChannelPerformance.channel_id, MonthlyChannelPerformance.month).in_(sorted(dirty_pairs))
+            )
+        for result in monthly_query.group_by(MonthlyChannelPerformance.channel_id).all():
+            totals[result.channel_id]["total_spend"] += Decimal(result.total_spend or 0)
+            totals[result.channel_id]["record_count"] += int(result.record_count or 0)
+
+    # 2. 不满一个月的部分和待刷新的渠道月份读日汇总表
+    if daily_conditions:
+        daily_query = db.query(
+            DailySpendRollup.channel_id,
+            sql_func.sum(DailySpendRollup.amount_usdt).label("total_spend"),
+            sql_func.sum(DailySpendRollup.record_count).label("record_count")
+        ).filter(
+            DailySpendRollup.record_count > 0,
+            or_(*daily_conditions)
+        )
+        if channel_id:
+            daily_query = daily_query.filter(DailySpendRollup.channel_id == channel_id)
+        for result in daily_query.group_by(DailySpendRollup.channel_id).all():
+            totals[result.channel_id]["total_spend"] += Decimal(result.total_spend or 0)
+            totals[result.channel_id]["record_count"] += int(result.record_count or 0)
+
+    return [
+        {
+            "channel_id": stats_channel_id,
+            "total_spend": float(stats["total_spend"]),
+            "record_count": stats["record_count"]
+        }
+        for stats_channel_id, stats in sorted(totals.items())
+        if stats["record_count"] > 0
+    ]
@@ -0,0 +1,188 @@
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from typing import Optional
+from sqlalchemy import Integer, and_, any_, bindparam, delete, func as sql_func, insert, select, text, true
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Session
+from app.db.upsert import upsert_rows
+from app.models.daily_rollup import DailySpendRollup, DailyLedgerRollup
+from app.models.spend_report import AdSpendDaily
+from app.models.finance_ledger import LedgerTransaction
+from app.services.report_dirty_service import mark_dirty_cells, spend_cells
+
+# 日汇总表的唯一键
+SPEND_ROLLUP_KEY = ("project_id", "operator_id", "channel_id", "day", "status")
+LEDGER_ROLLUP_KEY = ("project_id", "direction", "currency", "day")
+
+# 财务记录未关联项目时，日汇总中记录的 project_id（唯一约束中 NULL 互不相等，不能直接使用 NULL）
+NO_PROJECT_ID = 0
+
+# 非 PostgreSQL 数据库上每条查询的 IN 列表长度，保证绑定参数数量不超过上限
+ID_BATCH_SIZE = 4000
+
+
+def _is_postgresql(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def _apply_deltas(db: Session, model, key_columns: tuple, deltas: dict) -> None:
+    """把 {唯一键: {列名: 增量}} 累加到日汇总表（按唯一键排序写入，避免并发写入时互相死锁）"""
+    rows = [
+        {**dict(zip(key_columns, key)), **values}
+        for key, values in sorted(deltas.items())
+        if any(values.values())
+    ]
+    upsert_rows(db, model, rows, key_columns, accumulate=True)
+
+
+def add_spends_to_rollup(db: Session, spends: list) -> None:
+    """新建的投手日报计入日汇总（与投手日报在同一事务中提交）"""
+    deltas = defaultdict(lambda: {"amount_usdt": Decimal("0"), "record_count": 0})
+    for spend in spends:
+        key = (spend.project_id, spend.operator_id, spend.channel_id, spend.spend_date, spend.status or "")
+        deltas[key]["amount_usdt"] += spend.amount_usdt
+        deltas[key]["record_count"] += 1
+    _apply_deltas(db, DailySpendRollup, SPEND_ROLLUP_KEY, deltas)
+
+
+def add_ledgers_to_rollup(db: Session, ledgers: list) -> None:
+    """新建的财务记录计入日汇总（与财务记录在同一事务中提交）"""
+    deltas = defaultdict(lambda: {"amount": Decimal("0"), "fee_amount": Decimal("0"), "record_count": 0})
+    for ledger in ledgers:
+        key = (ledger.project_id or NO_PROJECT_ID, ledger.direction, ledger.currency or "", ledger.tx_date)
+        deltas[key]["amount"] += ledger.amount
+        deltas[key]["fee_amount"] += ledger.fee_amount or Decimal("0")
+        deltas[key]["record_count"] += 1
+    _apply_deltas(db, DailyLedgerRollup, LEDGER_ROLLUP_KEY, deltas)
+
+
+def move_spends_to_status(db: Session, spend_ids: list, status: str) -> None:
+    """
+    投手日报变更状态前调用：把这些记录从原状态的日汇总移到新状态
+
+    一条分组查询读出状态确实会改变的记录（按项目/投手/渠道/日期/原状态汇总），再一条语句写入增量，
+    同时标记受影响的月度绩效单元（Core UPDATE 不经过 ORM flush，需要在这里标记）。
+    财务记录的日汇总不含状态维度，状态变更时不需要维护。
+    """
+    spend_ids = sorted(set(spend_ids))
+    if not spend_ids:
+        return
+
+    status_column = sql_func.coalesce(AdSpendDaily.status, "")
+    query = db.query(
+        AdSpendDaily.project_id,
+        AdSpendDaily.operator_id,
+        AdSpendDaily.channel_id,
+        AdSpendDaily.spend_date,
+        status_column.label("status"),
+        sql_func.sum(AdSpendDaily.amount_usdt).label("amount_usdt"),
+        sql_func.count(AdSpendDaily.id).label("record_count")
+    ).filter(
+        status_column != status
+    ).group_by(
+        AdSpendDaily.project_id,
+        AdSpendDaily.operator_id,
+        AdSpendDaily.channel_id,
+        AdSpendDaily.spend_date,
+        status_column
+    )
+    if _is_postgresql(db):
+        groups = query.filter(
+            AdSpendDaily.id == any_(bindparam("rollup_spend_ids", spend_ids, type_=ARRAY(Integer)))
+        ).all()
+    else:
+        groups = []
+        for start in range(0, len(spend_ids), ID_BATCH_SIZE):
+            groups.extend(query.filter(AdSpendDaily.id.in_(spend_ids[start:start + ID_BATCH_SIZE])).all())
+
+    deltas = defaultdict(lambda: {"amount_usdt": Decimal("0"), "record_count": 0})
+    for group in groups:
+        dimensions = (group.project_id, group.operator_id, group.channel_id, group.spend_date)
+        amount = Decimal(group.amount_usdt)
+        deltas[dimensions + (group.status,)]["amount_usdt"] -= amount
+        deltas[dimensions + (group.status,)]["record_count"] -= group.record_count
+        deltas[dimensions + (status,)]["amount_usdt"] += amount
+        deltas[dimensions + (status,)]["record_count"] += group.record_count
+    _apply_deltas(db, DailySpendRollup, SPEND_ROLLUP_KEY, deltas)
+    mark_dirty_cells(db, [
+        cell for group in groups for cell in spend_cells(group.project_id, group.operator_id, group.channel_id, group.spend_date)
+    ])
+
+
+def _spend_rollup_source(day_filter):
+    """从 ad_spend_daily 重新汇总日汇总行的查询"""
+    status_column = sql_func.coalesce(AdSpendDaily.status, "")
+    return select(
+        AdSpendDaily.project_id,
+        AdSpendDaily.operator_id,
+        AdSpendDaily.channel_id,
+        AdSpendDaily.spend_date,
+        status_column,
+        sql_func.sum(AdSpendDaily.amount_usdt),
+        sql_func.count(AdSpendDaily.id)
+    ).where(day_filter(AdSpendDaily.spend_date)).group_by(
+        AdSpendDaily.project_id,
+        AdSpendDaily.operator_id,
+        AdSpendDaily.channel_id,
+        AdSpendDaily.spend_date,
+        status_column
+    )
+
+
+def _ledger_rollup_source(day_filter):
+    """从 ledger_transactions 重新汇总日汇总行的查询"""
+    project_column = sql_func.coalesce(LedgerTransaction.project_id, NO_PROJECT_ID)
+    currency_column = sql_func.coalesce(LedgerTransaction.currency, "")
+    return select(
+        project_column,
+        LedgerTransaction.direction,
+        currency_column,
+        LedgerTransaction.tx_date,
+        sql_func.sum(LedgerTransaction.amount),
+        sql_func.coalesce(sql_func.sum(LedgerTransaction.fee_amount), 0),
+        sql_func.count(LedgerTransaction.id)
+    ).where(day_filter(LedgerTransaction.tx_date)).group_by(
+        project_column,
+        LedgerTransaction.direction,
+        currency_column,
+        LedgerTransaction.tx_date
+    )
+
+
+def rebuild_daily_rollups(db: Session, start_date: Optional[date] = None, end_date: Optional[date] = None) -> dict:
+    """
+    从原始记录重建日汇总（修复增量维护产生的偏差，不提交）
+
+    只重建 [start_date, end_date) 范围内的日期，不传时重建全部。
+    PostgreSQL 上先锁定两张日汇总表（SHARE ROW EXCLUSIVE），重建期间其他事务的增量写入等待本事务结束，
+    已修改原始记录但尚未写入增量的事务在重建之后再累加，结果仍然一致。
+    返回 {"spend_rows": 重建的投手日报汇总行数, "ledger_rows": 重建的财务记录汇总行数}
+    """
+    def day_filter(column):
+        conditions = []
+        if start_date is not None:
+            conditions.append(column >= start_date)
+        if end_date is not None:
+            conditions.append(column < end_date)
+        return and_(true(), *conditions)
+
+    if _is_postgresql(db):
+        db.execute(text(
+            f"LOCK TABLE {DailySpendRollup.__tablename__}, {DailyLedgerRollup.__tablename__} "
+            "IN SHARE ROW EXCLUSIVE MODE"
+        ))
+
+    db.execute(delete(DailySpendRollup).where(day_filter(DailySpendRollup.day)))
+    spend_rows = db.execute(insert(DailySpendRollup).from_select(
+        list(SPEND_ROLLUP_KEY) + ["amount_usdt", "record_count"],
+        _spend_rollup_source(day_filter)
+    )).rowcount
+
+    db.execute(delete(DailyLedgerRollup).where(day_filter(DailyLedgerRollup.day)))
+    ledger_rows = db.execute(insert(DailyLedgerRollup).from_select(
+        list(LEDGER_ROLLUP_KEY) + ["amount", "fee_amount", "record_count"],
+        _ledger_rollup_source(day_filter)
+    )).rowcount
+
+    return {"spend_rows": spend_rows, "ledger_rows": ledger_rows}
@@ -1,3 +1,4 @@
+from collections import defaultdict
 from datetime import date, datetime
 from decimal import Decimal
 from sqlalchemy.orm import Session
@@ -5,8 +6,8 @@ from sqlalchemy import and_, func as sql_func
 from app.models.monthly_reports import MonthlyProjectPerformance, MonthlyOperatorPerformance
 from app.models.project import Project
 from app.models.operator import Operator
-from app.models.spend_report import AdSpendDaily
-from app.models.finance_ledger import LedgerTransaction
+from app.models.daily_rollup import DailySpendRollup, DailyLedgerRollup
+from app.services.exchange_rate_service import get_rate_table
 
 
 def calculate_roi(profit: Decimal, cost: Decimal) -> Decimal:
@@ -43,19 +44,34 @@ def generate_diagnostic_report(db: Session, year: int, month: int) -> dict:
         )
     ).all()
 
-    # 获取项目信息
-    project_dict = {}
-    for perf in project_performances:
-        project = db.query(Project).filter(Project.id == perf.project_id).first()
-        if project:
-            project_dict[perf.project_id] = project.name
+    # 一次查询取出报告中用到的所有项目和投手，各部分共用（不逐条查询）
+    project_ids = {perf.project_id for perf in project_performances}
+    projects_by_id = {}
+    if project_ids:
+        projects_by_id = {
+            project.id: project
+            for project in db.query(Project).filter(Project.id.in_(sorted(project_ids))).all()
+        }
+    operator_ids = {perf.operator_id for perf in operator_performances}
+    operators_by_id = {}
+    if operator_ids:
+        operators_by_id = {
+            operator.id: operator
+            for operator in db.query(Operator).filter(Operator.id.in_(sorted(operator_ids))).all()
+        }
 
-    # 获取投手信息
-    operator_dict = {}
-    for perf in operator_performances:
-        operator = db.query(Operator).filter(Operator.id == perf.operator_id).first()
-        if operator:
-            operator_dict[perf.operator_id] = operator.name
+    project_dict = {project_id: project.name for project_id, project in projects_by_id.items()}
+    operator_dict = {operator_id: operator.name for operator_id, operator in operators_by_id.items()}
+
+    # 按投手所属项目分组投手绩效，并累计每个项目下投手的消耗（ROI 下滑分析和投手分析共用，只遍历一次）
+    project_perf_dict = {p.project_id: p for p in project_performances}
+    operator_perfs_by_project = defaultdict(list)
+    operator_spend_by_project = defaultdict(lambda: Decimal("0"))
+    for o in operator_performances:
+        operator = operators_by_id.get(o.operator_id)
+        if operator and operator.project_id:
+            operator_perfs_by_project[operator.project_id].append(o)
+            operator_spend_by_project[operator.project_id] += o.total_spend_cny
 
     # 计算总体情况
     total_income_cny = sum(p.total_income_cny for p in project_performances)
@@ -101,7 +117,7 @@ def generate_diagnostic_report(db: Session, year: int, month: int) -> dict:
             reasons.append("利润率高达{:.1f}%，成本控制优秀".format(top_profitable_project["profit_margin"]))
         if top_profitable_project["roi"] > 100:
             reasons.append("ROI超过100%，投入产出比优秀")
-        if top_profitable_project["income_cny"] > total_income_cny * 0.3:
+        if top_profitable_project["income_cny"] > total_income_cny * Decimal("0.3"):
             reasons.append("收入占比较高，为主要盈利项目")
         if not reasons:
             reasons.append("收入和成本结构优化，盈利能力强")
@@ -130,6 +146,38 @@ def generate_diagnostic_report(db: Session, year: int, month: int) -> dict:
 
     prev_perf_dict = {p.project_id: p for p in prev_project_performances}
 
+    # 本月和上月的财务记录手续费（读财务记录日汇总），一条分组查询按 (项目, 月份) 汇总
+    start_date = date(year, month, 1)
+    if month == 12:
+        end_date = date(year + 1, 1, 1)
+    else:
+        end_date = date(year, month + 1, 1)
+    prev_start = date(prev_year, prev_month, 1)
+
+    compared_project_ids = {p.project_id for p in project_performances} & set(prev_perf_dict)
+    curr_fees_dict = {}
+    prev_fees_dict = {}
+    if compared_project_ids:
+        # 手续费按币种、日期分组后用汇率表折算为 USDT 再比较（没有汇率的币种不计入）
+        fee_rows = db.query(
+            DailyLedgerRollup.project_id,
+            DailyLedgerRollup.currency,
+            DailyLedgerRollup.day,
+            sql_func.sum(DailyLedgerRollup.fee_amount).label("fees")
+        ).filter(
+            DailyLedgerRollup.project_id.in_(sorted(compared_project_ids)),
+            DailyLedgerRollup.day >= prev_start,
+            DailyLedgerRollup.day < end_date
+        ).group_by(DailyLedgerRollup.project_id, DailyLedgerRollup.currency, DailyLedgerRollup.day).all()
+        fees_usdt = get_rate_table(db).to_usdt(
+            [row.currency for row in fee_rows], [row.day for row in fee_rows], [row.fees for row in fee_rows]
+        )
+        for row, fee_usdt in zip(fee_rows, fees_usdt):
+            if fee_usdt is None:
+                continue
+            fees_dict = curr_fees_dict if row.day >= start_date else prev_fees_dict
+            fees_dict[row.project_id] = fees_dict.get(row.project_id, Decimal("0")) + fee_usdt
+
     roi_declining_projects = []
     for curr_perf in project_performances:
         project_name = project_dict.get(curr_perf.project_id, f"项目{curr_perf.project_id}")
@@ -144,59 +192,28 @@ def generate_diagnostic_report(db: Session, year: int, month: int) -> dict:
                 reasons = []
                 
                 # 成本上升
-                if curr_perf.total_spend_cny > prev_perf.total_spend_cny * 1.1:
+                if curr_perf.total_spend_cny > prev_perf.total_spend_cny * Decimal("1.1"):
                     reasons.append("广告消耗成本上升{:.1f}%".format(
                         ((curr_perf.total_spend_cny - prev_perf.total_spend_cny) / prev_perf.total_spend_cny * 100) if prev_perf.total_spend_cny > 0 else 0
                     ))
                 
                 # 收入下降
-                if curr_perf.total_income_cny < prev_perf.total_income_cny * 0.9:
+                if curr_perf.total_income_cny < prev_perf.total_income_cny * Decimal("0.9"):
                     reasons.append("收入下降{:.1f}%，可能未按时入账或转化率下降".format(
                         ((prev_perf.total_income_cny - curr_perf.total_income_cny) / prev_perf.total_income_cny * 100) if prev_perf.total_income_cny > 0 else 0
                     ))
                 
                 # 检查手续费
-                # 获取本月和上月的财务记录手续费
-                start_date = date(year, month, 1)
-                if month == 12:
-                    end_date = date(year + 1, 1, 1)
-                else:
-                    end_date = date(year, month + 1, 1)
-                
-                curr_fees = db.query(sql_func.sum(LedgerTransaction.fee_amount)).filter(
-                    and_(
-                        LedgerTransaction.project_id == curr_perf.project_id,
-                        LedgerTransaction.tx_date >= start_date,
-                        LedgerTransaction.tx_date < end_date
-                    )
-                ).scalar() or Decimal("0")
-                
-                if month == 1:
-                    prev_start = date(prev_year, 12, 1)
-                    prev_end = date(prev_year + 1, 1, 1)
-                else:
-                    prev_start = date(prev_year, prev_month, 1)
-                    prev_end = date(prev_year, prev_month + 1, 1)
-                
-                prev_fees = db.query(sql_func.sum(LedgerTransaction.fee_amount)).filter(
-                    and_(
-                        LedgerTransaction.project_id == curr_perf.project_id,
-                        LedgerTransaction.tx_date >= prev_start,
-                        LedgerTransaction.tx_date < prev_end
-                    )
-                ).scalar() or Decimal("0")
+                curr_fees = curr_fees_dict.get(curr_perf.project_id) or Decimal("0")
+                prev_fees = prev_fees_dict.get(curr_perf.project_id) or Decimal("0")
                 
-                if curr_fees > prev_fees * 1.2:
+                if curr_fees > prev_fees * Decimal("1.2"):
                     reasons.append("手续费上升{:.1f}%".format(
                         ((curr_fees - prev_fees) / prev_fees * 100) if prev_fees > 0 else 0
                     ))
                 
                 # 投手效率下降（通过投手绩效分析）
-                curr_operators = [
-                    o for o in operator_performances
-                    if db.query(Operator).filter(Operator.id == o.operator_id).first() and
-                    db.query(Operator).filter(Operator.id == o.operator_id).first().project_id == curr_perf.project_id
-                ]
+                curr_operators = operator_perfs_by_project.get(curr_perf.project_id, [])
                 if curr_operators:
                     avg_operator_roi = sum(
                         float(calculate_roi(
@@ -221,39 +238,34 @@ def generate_diagnostic_report(db: Session, year: int, month: int) -> dict:
                 })
 
     # 4. 投手工作状态分析
-    # 获取本月投手消耗上报情况
-    start_date = date(year, month, 1)
-    if month == 12:
-        end_date = date(year + 1, 1, 1)
-    else:
-        end_date = date(year, month + 1, 1)
+    # 获取本月投手消耗上报情况（读投手日报日汇总，一条分组查询统计每个投手本月的上报条数）
+    report_count_dict = {}
+    if operator_ids:
+        report_count_dict = dict(db.query(
+            DailySpendRollup.operator_id,
+            sql_func.sum(DailySpendRollup.record_count)
+        ).filter(
+            DailySpendRollup.operator_id.in_(sorted(operator_ids)),
+            DailySpendRollup.day >= start_date,
+            DailySpendRollup.day < end_date
+        ).group_by(DailySpendRollup.operator_id).all())
 
     operator_analysis = []
     for op_perf in operator_performances:
         operator_name = operator_dict.get(op_perf.operator_id, f"投手{op_perf.operator_id}")
         
-        # 检查是否有漏报（通过检查消耗上报记录）
-        spend_reports = db.query(AdSpendDaily).filter(
-            and_(
-                AdSpendDaily.operator_id == op_perf.operator_id,
-                AdSpendDaily.spend_date >= start_date,
-                AdSpendDaily.spend_date < end_date
-            )
-        ).all()
+        # 检查是否有漏报
+        report_count = report_count_dict.get(op_perf.operator_id) or 0
         
         # 检查ROI
         # 获取该投手所属项目的收入
-        operator = db.query(Operator).filter(Operator.id == op_perf.operator_id).first()
+        operator = operators_by_id.get(op_perf.operator_id)
         operator_income_cny = Decimal("0")
         if operator and operator.project_id:
-            project_perf = next((p for p in project_performances if p.project_id == operator.project_id), None)
+            project_perf = project_perf_dict.get(operator.project_id)
             if project_perf:
                 # 按投手消耗比例分配收入（简化处理）
-                total_project_spend = sum(
-                    o.total_spend_cny for o in operator_performances
-                    if db.query(Operator).filter(Operator.id == o.operator_id).first() and
-                    db.query(Operator).filter(Operator.id == o.operator_id).first().project_id == operator.project_id
-                )
+                total_project_spend = operator_spend_by_project[operator.project_id]
                 if total_project_spend > 0:
                     operator_income_cny = project_perf.total_income_cny * (op_perf.total_spend_cny / total_project_spend)
         
@@ -263,7 +275,7 @@ def generate_diagnostic_report(db: Session, year: int, month: int) -> dict:
         issues = []
         
         # 检查漏报（消耗上报次数少）
-        if len(spend_reports) < 20:  # 假设每月至少应该有20次上报
+        if report_count < 20:  # 假设每月至少应该有20次上报
             issues.append("消耗上报次数偏少，可能存在漏报")
         
         # 检查低ROI
@@ -273,7 +285,7 @@ def generate_diagnostic_report(db: Session, year: int, month: int) -> dict:
             issues.append("ROI低于20%，效率偏低")
         
         # 检查只烧不产出
-        if op_perf.total_spend_cny > 10000 and operator_income_cny < op_perf.total_spend_cny * 0.5:
+        if op_perf.total_spend_cny > 10000 and operator_income_cny < op_perf.total_spend_cny * Decimal("0.5"):
             issues.append("消耗超过1万但收入不足消耗的50%，存在只烧不产出问题")
         
         operator_analysis.append({
@@ -282,7 +294,7 @@ def generate_diagnostic_report(db: Session, year: int, month: int) -> dict:
             "income_cny": float(operator_income_cny),
             "salary_cny": float(op_perf.salary_cost_cny),
             "roi": float(operator_roi),
-            "report_count": len(spend_reports),
+            "report_count": report_count,
             "issues": issues
         })
 
@@ -0,0 +1,118 @@
+import threading
+from bisect import bisect_right
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Optional
+import numpy as np
+from sqlalchemy import func as sql_func
+from sqlalchemy.orm import Session
+from app.models.exchange_rate import ExchangeRate
+
+BASE_CURRENCY = "USDT"  # 折算基准币种，汇率固定为 1
+REPORT_CURRENCY = "CNY"  # 报表展示币种
+DEFAULT_CNY_PER_USDT = Decimal("7.0")  # 没有录入 CNY 汇率时使用：1 USDT = 7 CNY
+CENT = Decimal("0.01")
+
+
+class RateTable:
+    """
+    某一版本的全部汇率
+
+    每个币种一份按生效日期升序的日期数组和汇率列表，某天的汇率取该日期及之前最近一次生效的汇率（二分查找）。
+    """
+
+    def __init__(self, version: tuple, rows: list):
+        self.version = version
+        dates = defaultdict(list)
+        rates = defaultdict(list)
+        for currency, rate_date, rate_to_usdt in sorted(rows, key=lambda row: (row[0], row[1])):
+            dates[currency].append(rate_date)
+            rates[currency].append(Decimal(rate_to_usdt))
+        self._dates = dict(dates)
+        self._date_arrays = {currency: np.array(days, dtype="datetime64[D]") for currency, days in dates.items()}
+        self._rates = dict(rates)
+
+    def currencies(self) -> set:
+        """可以折算为 USDT 的币种（USDT 和录入过汇率的币种）"""
+        return {BASE_CURRENCY} | set(self._rates)
+
+    def rate_as_of(self, currency: Optional[str], day) -> Optional[Decimal]:
+        """某天 1 单位该币种折合的 USDT，该日期及之前没有汇率时返回 None"""
+        if currency == BASE_CURRENCY:
+            return Decimal("1")
+        dates = self._dates.get(currency)
+        if dates is None:
+            return None
+        position = bisect_right(dates, day) - 1
+        return self._rates[currency][position] if position >= 0 else None
+
+    def to_usdt(self, currencies, days, amounts) -> list:
+        """
+        把一列金额按各自日期的汇率折算为 USDT（非 USDT 金额折算后保留两位小数）
+
+        整列按币种分组，每个币种用一次 np.searchsorted 查出全部日期对应的汇率位置，不逐条查询数据库。
+        返回与输入等长的列表，币种在该日期及之前没有汇率时为 None
+        """
+        amounts = list(amounts)
+        results = [None] * len(amounts)
+        if not amounts:
+            return results
+        currency_array = np.asarray(list(currencies), dtype=object)
+        day_array = np.asarray(list(days), dtype="datetime64[D]")
+
+        for currency in set(currency_array.tolist()):
+            indexes = np.flatnonzero(currency_array == currency).tolist()
+            if currency == BASE_CURRENCY:
+                for i in indexes:
+                    results[i] = amounts[i]
+                continue
+            date_array = self._date_arrays.get(currency)
+            if date_array is None:
+                continue
+            positions = np.searchsorted(date_array, day_array[indexes], side="right") - 1
+            rates = self._rates[currency]
+            for i, position in zip(indexes, positions.tolist()):
+                if position >= 0:
+                    results[i] = (Decimal(amounts[i]) * rates[position]).quantize(CENT, rounding=ROUND_HALF_UP)
+        return results
+
+    def cny_per_usdt(self, day) -> Decimal:
+        """某天 1 USDT 折合的 CNY（没有录入 CNY 汇率时使用 DEFAULT_CNY_PER_USDT）"""
+        rate = self.rate_as_of(REPORT_CURRENCY, day)
+        if not rate:
+            return DEFAULT_CNY_PER_USDT
+        return Decimal("1") / rate
+
+
+# 进程内缓存的汇率表（按版本失效）
+_cache_lock = threading.Lock()
+_cached_table: Optional[RateTable] = None
+
+
+def _load_version(db: Session) -> tuple:
+    """汇率表的版本：记录数、最大 ID、最近修改时间，新增、修改、删除汇率后都会变化"""
+    count, max_id, last_modified = db.query(
+        sql_func.count(ExchangeRate.id),
+        sql_func.max(ExchangeRate.id),
+        sql_func.max(sql_func.coalesce(ExchangeRate.updated_at, ExchangeRate.created_at))
+    ).one()
+    return count, max_id, last_modified
+
+
+def get_rate_table(db: Session) -> RateTable:
+    """
+    返回当前的汇率表
+
+    每次调用只执行一条查询读取汇率表的版本，版本不变时直接使用进程内缓存，变化后重新加载全部汇率。
+    """
+    global _cached_table
+    version = _load_version(db)
+    with _cache_lock:
+        if _cached_table is not None and _cached_table.version == version:
+            return _cached_table
+
+    rows = db.query(ExchangeRate.currency, ExchangeRate.rate_date, ExchangeRate.rate_to_usdt).all()
+    table = RateTable(version, rows)
+    with _cache_lock:
+        _cached_table = table
+    return table
@@ -1,107 +1,238 @@
-from datetime import date
+from collections import defaultdict
+from datetime import date, timedelta
 from decimal import Decimal
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, func as sql_func
-from app.models.spend_report import AdSpendDaily
-from app.models.finance_ledger import LedgerTransaction
+from sqlalchemy import func as sql_func, literal_column, or_, tuple_
+from app.db.upsert import upsert_rows
+from app.models.daily_rollup import DailySpendRollup, DailyLedgerRollup
 from app.models.operator_salary import OperatorSalary
 from app.models.monthly_reports import MonthlyProjectPerformance, MonthlyOperatorPerformance
+from app.models.channel import MonthlyChannelPerformance
+from app.services.daily_rollup_service import NO_PROJECT_ID
+from app.services.exchange_rate_service import BASE_CURRENCY, RateTable, get_rate_table
+from app.services.report_dirty_service import (
+    CHANNEL_CELL,
+    OPERATOR_CELL,
+    PROJECT_CELL,
+    bump_data_versions,
+    claim_dirty_cells,
+    group_cells_by_month,
+)
 
-# 汇率：1 USDT = 7 CNY
-EXCHANGE_RATE = Decimal("7.0")
+# 一次批量生成报表的最大月份数
+MAX_REPORT_RANGE_MONTHS = 120
 
 
-def generate_monthly_report(db: Session, year: int, month: int) -> dict:
+def _grouped_sums(db: Session, value_column, partition, dimensions: tuple, criteria) -> dict:
     """
-    生成月度汇总报表
-    
-    参数:
-        year: 年份
-        month: 月份 (1-12)
-    
-    返回:
-        {
-            "project_performance_count": 项目绩效记录数,
-            "operator_performance_count": 投手绩效记录数,
-            "summary": {
-                "total_spend_usdt": 总消耗(USDT),
-                "total_income_usdt": 总收入(USDT),
-                "total_cost_cny": 总成本(CNY)
-            }
+    一次扫描同时按多个维度分别汇总，并得到总计；partition 不为 None 时在它的每个取值内分别汇总
+
+    PostgreSQL 上使用 GROUP BY GROUPING SETS ((分区, 维度1), (分区, 维度2), ..., (分区))，用 grouping() 区分每行属于哪个分组；
+    其他数据库（SQLite 不支持 GROUPING SETS）按分区和全部维度的组合分组，再在 Python 中汇总，同样只扫描一次。
+    返回 {分区值: ({维度列名: {维度值: 合计}}, 总计)}，不分区时分区值为 None；没有数据的分区不出现在结果中
+    """
+    prefix = [] if partition is None else [partition]
+    results = {}
+
+    def partition_result(row):
+        key = row[0] if prefix else None
+        if key not in results:
+            results[key] = ({column.key: {} for column in dimensions}, Decimal("0"))
+        return key
+
+    if db.get_bind().dialect.name == "postgresql":
+        rows = db.query(
+            *prefix,
+            *dimensions,
+            sql_func.grouping(*dimensions).label('grouping_level'),
+            sql_func.sum(value_column).label('total')
+        ).filter(*criteria).group_by(
+            sql_func.grouping_sets(*[tuple_(*prefix, column) for column in dimensions], tuple_(*prefix))
+        ).all()
+        # grouping() 的结果按位表示哪些维度被汇总掉了（最左边的维度是最高位），总计行全部为 1
+        all_rolled_up = (1 << len(dimensions)) - 1
+        levels = {
+            all_rolled_up ^ (1 << (len(dimensions) - 1 - position)): column.key
+            for position, column in enumerate(dimensions)
         }
+        for row in rows:
+            key = partition_result(row)
+            by_dimension, total = results[key]
+            if row.grouping_level == all_rolled_up:
+                results[key] = (by_dimension, row.total if row.total is not None else Decimal("0"))
+            else:
+                level = levels[row.grouping_level]
+                by_dimension[level][getattr(row, level)] = row.total
+        return results
+
+    rows = db.query(
+        *prefix,
+        *dimensions,
+        sql_func.sum(value_column).label('total')
+    ).filter(*criteria).group_by(*prefix, *dimensions).all()
+    sums = {}
+    for row in rows:
+        key = partition_result(row)
+        partition_sums = sums.setdefault(key, {column.key: defaultdict(Decimal) for column in dimensions})
+        amount = Decimal(row.total) if row.total is not None else Decimal("0")
+        for column in dimensions:
+            partition_sums[column.key][getattr(row, column.key)] += amount
+        by_dimension, total = results[key]
+        results[key] = (by_dimension, total + amount)
+    for key, partition_sums in sums.items():
+        for column in dimensions:
+            results[key][0][column.key] = dict(partition_sums[column.key])
+    return results
+
+
+def _rollup_sums(db: Session, value_column, dimensions: tuple, criteria) -> tuple:
+    """
+    一次扫描同时按多个维度分别汇总，并得到总计
+
+    返回 ({维度列名: {维度值: 合计}}, 总计)，没有数据时总计为 0
     """
-    # 计算月份的开始和结束日期
+    return _grouped_sums(db, value_column, None, dimensions, criteria).get(
+        None, ({column.key: {} for column in dimensions}, Decimal("0"))
+    )
+
+
+def _month_bucket(db: Session, day_column):
+    """日期所在月份的分组表达式（PostgreSQL 上为 date_trunc('month', ...)，SQLite 上为 'YYYY-MM' 字符串）"""
+    if db.get_bind().dialect.name == "postgresql":
+        # 'month' 直接写入 SQL，保证 SELECT 和 GROUP BY 中的表达式完全相同
+        return sql_func.date_trunc(literal_column("'month'"), day_column)
+    return sql_func.strftime("%Y-%m", day_column)
+
+
+def _year_month(bucket) -> tuple:
+    """把 _month_bucket 的取值转换为 (year, month)"""
+    if isinstance(bucket, str):
+        year, month = bucket.split("-")
+        return int(year), int(month)
+    return bucket.year, bucket.month
+
+
+def _months_between(start_year: int, start_month: int, end_year: int, end_month: int) -> list:
+    """[开始月份, 结束月份] 之间（含两端）的全部 (year, month)"""
+    months = []
+    year, month = start_year, start_month
+    while (year, month) <= (end_year, end_month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def _month_range(year: int, month: int) -> tuple:
+    """月份的开始日期和下个月的开始日期"""
     start_date = date(year, month, 1)
     if month == 12:
         end_date = date(year + 1, 1, 1)
     else:
         end_date = date(year, month + 1, 1)
+    return start_date, end_date
 
-    # 1. 汇总本月所有 matched 的 ad_spend_daily，按项目和投手分组
-    spend_by_project = db.query(
-        AdSpendDaily.project_id,
-        sql_func.sum(AdSpendDaily.amount_usdt).label('total_spend')
-    ).filter(
-        and_(
-            AdSpendDaily.status == "matched",
-            AdSpendDaily.spend_date >= start_date,
-            AdSpendDaily.spend_date < end_date
-        )
-    ).group_by(AdSpendDaily.project_id).all()
 
-    spend_by_operator = db.query(
-        AdSpendDaily.operator_id,
-        sql_func.sum(AdSpendDaily.amount_usdt).label('total_spend')
-    ).filter(
-        and_(
-            AdSpendDaily.status == "matched",
-            AdSpendDaily.spend_date >= start_date,
-            AdSpendDaily.spend_date < end_date
+def _month_end(year: int, month: int) -> date:
+    """月份的最后一天（折算 CNY 时取这一天生效的汇率）"""
+    return _month_range(year, month)[1] - timedelta(days=1)
+
+
+def _income_by_month(db: Session, start_date: date, end_date: date, rates: RateTable, project_ids=None) -> dict:
+    """
+    汇总 [start_date, end_date) 内收入类的财务记录（读日汇总表 daily_ledger_rollup），按月份、项目分组，金额折算为 USDT
+
+    USDT 收入一次分组汇总；录入过汇率的其他币种逐个 (项目, 币种, 日期) 读出日汇总行，
+    按当天的汇率折算后再累加；没有汇率的币种不计入收入。
+    project_ids 不为 None 时只汇总这些项目。
+    返回 {(year, month): ({project_id: 收入}, 当月总收入)}，未关联项目的收入记在 None 下
+    """
+    criteria = [
+        DailyLedgerRollup.direction == "income",
+        DailyLedgerRollup.record_count > 0,
+        DailyLedgerRollup.day >= start_date,
+        DailyLedgerRollup.day < end_date
+    ]
+    if project_ids is not None:
+        criteria.append(DailyLedgerRollup.project_id.in_(sorted(project_ids)))
+    income_totals = _grouped_sums(
+        db,
+        DailyLedgerRollup.amount,
+        _month_bucket(db, DailyLedgerRollup.day),
+        (DailyLedgerRollup.project_id,),
+        criteria + [DailyLedgerRollup.currency == BASE_CURRENCY]
+    )
+    income_by_month = {
+        _year_month(bucket): (
+            defaultdict(lambda: Decimal("0"), {
+                (None if project_id == NO_PROJECT_ID else project_id): total_income
+                for project_id, total_income in by_dimension["project_id"].items()
+            }),
+            total_income_usdt
         )
-    ).group_by(AdSpendDaily.operator_id).all()
+        for bucket, (by_dimension, total_income_usdt) in income_totals.items()
+    }
 
-    # 2. 汇总本月所有收入类的 ledger_transactions，按项目分组
-    income_by_project = db.query(
-        LedgerTransaction.project_id,
-        sql_func.sum(LedgerTransaction.amount).label('total_income')
-    ).filter(
-        and_(
-            LedgerTransaction.direction == "income",
-            LedgerTransaction.currency == "USDT",
-            LedgerTransaction.tx_date >= start_date,
-            LedgerTransaction.tx_date < end_date
+    other_currencies = sorted(rates.currencies() - {BASE_CURRENCY})
+    if other_currencies:
+        rows = db.query(
+            DailyLedgerRollup.project_id,
+            DailyLedgerRollup.currency,
+            DailyLedgerRollup.day,
+            DailyLedgerRollup.amount
+        ).filter(*criteria, DailyLedgerRollup.currency.in_(other_currencies)).all()
+        amounts_usdt = rates.to_usdt(
+            [row.currency for row in rows], [row.day for row in rows], [row.amount for row in rows]
         )
-    ).group_by(LedgerTransaction.project_id).all()
+        for row, amount_usdt in zip(rows, amounts_usdt):
+            if amount_usdt is None:
+                continue
+            key = (row.day.year, row.day.month)
+            by_project, total_income_usdt = income_by_month.get(key, (defaultdict(lambda: Decimal("0")), Decimal("0")))
+            by_project[None if row.project_id == NO_PROJECT_ID else row.project_id] += amount_usdt
+            income_by_month[key] = (by_project, total_income_usdt + amount_usdt)
+
+    return {key: (dict(by_project), total) for key, (by_project, total) in income_by_month.items()}
+
 
-    # 3. 查询本月投手工资/提成
-    salary_by_operator = db.query(
+def _salary_by_month(db: Session, months: list, operator_ids=None) -> dict:
+    """
+    查询这些月份的投手工资/提成，operator_ids 不为 None 时只查询这些投手
+
+    返回 {(year, month): {operator_id: 工资(CNY)}}
+    """
+    query = db.query(
+        OperatorSalary.year,
+        OperatorSalary.month,
         OperatorSalary.operator_id,
         sql_func.sum(OperatorSalary.total_amount).label('total_salary')
-    ).filter(
-        and_(
-            OperatorSalary.year == year,
-            OperatorSalary.month == month
-        )
-    ).group_by(OperatorSalary.operator_id).all()
-
-    # 转换为字典以便快速查找
-    spend_by_project_dict = {item.project_id: item.total_spend for item in spend_by_project}
-    spend_by_operator_dict = {item.operator_id: item.total_spend for item in spend_by_operator}
-    income_by_project_dict = {item.project_id: item.total_income for item in income_by_project}
-    salary_by_operator_dict = {item.operator_id: item.total_salary for item in salary_by_operator}
-
-    # 4. 生成项目绩效表
-    project_performance_created = 0
-    project_performance_updated = 0
-    all_project_ids = set(spend_by_project_dict.keys()) | set(income_by_project_dict.keys())
-
-    for project_id in all_project_ids:
-        total_spend_usdt = spend_by_project_dict.get(project_id, Decimal("0"))
-        total_income_usdt = income_by_project_dict.get(project_id, Decimal("0"))
+    ).filter(tuple_(OperatorSalary.year, OperatorSalary.month).in_(months))
+    if operator_ids is not None:
+        query = query.filter(OperatorSalary.operator_id.in_(sorted(operator_ids)))
+    salary_by_month = defaultdict(dict)
+    for item in query.group_by(OperatorSalary.year, OperatorSalary.month, OperatorSalary.operator_id).all():
+        salary_by_month[(item.year, item.month)][item.operator_id] = item.total_salary
+    return dict(salary_by_month)
+
+
+def _project_performance_rows(
+    year: int, month: int, spend_by_project: dict, income_by_project: dict, cny_per_usdt: Decimal,
+    dirty_project_ids=()
+) -> list:
+    """
+    计算项目绩效（有消耗或收入的项目各一行，未关联项目的收入只计入总收入），按 cny_per_usdt 折算 CNY
+
+    被标记待刷新但本月已没有消耗和收入的项目写入 0，覆盖之前生成的数据。
+    """
+    project_rows = []
+    all_project_ids = (set(spend_by_project.keys()) | set(income_by_project.keys()) | set(dirty_project_ids)) - {None}
+
+    for project_id in sorted(all_project_ids):
+        total_spend_usdt = spend_by_project.get(project_id, Decimal("0"))
+        total_income_usdt = income_by_project.get(project_id, Decimal("0"))
         
         # 转换为 CNY
-        total_spend_cny = total_spend_usdt * EXCHANGE_RATE
-        total_income_cny = total_income_usdt * EXCHANGE_RATE
+        total_spend_cny = total_spend_usdt * cny_per_usdt
+        total_income_cny = total_income_usdt * cny_per_usdt
         
         # 计算净利润
         net_profit_cny = total_income_cny - total_spend_cny
@@ -111,92 +242,241 @@ def generate_monthly_report(db: Session, year: int, month: int) -> dict:
         if total_income_cny > 0:
             profit_margin = (net_profit_cny / total_income_cny) * 100
 
-        # 查询或创建项目绩效记录
-        existing_performance = db.query(MonthlyProjectPerformance).filter(
-            and_(
-                MonthlyProjectPerformance.project_id == project_id,
-                MonthlyProjectPerformance.year == year,
-                MonthlyProjectPerformance.month == month
-            )
-        ).first()
-
-        if existing_performance:
-            # 更新现有记录
-            existing_performance.total_spend_usdt = total_spend_usdt
-            existing_performance.total_income_usdt = total_income_usdt
-            existing_performance.total_spend_cny = total_spend_cny
-            existing_performance.total_income_cny = total_income_cny
-            existing_performance.net_profit_cny = net_profit_cny
-            existing_performance.profit_margin = profit_margin
-            project_performance_updated += 1
-        else:
-            # 创建新记录
-            new_performance = MonthlyProjectPerformance(
-                project_id=project_id,
-                year=year,
-                month=month,
-                total_spend_usdt=total_spend_usdt,
-                total_income_usdt=total_income_usdt,
-                total_spend_cny=total_spend_cny,
-                total_income_cny=total_income_cny,
-                net_profit_cny=net_profit_cny,
-                profit_margin=profit_margin
-            )
-            db.add(new_performance)
-            project_performance_created += 1
+        project_rows.append({
+            "project_id": project_id,
+            "year": year,
+            "month": month,
+            "total_spend_usdt": total_spend_usdt,
+            "total_income_usdt": total_income_usdt,
+            "total_spend_cny": total_spend_cny,
+            "total_income_cny": total_income_cny,
+            "net_profit_cny": net_profit_cny,
+            "profit_margin": profit_margin
+        })
+    return project_rows
 
-    # 5. 生成投手绩效表
-    operator_performance_created = 0
-    operator_performance_updated = 0
-    all_operator_ids = set(spend_by_operator_dict.keys()) | set(salary_by_operator_dict.keys())
 
-    for operator_id in all_operator_ids:
-        total_spend_usdt = spend_by_operator_dict.get(operator_id, Decimal("0"))
-        salary_cost_cny = salary_by_operator_dict.get(operator_id, Decimal("0"))
+def _operator_performance_rows(
+    year: int, month: int, spend_by_operator: dict, salary_by_operator: dict, cny_per_usdt: Decimal,
+    dirty_operator_ids=()
+) -> list:
+    """
+    计算投手绩效（有消耗或工资的投手各一行），按 cny_per_usdt 折算 CNY
+
+    被标记待刷新但本月已没有消耗和工资的投手写入 0，覆盖之前生成的数据。
+    """
+    operator_rows = []
+    all_operator_ids = (set(spend_by_operator.keys()) | set(salary_by_operator.keys()) | set(dirty_operator_ids)) - {None}
+
+    for operator_id in sorted(all_operator_ids):
+        total_spend_usdt = spend_by_operator.get(operator_id, Decimal("0"))
+        salary_cost_cny = salary_by_operator.get(operator_id, Decimal("0"))
         
         # 转换为 CNY
-        total_spend_cny = total_spend_usdt * EXCHANGE_RATE
+        total_spend_cny = total_spend_usdt * cny_per_usdt
         
         # 计算总成本
         total_cost_cny = total_spend_cny + salary_cost_cny
 
-        # 查询或创建投手绩效记录
-        existing_performance = db.query(MonthlyOperatorPerformance).filter(
-            and_(
-                MonthlyOperatorPerformance.operator_id == operator_id,
-                MonthlyOperatorPerformance.year == year,
-                MonthlyOperatorPerformance.month == month
-            )
-        ).first()
-
-        if existing_performance:
-            # 更新现有记录
-            existing_performance.total_spend_usdt = total_spend_usdt
-            existing_performance.total_spend_cny = total_spend_cny
-            existing_performance.salary_cost_cny = salary_cost_cny
-            existing_performance.total_cost_cny = total_cost_cny
-            operator_performance_updated += 1
-        else:
-            # 创建新记录
-            new_performance = MonthlyOperatorPerformance(
-                operator_id=operator_id,
-                year=year,
-                month=month,
-                total_spend_usdt=total_spend_usdt,
-                total_spend_cny=total_spend_cny,
-                salary_cost_cny=salary_cost_cny,
-                total_cost_cny=total_cost_cny
-            )
-            db.add(new_performance)
-            operator_performance_created += 1
+        operator_rows.append({
+            "operator_id": operator_id,
+            "year": year,
+            "month": month,
+            "total_spend_usdt": total_spend_usdt,
+            "total_spend_cny": total_spend_cny,
+            "salary_cost_cny": salary_cost_cny,
+            "total_cost_cny": total_cost_cny
+        })
+    return operator_rows
+
+
+def _channel_stats_by_month(db: Session, start_date: date, end_date: date, channel_ids=None) -> dict:
+    """
+    汇总 [start_date, end_date) 内各渠道每月的全部投手日报（不区分状态，读日汇总表 daily_spend_rollup）
+
+    channel_ids 不为 None 时只汇总这些渠道。
+    返回 {(year, month): {channel_id: {"total_spend": 消耗(USDT), "record_count": 记录数, "active_accounts": 投手数}}}
+    """
+    bucket = _month_bucket(db, DailySpendRollup.day)
+    query = db.query(
+        bucket.label('bucket'),
+        DailySpendRollup.channel_id,
+        sql_func.sum(DailySpendRollup.amount_usdt).label('total_spend'),
+        sql_func.sum(DailySpendRollup.record_count).label('record_count'),
+        sql_func.count(DailySpendRollup.operator_id.distinct()).label('active_accounts')
+    ).filter(
+        DailySpendRollup.record_count > 0,
+        DailySpendRollup.day >= start_date,
+        DailySpendRollup.day < end_date
+    )
+    if channel_ids is not None:
+        query = query.filter(DailySpendRollup.channel_id.in_(sorted(channel_ids)))
+    stats_by_month = defaultdict(dict)
+    for item in query.group_by(bucket, DailySpendRollup.channel_id).all():
+        stats_by_month[_year_month(item.bucket)][item.channel_id] = {
+            "total_spend": Decimal(item.total_spend),
+            "record_count": int(item.record_count),
+            "active_accounts": item.active_accounts
+        }
+    return dict(stats_by_month)
+
+
+def _channel_performance_rows(year: int, month: int, channel_stats: dict, dirty_channel_ids=()) -> list:
+    """
+    计算渠道绩效（有消耗的渠道各一行）
+
+    被标记待刷新但本月已没有消耗的渠道写入 0，覆盖之前生成的数据。
+    """
+    channel_rows = []
+    no_spend = {"total_spend": Decimal("0"), "record_count": 0, "active_accounts": 0}
+    for channel_id in sorted(set(channel_stats.keys()) | set(dirty_channel_ids)):
+        channel_rows.append({
+            "channel_id": channel_id,
+            "month": date(year, month, 1),
+            **channel_stats.get(channel_id, no_spend)
+        })
+    return channel_rows
+
+
+def _generate_months(db: Session, months: list) -> tuple:
+    """
+    生成连续若干个月的月度报表（不提交）
+
+    整个范围的投手日报、财务收入各一次扫描（按月份分组），绩效行批量写入，同时处理这些月份的待刷新单元。
+    返回 (各月报表 [{"year", "month", "project_performance_count", "operator_performance_count",
+    "channel_spend_usdt", "summary"}], 写入统计 {"project_performance_created": ..., ...})
+    """
+    start_date = _month_range(*months[0])[0]
+    end_date = _month_range(*months[-1])[1]
+
+    # 整月重新生成，这些月份的待刷新单元一并处理
+    dirty_cells = claim_dirty_cells(db, months)
+
+    # 1. 汇总范围内所有 matched 的投手日报（读日汇总表 daily_spend_rollup），
+    #    一次扫描同时得到每个月按项目、投手、渠道的消耗和当月总消耗
+    spend_by_month = _grouped_sums(
+        db,
+        DailySpendRollup.amount_usdt,
+        _month_bucket(db, DailySpendRollup.day),
+        (DailySpendRollup.project_id, DailySpendRollup.operator_id, DailySpendRollup.channel_id),
+        (
+            DailySpendRollup.status == "matched",
+            DailySpendRollup.record_count > 0,
+            DailySpendRollup.day >= start_date,
+            DailySpendRollup.day < end_date
+        )
+    )
+    spend_by_month = {_year_month(bucket): sums for bucket, sums in spend_by_month.items()}
+    no_spend = ({"project_id": {}, "operator_id": {}, "channel_id": {}}, Decimal("0"))
+
+    # 2. 汇总范围内所有收入类的财务记录（折算为 USDT），按月份、项目分组并得到每月总收入
+    rates = get_rate_table(db)
+    income_by_month = _income_by_month(db, start_date, end_date, rates)
+
+    # 3. 查询这些月份的投手工资/提成
+    salary_by_month = _salary_by_month(db, months)
+
+    # 4. 汇总范围内各渠道每月的消耗、记录数、活跃投手数
+    channel_stats_by_month = _channel_stats_by_month(db, start_date, end_date)
+    dirty_ids_by_month = group_cells_by_month(dirty_cells)
+
+    project_rows = []
+    operator_rows = []
+    channel_rows = []
+    reports = []
+    for year, month in months:
+        spend_totals, month_spend_usdt = spend_by_month.get((year, month), no_spend)
+        income_by_project_dict, month_income_usdt = income_by_month.get((year, month), ({}, Decimal("0")))
+        salary_by_operator_dict = salary_by_month.get((year, month), {})
+        # 按月末生效的汇率折算 CNY（没有录入 CNY 汇率时为 1 USDT = 7 CNY）
+        cny_per_usdt = rates.cny_per_usdt(_month_end(year, month))
+
+        # 5. 计算项目绩效、投手绩效、渠道绩效（待刷新但已没有数据的单元写入 0）
+        month_dirty_ids = dirty_ids_by_month.get((year, month), {})
+        month_project_rows = _project_performance_rows(
+            year, month, spend_totals["project_id"], income_by_project_dict, cny_per_usdt,
+            month_dirty_ids.get(PROJECT_CELL, ())
+        )
+        month_operator_rows = _operator_performance_rows(
+            year, month, spend_totals["operator_id"], salary_by_operator_dict, cny_per_usdt,
+            month_dirty_ids.get(OPERATOR_CELL, ())
+        )
+        project_rows.extend(month_project_rows)
+        operator_rows.extend(month_operator_rows)
+        channel_rows.extend(_channel_performance_rows(
+            year, month,
+            channel_stats_by_month.get((year, month), {}),
+            month_dirty_ids.get(CHANNEL_CELL, ())
+        ))
+
+        # 计算汇总信息（总消耗、总收入取汇总查询的总计行）
+        total_spend_cny = month_spend_usdt * cny_per_usdt
+        total_income_cny = month_income_usdt * cny_per_usdt
+        total_salary_cny = sum(salary_by_operator_dict.values())
+        total_cost_cny = total_spend_cny + total_salary_cny
+        reports.append({
+            "year": year,
+            "month": month,
+            "project_performance_count": len(month_project_rows),
+            "operator_performance_count": len(month_operator_rows),
+            "channel_spend_usdt": {
+                channel_id: float(total_spend) for channel_id, total_spend in spend_totals["channel_id"].items()
+            },
+            "summary": {
+                "total_spend_usdt": float(month_spend_usdt),
+                "total_income_usdt": float(month_income_usdt),
+                "total_spend_cny": float(total_spend_cny),
+                "total_income_cny": float(total_income_cny),
+                "total_salary_cny": float(total_salary_cny),
+                "total_cost_cny": float(total_cost_cny),
+                "net_profit_cny": float(total_income_cny - total_cost_cny)
+            }
+        })
 
-    # 计算汇总信息
-    total_spend_usdt = sum(spend_by_project_dict.values())
-    total_income_usdt = sum(income_by_project_dict.values())
-    total_spend_cny = total_spend_usdt * EXCHANGE_RATE
-    total_income_cny = total_income_usdt * EXCHANGE_RATE
-    total_salary_cny = sum(salary_by_operator_dict.values())
-    total_cost_cny = total_spend_cny + total_salary_cny
+    # 6. 批量写入项目绩效表、投手绩效表、渠道绩效表
+    #    （按唯一约束 uq_project_year_month / uq_operator_year_month / (channel_id, month) 写入或更新）
+    project_performance_created, project_performance_updated = upsert_rows(
+        db, MonthlyProjectPerformance, project_rows, ("project_id", "year", "month")
+    )
+    operator_performance_created, operator_performance_updated = upsert_rows(
+        db, MonthlyOperatorPerformance, operator_rows, ("operator_id", "year", "month")
+    )
+    channel_performance_created, channel_performance_updated = upsert_rows(
+        db, MonthlyChannelPerformance, channel_rows, ("channel_id", "month")
+    )
+    # 月度绩效已重写，按数据版本缓存的诊断报告随之失效
+    bump_data_versions(db, months)
+
+    return reports, {
+        "project_performance_created": project_performance_created,
+        "project_performance_updated": project_performance_updated,
+        "operator_performance_created": operator_performance_created,
+        "operator_performance_updated": operator_performance_updated,
+        "channel_performance_created": channel_performance_created,
+        "channel_performance_updated": channel_performance_updated
+    }
+
+
+def generate_monthly_report(db: Session, year: int, month: int) -> dict:
+    """
+    生成月度汇总报表
+    
+    参数:
+        year: 年份
+        month: 月份 (1-12)
+    
+    返回:
+        {
+            "project_performance_count": 项目绩效记录数,
+            "operator_performance_count": 投手绩效记录数,
+            "summary": {
+                "total_spend_usdt": 总消耗(USDT),
+                "total_income_usdt": 总收入(USDT),
+                "total_cost_cny": 总成本(CNY)
+            }
+        }
+    """
+    reports, counts = _generate_months(db, [(year, month)])
 
     # 提交事务
     try:
@@ -205,19 +485,141 @@ def generate_monthly_report(db: Session, year: int, month: int) -> dict:
         db.rollback()
         raise e
 
+    report = reports[0]
     return {
-        "project_performance_created": project_performance_created,
-        "project_performance_updated": project_performance_updated,
-        "operator_performance_created": operator_performance_created,
-        "operator_performance_updated": operator_performance_updated,
-        "summary": {
-            "total_spend_usdt": float(total_spend_usdt),
-            "total_income_usdt": float(total_income_usdt),
-            "total_spend_cny": float(total_spend_cny),
-            "total_income_cny": float(total_income_cny),
-            "total_salary_cny": float(total_salary_cny),
-            "total_cost_cny": float(total_cost_cny),
-            "net_profit_cny": float(total_income_cny - total_cost_cny)
-        }
+        **counts,
+        "channel_spend_usdt": report["channel_spend_usdt"],
+        "summary": report["summary"]
     }
 
+
+def generate_monthly_report_range(db: Session, start_year: int, start_month: int, end_year: int, end_month: int) -> dict:
+    """
+    一次生成连续多个月的月度汇总报表（含开始、结束月份），用于修正数据后回填
+
+    整个范围一次扫描汇总、批量写入，并在同一事务中提交。
+    返回 {"months": 各月报表, "project_performance_created": ..., "project_performance_updated": ...,
+          "operator_performance_created": ..., "operator_performance_updated": ...}
+    """
+    months = _months_between(start_year, start_month, end_year, end_month)
+    if not months:
+        raise ValueError("结束月份不能早于开始月份")
+    if len(months) > MAX_REPORT_RANGE_MONTHS:
+        raise ValueError(f"一次最多生成 {MAX_REPORT_RANGE_MONTHS} 个月的报表")
+
+    reports, counts = _generate_months(db, months)
+
+    # 提交事务
+    try:
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
+
+    return {"months": reports, **counts}
+
+
+def refresh_dirty_cells(db: Session) -> dict:
+    """
+    只重新计算有变动的月度绩效单元
+
+    投手日报、财务记录、投手工资写入或修改后会标记受影响的 (月份, 项目/投手/渠道)，
+    这里按月份分组，每个月一次汇总查询只读取这些项目和投手的日汇总，再批量写入绩效表，最后删除标记。
+    每个标记的单元都会写入一行：本月已没有消耗、收入或工资的项目、投手写入 0，覆盖之前生成的数据。
+    返回 {
+        "dirty_cell_count": 处理的单元数,
+        "months": 涉及的月份 ["YYYY-MM"],
+        "project_performance_created": ..., "project_performance_updated": ...,
+        "operator_performance_created": ..., "operator_performance_updated": ...,
+        "channel_performance_created": ..., "channel_performance_updated": ...
+    }
+    """
+    dirty_cells = claim_dirty_cells(db)
+    rates = get_rate_table(db)
+    result = {
+        "dirty_cell_count": len(dirty_cells),
+        "months": [],
+        "project_performance_created": 0,
+        "project_performance_updated": 0,
+        "operator_performance_created": 0,
+        "operator_performance_updated": 0,
+        "channel_performance_created": 0,
+        "channel_performance_updated": 0,
+    }
+
+    for (year, month), entity_ids in sorted(group_cells_by_month(dirty_cells).items()):
+        project_ids = entity_ids[PROJECT_CELL]
+        operator_ids = entity_ids[OPERATOR_CELL]
+        channel_ids = entity_ids[CHANNEL_CELL]
+        start_date, end_date = _month_range(year, month)
+        cny_per_usdt = rates.cny_per_usdt(_month_end(year, month))
+
+        # 一次扫描同时得到这些项目和投手的消耗
+        spend_totals = {"project_id": {}, "operator_id": {}}
+        if project_ids or operator_ids:
+            spend_totals, _ = _rollup_sums(
+                db,
+                DailySpendRollup.amount_usdt,
+                (DailySpendRollup.project_id, DailySpendRollup.operator_id),
+                (
+                    DailySpendRollup.status == "matched",
+                    DailySpendRollup.record_count > 0,
+                    DailySpendRollup.day >= start_date,
+                    DailySpendRollup.day < end_date,
+                    or_(
+                        DailySpendRollup.project_id.in_(sorted(project_ids)),
+                        DailySpendRollup.operator_id.in_(sorted(operator_ids))
+                    )
+                )
+            )
+        spend_by_project = {
+            project_id: total for project_id, total in spend_totals["project_id"].items() if project_id in project_ids
+        }
+        spend_by_operator = {
+            operator_id: total for operator_id, total in spend_totals["operator_id"].items() if operator_id in operator_ids
+        }
+        income_by_project = {}
+        if project_ids:
+            income_by_project, _ = _income_by_month(db, start_date, end_date, rates, project_ids).get((year, month), ({}, None))
+        salary_by_operator = {}
+        if operator_ids:
+            salary_by_operator = _salary_by_month(db, [(year, month)], operator_ids).get((year, month), {})
+
+        created, updated = upsert_rows(
+            db, MonthlyProjectPerformance,
+            _project_performance_rows(year, month, spend_by_project, income_by_project, cny_per_usdt, project_ids),
+            ("project_id", "year", "month")
+        )
+        result["project_performance_created"] += created
+        result["project_performance_updated"] += updated
+
+        created, updated = upsert_rows(
+            db, MonthlyOperatorPerformance,
+            _operator_performance_rows(year, month, spend_by_operator, salary_by_operator, cny_per_usdt, operator_ids),
+            ("operator_id", "year", "month")
+        )
+        result["operator_performance_created"] += created
+        result["operator_performance_updated"] += updated
+
+        channel_stats = {}
+        if channel_ids:
+            channel_stats = _channel_stats_by_month(db, start_date, end_date, channel_ids).get((year, month), {})
+        created, updated = upsert_rows(
+            db, MonthlyChannelPerformance,
+            _channel_performance_rows(year, month, channel_stats, channel_ids),
+            ("channel_id", "month")
+        )
+        result["channel_performance_created"] += created
+        result["channel_performance_updated"] += updated
+        result["months"].append(f"{year:04d}-{month:02d}")
+
+    bump_data_versions(db, group_cells_by_month(dirty_cells).keys())
+
+    # 提交事务
+    try:
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
+
+    return result
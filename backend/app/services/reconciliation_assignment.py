@@ -0,0 +1,221 @@
+import heapq
+from collections import defaultdict
+from decimal import Decimal
+from typing import Optional
+from app.services.reconciliation_metrics import add_count
+
+# 单次最优求解的候选对上限，保证总耗时与数据量线性相关：
+# 超过上限的连通块按投手日报日期切分为若干窗口逐个求解，单条投手日报的候选对就超过上限时该窗口退回贪心匹配
+MAX_ASSIGNMENT_BLOCK_EDGES = 2000
+
+
+def _split_blocks(edges: list) -> list:
+    """
+    按候选对把 spend 和 ledger 划分为互不相交的连通块（并查集）
+
+    匹配不会跨项目、日期相差不超过1天，所以连通块通常是"同项目、相邻几天"的一小组记录。
+    """
+    parent = {}
+
+    def find(node):
+        parent.setdefault(node, node)
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for spend_id, ledger_id, _, _ in edges:
+        root_a, root_b = find(("spend", spend_id)), find(("ledger", ledger_id))
+        if root_a != root_b:
+            parent[root_b] = root_a
+
+    blocks = defaultdict(list)
+    for edge in edges:
+        blocks[find(("spend", edge[0]))].append(edge)
+    return list(blocks.values())
+
+
+def _greedy_block(edges: list) -> dict:
+    """按 spend 出现顺序贪心匹配（与默认匹配规则相同：匹配度最高，金额差异最小）"""
+    edges_by_spend = defaultdict(list)
+    for edge in edges:
+        edges_by_spend[edge[0]].append(edge)
+
+    assignment = {}
+    used_ledgers = set()
+    for spend_id, spend_edges in edges_by_spend.items():
+        best = None
+        for edge in spend_edges:
+            if edge[1] in used_ledgers:
+                continue
+            if best is None or edge[2] > best[2] or (edge[2] == best[2] and edge[3] < best[3]):
+                best = edge
+        if best:
+            assignment[spend_id] = best[1]
+            used_ledgers.add(best[1])
+    return assignment
+
+
+def _optimal_block(edges: list) -> dict:
+    """
+    连通块内的最小费用二分图匹配
+
+    先保证匹配数量最多，再让总匹配度最高：费用 = 100 - 匹配度（非负），
+    用带势函数的 Dijkstra 逐条寻找最短增广路（successive shortest path）。
+    """
+    spend_ids = list(dict.fromkeys(edge[0] for edge in edges))
+    ledger_ids = list(dict.fromkeys(edge[1] for edge in edges))
+    spend_node = {spend_id: 1 + i for i, spend_id in enumerate(spend_ids)}
+    ledger_node = {ledger_id: 1 + len(spend_ids) + i for i, ledger_id in enumerate(ledger_ids)}
+    source, sink = 0, 1 + len(spend_ids) + len(ledger_ids)
+    node_count = sink + 1
+
+    # 残量网络：每条边 [终点, 剩余容量, 费用, 反向边下标]
+    graph = [[] for _ in range(node_count)]
+
+    def add_edge(u, v, cost):
+        graph[u].append([v, 1, cost, len(graph[v])])
+        graph[v].append([u, 0, -cost, len(graph[u]) - 1])
+
+    for spend_id in spend_ids:
+        add_edge(source, spend_node[spend_id], 0)
+    for ledger_id in ledger_ids:
+        add_edge(ledger_node[ledger_id], sink, 0)
+    for spend_id, ledger_id, match_score, _ in edges:
+        # 匹配度是 0.25 的整数倍，乘以 100 后为整数费用
+        add_edge(spend_node[spend_id], ledger_node[ledger_id], int((Decimal("100") - match_score) * 100))
+
+    potential = [0] * node_count
+    while True:
+        dist = [None] * node_count
+        prev = [None] * node_count
+        dist[source] = 0
+        heap = [(0, source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d != dist[u]:
+                continue
+            for edge_index, (v, capacity, cost, _) in enumerate(graph[u]):
+                if capacity <= 0:
+                    continue
+                nd = d + cost + potential[u] - potential[v]
+                if dist[v] is None or nd < dist[v]:
+                    dist[v] = nd
+                    prev[v] = (u, edge_index)
+                    heapq.heappush(heap, (nd, v))
+
+        if dist[sink] is None:
+            break  # 没有增广路，已达到最大匹配数
+        for node in range(node_count):
+            if dist[node] is not None:
+                potential[node] += dist[node]
+
+        # 沿最短路增广一个单位流量
+        node = sink
+        while node != source:
+            u, edge_index = prev[node]
+            edge = graph[u][edge_index]
+            edge[1] -= 1
+            graph[node][edge[3]][1] += 1
+            node = u
+
+    assignment = {}
+    node_to_ledger = {node: ledger_id for ledger_id, node in ledger_node.items()}
+    for spend_id in spend_ids:
+        for v, capacity, _, _ in graph[spend_node[spend_id]]:
+            if v in node_to_ledger and capacity == 0:
+                assignment[spend_id] = node_to_ledger[v]
+                break
+    return assignment
+
+
+def _solve_oversized_block(edges: list, spend_dates: Optional[dict]) -> tuple:
+    """
+    求解超过上限的连通块，返回 (分配结果, 退回贪心匹配的窗口数)
+
+    连通块只包含同一项目的记录，有投手日报日期时按日期把投手日报切分为连续的窗口（项目 + 日期区间），
+    每个窗口的候选对不超过上限，依次求最优分配：
+    - 已被前面窗口占用的财务记录不再参与后面的窗口
+    - 候选记录还与后面窗口的投手日报相连的投手日报（窗口边界附近），本窗口的结果只是暂定，
+      带入下一个窗口与后面的投手日报一起重新求解，避免边界上的记录被前一个窗口提前占用
+    带入的投手日报使下一个窗口超过上限时，该窗口退回贪心匹配，结果全部确定。
+    没有日期时整块退回贪心匹配。
+    """
+    if spend_dates is None:
+        return _greedy_block(edges), 1
+
+    edges_by_spend = defaultdict(list)
+    for edge in edges:
+        edges_by_spend[edge[0]].append(edge)
+    spend_ids = sorted(edges_by_spend, key=lambda spend_id: spend_dates[spend_id])
+
+    # 每条财务记录还有多少条相连的投手日报尚未进入任何窗口
+    pending_neighbors = defaultdict(int)
+    for edge in edges:
+        pending_neighbors[edge[1]] += 1
+
+    assignment = {}
+    used_ledgers = set()
+    greedy_windows = 0
+    carried = []
+    position = 0
+    while position < len(spend_ids) or carried:
+        window_spend_ids = list(carried)
+        edge_count = sum(len(edges_by_spend[spend_id]) for spend_id in window_spend_ids)
+        while position < len(spend_ids):
+            spend_edges = edges_by_spend[spend_ids[position]]
+            if len(window_spend_ids) > len(carried) and edge_count + len(spend_edges) > MAX_ASSIGNMENT_BLOCK_EDGES:
+                break
+            window_spend_ids.append(spend_ids[position])
+            edge_count += len(spend_edges)
+            for edge in spend_edges:
+                pending_neighbors[edge[1]] -= 1
+            position += 1
+
+        window = [
+            edge for spend_id in window_spend_ids for edge in edges_by_spend[spend_id]
+            if edge[1] not in used_ledgers
+        ]
+        if len(window) > MAX_ASSIGNMENT_BLOCK_EDGES:
+            window_assignment = _greedy_block(window)
+            greedy_windows += 1
+            carried = []
+        else:
+            window_assignment = _optimal_block(window) if window else {}
+            carried = [
+                spend_id for spend_id in window_spend_ids
+                if any(pending_neighbors[edge[1]] > 0 for edge in edges_by_spend[spend_id])
+            ]
+
+        carried_ids = set(carried)
+        for spend_id, ledger_id in window_assignment.items():
+            if spend_id not in carried_ids:
+                assignment[spend_id] = ledger_id
+                used_ledgers.add(ledger_id)
+    return assignment, greedy_windows
+
+
+def solve_optimal_assignment(edges: list, spend_dates: Optional[dict] = None) -> dict:
+    """
+    全局最优分配：按连通块求解最小费用二分图匹配
+
+    参数:
+        edges: 满足硬性匹配条件的候选对 [(spend_id, ledger_id, match_score, amount_diff)]，
+               同一 spend 的候选对按原匹配顺序排列
+        spend_dates: {spend_id: 投手日报日期}，用于切分超过上限的连通块；为 None 时超过上限的块退回贪心匹配
+    返回:
+        {spend_id: ledger_id}
+
+    超过上限、没有整块求最优解的连通块计入 assignment_split_blocks，
+    其中退回贪心匹配的块或窗口计入 assignment_greedy_blocks（见 reconciliation_metrics）。
+    """
+    assignment = {}
+    for block in _split_blocks(edges):
+        if len(block) > MAX_ASSIGNMENT_BLOCK_EDGES:
+            block_assignment, greedy_windows = _solve_oversized_block(block, spend_dates)
+            assignment.update(block_assignment)
+            add_count("assignment_split_blocks", 1)
+            add_count("assignment_greedy_blocks", greedy_windows)
+        else:
+            assignment.update(_optimal_block(block))
+    return assignment
@@ -0,0 +1,299 @@
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Optional
+from sqlalchemy import and_, exists
+from sqlalchemy.orm import Session
+from app.db.query_counter import count_statements
+from app.db.session import SessionLocal
+from app.models.spend_report import AdSpendDaily
+from app.models.finance_ledger import LedgerTransaction
+from app.models.reconciliation import Reconciliation
+from app.services.exchange_rate_service import RateTable, get_rate_table
+from app.services.reconciliation_matcher import MAX_AMOUNT_DIFF, MAX_DATE_DIFF, ledger_amounts_usdt
+from app.services.reconciliation_metrics import RunMetrics, add_count, phase, record_run, track_run
+from app.services.reconciliation_scoring import score_candidates, score_to_decimal
+from app.services.reconciliation_window import candidate_ledger_filter, lookback_start
+from app.services.reconciliation_writer import reconciliation_row, write_reconciliation_results
+
+
+class ProjectCandidates:
+    """
+    单个项目尚未匹配的记录（进程内缓存）
+
+    ledgers: ledger_id -> (tx_date, 折合 USDT 金额)，与整批对账相同的候选范围内可以折算为 USDT 的支出记录
+    spends: spend_id -> (spend_date, amount_usdt)，状态为 pending 的投手日报
+    缓存只用于挑选候选，写入前总会在数据库中加锁复核；汇率表版本变化后重新加载。
+    """
+
+    def __init__(self, since: Optional[date], rates_version: tuple):
+        self.since = since
+        self.rates_version = rates_version
+        self.ledgers = {}
+        self.spends = {}
+
+
+# project_id -> ProjectCandidates
+_candidate_cache = {}
+_cache_lock = threading.Lock()
+# 同一项目的增量匹配在进程内串行执行
+_project_locks = defaultdict(threading.Lock)
+
+
+def _project_lock(project_id: int) -> threading.Lock:
+    with _cache_lock:
+        return _project_locks[project_id]
+
+
+def invalidate_candidate_cache(project_ids=None) -> None:
+    """清空候选缓存（整批对账、手工修改对账状态后调用）"""
+    with _cache_lock:
+        if project_ids is None:
+            _candidate_cache.clear()
+        else:
+            for project_id in project_ids:
+                _candidate_cache.pop(project_id, None)
+
+
+def _load_project_candidates(db: Session, project_id: int, since: Optional[date], rates: RateTable) -> ProjectCandidates:
+    """从数据库加载一个项目尚未匹配的支出记录和投手日报"""
+    candidates = ProjectCandidates(since, rates.version)
+
+    with phase("load_ledgers"):
+        ledgers = db.query(
+            LedgerTransaction.id,
+            LedgerTransaction.tx_date,
+            LedgerTransaction.amount,
+            LedgerTransaction.currency
+        ).filter(
+            LedgerTransaction.project_id == project_id,
+            LedgerTransaction.currency.in_(sorted(rates.currencies())),
+            candidate_ledger_filter(since),
+            ~exists().where(and_(
+                Reconciliation.ledger_id == LedgerTransaction.id,
+                Reconciliation.status == "matched"
+            ))
+        ).all()
+        add_count("ledgers_loaded", len(ledgers))
+    for ledger, amount_usdt in zip(ledgers, ledger_amounts_usdt(ledgers, rates)):
+        if amount_usdt is not None:
+            candidates.ledgers[ledger.id] = (ledger.tx_date, amount_usdt)
+
+    with phase("load_spends"):
+        spends = db.query(
+            AdSpendDaily.id,
+            AdSpendDaily.spend_date,
+            AdSpendDaily.amount_usdt
+        ).filter(
+            AdSpendDaily.project_id == project_id,
+            AdSpendDaily.status == "pending",
+            ~exists().where(and_(
+                Reconciliation.ad_spend_id == AdSpendDaily.id,
+                Reconciliation.status == "matched"
+            ))
+        ).all()
+        add_count("spends_loaded", len(spends))
+    for spend in spends:
+        candidates.spends[spend.id] = (spend.spend_date, spend.amount_usdt)
+
+    return candidates
+
+
+def _get_project_candidates(db: Session, project_id: int, since: Optional[date], rates: RateTable) -> ProjectCandidates:
+    """获取项目的候选缓存，回看窗口起点变化（跨天）或汇率表变化后重新加载"""
+    with _cache_lock:
+        candidates = _candidate_cache.get(project_id)
+    if candidates is None or candidates.since != since or candidates.rates_version != rates.version:
+        candidates = _load_project_candidates(db, project_id, since, rates)
+        with _cache_lock:
+            _candidate_cache[project_id] = candidates
+    return candidates
+
+
+def _rank_counterparts(record_date: date, amount: Decimal, counterparts: dict) -> list:
+    """
+    按匹配优先级排列满足匹配条件的对方记录（匹配度最高、金额差最小、ID 最小）
+
+    返回 [(counterpart_id, match_score, amount_diff, date_diff)]
+    """
+    add_count("candidate_pairs", len(counterparts))
+    eligible = []
+    for counterpart_id, (counterpart_date, counterpart_amount) in counterparts.items():
+        date_diff = abs((record_date - counterpart_date).days)
+        amount_diff = abs(amount - counterpart_amount)
+        if date_diff <= MAX_DATE_DIFF and amount_diff <= MAX_AMOUNT_DIFF:
+            eligible.append((counterpart_id, amount_diff, date_diff))
+    if not eligible:
+        return []
+
+    eligible.sort(key=lambda item: item[0])
+    scores, _ = score_candidates([item[1] for item in eligible], [item[2] for item in eligible])
+    ranked = [
+        (counterpart_id, score_to_decimal(score), amount_diff, date_diff)
+        for (counterpart_id, amount_diff, date_diff), score in zip(eligible, scores)
+    ]
+    ranked.sort(key=lambda item: (-item[1], item[2], item[0]))
+    return ranked
+
+
+def _claim_pair(db: Session, spend_id: int, ledger_id: int, rates: RateTable) -> Optional[tuple]:
+    """
+    在数据库中锁定一对记录，复核两边都尚未匹配，并按锁定后读到的金额、日期重新计算匹配度
+
+    PostgreSQL 上使用 SELECT ... FOR NO KEY UPDATE，其他进程对同一记录的复核会等待本事务结束。
+    返回 (match_score, amount_diff, date_diff)；任一边已匹配、已修改为不再满足匹配条件（方向、状态、
+    项目、金额、日期）时返回 None
+    """
+    spend = db.query(AdSpendDaily).filter(
+        AdSpendDaily.id == spend_id
+    ).with_for_update(key_share=True).first()
+    ledger = db.query(LedgerTransaction).filter(
+        LedgerTransaction.id == ledger_id
+    ).with_for_update(key_share=True).first()
+    if not spend or not ledger or spend.status != "pending":
+        return None
+    if ledger.direction != "expense" or ledger.status == "matched" or ledger.project_id != spend.project_id:
+        return None
+
+    amount_usdt = ledger_amounts_usdt([ledger], rates)[0]
+    if amount_usdt is None:
+        return None
+    amount_diff = abs(spend.amount_usdt - amount_usdt)
+    date_diff = abs((spend.spend_date - ledger.tx_date).days)
+    if date_diff > MAX_DATE_DIFF or amount_diff > MAX_AMOUNT_DIFF:
+        return None
+
+    already_matched = db.query(Reconciliation.id).filter(
+        Reconciliation.status == "matched",
+        (Reconciliation.ad_spend_id == spend_id) | (Reconciliation.ledger_id == ledger_id)
+    ).first()
+    if already_matched is not None:
+        return None
+    scores, _ = score_candidates([amount_diff], [date_diff])
+    return score_to_decimal(scores[0]), amount_diff, date_diff
+
+
+def _match_incrementally(
+    db: Session,
+    project_id: int,
+    record_id: int,
+    record_date: date,
+    amount: Decimal,
+    since: Optional[date],
+    is_spend: bool,
+    rates: RateTable
+) -> Optional[dict]:
+    """把新记录（金额已折算为 USDT）加入同项目的候选缓存并寻找匹配，成功时写入对账记录并提交"""
+    with _project_lock(project_id):
+        candidates = _get_project_candidates(db, project_id, since, rates)
+        own, counterparts = (
+            (candidates.spends, candidates.ledgers) if is_spend else (candidates.ledgers, candidates.spends)
+        )
+        own[record_id] = (record_date, amount)
+
+        with phase("match"):
+            ranked = _rank_counterparts(record_date, amount, counterparts)
+        for counterpart_id, match_score, amount_diff, date_diff in ranked:
+            spend_id, ledger_id = (record_id, counterpart_id) if is_spend else (counterpart_id, record_id)
+            with phase("match"):
+                claimed = _claim_pair(db, spend_id, ledger_id, rates)
+            if claimed != (match_score, amount_diff, date_diff):
+                # 缓存已过期（其他进程或整批对账已匹配，或记录在加载缓存后被修改），下次重新加载该项目
+                invalidate_candidate_cache([project_id])
+            if claimed is None:
+                db.rollback()
+                counterparts.pop(counterpart_id, None)
+                continue
+            # 使用复核时重新计算的结果
+            match_score, amount_diff, date_diff = claimed
+
+            write_reconciliation_results(db, [reconciliation_row(
+                spend_id, ledger_id, amount_diff, date_diff, match_score, "matched", "自动匹配成功（增量）"
+            )])
+            try:
+                with phase("commit"):
+                    db.commit()
+            except Exception:
+                db.rollback()
+                invalidate_candidate_cache([project_id])
+                raise
+
+            candidates.spends.pop(spend_id, None)
+            candidates.ledgers.pop(ledger_id, None)
+            return {"ad_spend_id": spend_id, "ledger_id": ledger_id, "match_score": match_score}
+        return None
+
+
+def _run_recorded(db: Session, match) -> Optional[dict]:
+    """执行一次增量匹配，并写入运行记录（trigger=insert，mode=incremental）"""
+    started_at = datetime.now(timezone.utc)
+    start = time.perf_counter()
+    result, error = None, None
+    # 进入 track_run() 之前出错时也能写入运行记录（指标为空）
+    statements, metrics = None, RunMetrics()
+    try:
+        with count_statements() as statements, track_run() as metrics:
+            result = match()
+        return result
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        record_run(
+            db,
+            metrics,
+            trigger="insert",
+            mode="incremental",
+            started_at=started_at,
+            wall_seconds=time.perf_counter() - start,
+            result={"matched_count": 1 if result else 0},
+            error=error,
+            sql_statement_count=statements.count if statements is not None else 0
+        )
+
+
+def reconcile_new_spend(spend_id: int) -> Optional[dict]:
+    """
+    新建投手日报后的增量对账（在后台任务中执行，使用独立会话）
+
+    只在同项目、日期相差不超过1天的未匹配支出记录中寻找匹配；
+    匹配不到时保持 pending，留给整批对账处理。
+    """
+    db = SessionLocal()
+    try:
+        spend = db.get(AdSpendDaily, spend_id)
+        if not spend or spend.status != "pending":
+            return None
+        since = lookback_start()
+        rates = get_rate_table(db)
+        return _run_recorded(db, lambda: _match_incrementally(
+            db, spend.project_id, spend_id, spend.spend_date, spend.amount_usdt, since, is_spend=True, rates=rates
+        ))
+    finally:
+        db.close()
+
+
+def reconcile_new_ledger(ledger_id: int) -> Optional[dict]:
+    """
+    新建财务记录后的增量对账（在后台任务中执行，使用独立会话）
+
+    只处理方向为支出、带项目、可以折算为 USDT 的记录，在同项目的 pending 投手日报中寻找匹配
+    （新建的记录在水位线之后，即使交易日期早于回看窗口也参与匹配）。
+    """
+    db = SessionLocal()
+    try:
+        ledger = db.get(LedgerTransaction, ledger_id)
+        if not ledger or ledger.project_id is None or ledger.direction != "expense":
+            return None
+        rates = get_rate_table(db)
+        amount_usdt = ledger_amounts_usdt([ledger], rates)[0]
+        if amount_usdt is None:
+            return None
+        since = lookback_start()
+        return _run_recorded(db, lambda: _match_incrementally(
+            db, ledger.project_id, ledger_id, ledger.tx_date, amount_usdt, since, is_spend=False, rates=rates
+        ))
+    finally:
+        db.close()
@@ -0,0 +1,151 @@
+from datetime import timedelta
+from sqlalchemy import Integer, and_, any_, bindparam, cast, column, func as sql_func, select, table
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Session
+from app.models.spend_report import AdSpendDaily
+from app.models.finance_ledger import LedgerTransaction
+from app.services.exchange_rate_service import get_rate_table
+from app.services.reconciliation_matcher import MAX_DATE_DIFF
+
+# 项目级 advisory lock 的命名空间（pg_try_advisory_xact_lock 的第一个参数）
+PROJECT_LOCK_NAMESPACE = 7301
+
+# 系统视图 pg_locks，用于查看其他会话持有的项目锁
+_pg_locks = table(
+    "pg_locks",
+    column("locktype"),
+    column("classid"),
+    column("objid"),
+    column("objsubid"),
+    column("granted"),
+    column("pid"),
+)
+
+
+def _is_postgresql(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def try_lock_projects(db: Session, project_ids) -> list:
+    """
+    一条语句尝试获取多个项目级事务锁，返回拿到锁的 project_id（升序）
+
+    锁在提交或回滚时自动释放；非 PostgreSQL 数据库不加锁，全部返回。
+    """
+    project_ids = sorted(set(project_ids))
+    if not project_ids or not _is_postgresql(db):
+        return project_ids
+    candidates = sql_func.unnest(
+        bindparam("lock_project_ids", project_ids, type_=ARRAY(Integer))
+    ).table_valued("project_id").render_derived()
+    return sorted(db.execute(
+        select(candidates.c.project_id).where(
+            sql_func.pg_try_advisory_xact_lock(PROJECT_LOCK_NAMESPACE, candidates.c.project_id)
+        )
+    ).scalars().all())
+
+
+def _busy_project_ids():
+    """其他会话当前持有项目锁的 project_id（子查询）"""
+    return select(cast(_pg_locks.c.objid, Integer)).where(
+        and_(
+            _pg_locks.c.locktype == "advisory",
+            _pg_locks.c.classid == PROJECT_LOCK_NAMESPACE,
+            _pg_locks.c.objsubid == 2,
+            _pg_locks.c.granted,
+            _pg_locks.c.pid != sql_func.pg_backend_pid()
+        )
+    )
+
+
+def claim_spends(db: Session, query, order_by: tuple, limit: int = None) -> list:
+    """
+    认领一批待对账的投手日报
+
+    1. 预览下一批记录涉及的项目（跳过其他会话持有项目锁的项目），逐个尝试加项目锁
+    2. 只在拿到锁的项目内用 SELECT ... FOR NO KEY UPDATE SKIP LOCKED 认领记录
+    多个进程同时对账时各自认领不同的项目，候选支出记录互不重叠；锁在提交或回滚时释放。
+    只修改非主键列，使用 NO KEY UPDATE 锁，不会阻塞其他事务插入对账记录时的外键检查（KEY SHARE），
+    避免互相等待死锁。非 PostgreSQL 数据库不加锁。
+    """
+    if not _is_postgresql(db):
+        query = query.order_by(*order_by)
+        return (query.limit(limit) if limit else query).all()
+
+    available = query.filter(AdSpendDaily.project_id.not_in(_busy_project_ids()))
+    while True:
+        if limit:
+            preview = available.with_entities(AdSpendDaily.project_id).order_by(*order_by).limit(limit)
+        else:
+            preview = available.with_entities(AdSpendDaily.project_id).distinct()
+        project_ids = {row.project_id for row in preview}
+        if not project_ids:
+            return []
+        locked_project_ids = try_lock_projects(db, project_ids)
+        if locked_project_ids:
+            break
+        # 预览之后这些项目刚被其他进程锁定，重新预览
+
+    claimed = query.filter(
+        AdSpendDaily.project_id.in_(locked_project_ids)
+    ).order_by(*order_by).with_for_update(skip_locked=True, key_share=True)
+    return (claimed.limit(limit) if limit else claimed).all()
+
+
+def _candidate_keys(spend) -> list:
+    """投手日报可匹配的 (project_id, tx_date)：同项目 ±1 天"""
+    return [
+        (spend.project_id, spend.spend_date + timedelta(days=offset))
+        for offset in range(-MAX_DATE_DIFF, MAX_DATE_DIFF + 1)
+    ]
+
+
+def lock_ledgers(db: Session, ledger_ids) -> set:
+    """
+    按 ID 顺序锁定一批财务记录（FOR NO KEY UPDATE SKIP LOCKED），返回拿到锁的 ID
+
+    已被其他事务锁定的记录直接跳过；非 PostgreSQL 数据库不加锁，全部返回。
+    """
+    ledger_ids = sorted(set(ledger_ids))
+    if not ledger_ids or not _is_postgresql(db):
+        return set(ledger_ids)
+    return set(db.execute(
+        select(LedgerTransaction.id).where(
+            LedgerTransaction.id == any_(bindparam("candidate_ledger_ids", ledger_ids, type_=ARRAY(Integer)))
+        ).order_by(LedgerTransaction.id).with_for_update(skip_locked=True, key_share=True)
+    ).scalars().all())
+
+
+def lock_candidate_ledgers(db: Session, spends: list, ledgers: list) -> tuple:
+    """
+    锁定已认领投手日报的候选支出记录（FOR NO KEY UPDATE SKIP LOCKED）
+
+    只锁定同项目 ±1 天、可以折算为 USDT 的记录，按 ID 顺序加锁。候选范围内有记录被其他进程（例如增量对账）
+    锁定的投手日报推迟到下次对账；其余投手日报的候选记录都已锁定，匹配结果与不加锁时完全一致。
+    非 PostgreSQL 数据库不加锁。
+    返回 (ready_spends, deferred_spends, blocked_ledger_ids)
+    """
+    if not spends or not _is_postgresql(db):
+        return spends, [], set()
+
+    wanted_keys = {key for spend in spends for key in _candidate_keys(spend)}
+    match_currencies = get_rate_table(db).currencies()
+    candidate_ids = {
+        ledger.id for ledger in ledgers
+        if ledger.currency in match_currencies and (ledger.project_id, ledger.tx_date) in wanted_keys
+    }
+    if not candidate_ids:
+        return spends, [], set()
+
+    blocked_ledger_ids = candidate_ids - lock_ledgers(db, candidate_ids)
+    if not blocked_ledger_ids:
+        return spends, [], blocked_ledger_ids
+
+    blocked_keys = {
+        (ledger.project_id, ledger.tx_date) for ledger in ledgers if ledger.id in blocked_ledger_ids
+    }
+    ready, deferred = [], []
+    for spend in spends:
+        is_blocked = any(key in blocked_keys for key in _candidate_keys(spend))
+        (deferred if is_blocked else ready).append(spend)
+    return ready, deferred, blocked_ledger_ids
@@ -0,0 +1,205 @@
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from typing import Optional
+import numpy as np
+from app.services.reconciliation_metrics import add_count
+from app.services.reconciliation_scoring import score_candidates, score_to_decimal, to_cents
+
+# 对账匹配规则
+MATCH_CURRENCY = "USDT"  # 比较金额的币种，其他币种的财务记录按汇率表折算后比较
+MAX_DATE_DIFF = 1  # 日期相差不超过1天
+MAX_AMOUNT_DIFF = Decimal("1.0")  # 金额差不超过1 USDT
+NO_CANDIDATE_AMOUNT_DIFF = Decimal("999999")  # 候选记录金额差的初始值
+MAX_AMOUNT_DIFF_CENTS = int(MAX_AMOUNT_DIFF * 100)
+
+
+def calculate_match_score(amount_diff: Decimal, date_diff: int) -> Decimal:
+    """计算匹配度（0-100），逐条计算的参考实现；批量计算见 reconciliation_scoring.score_candidates"""
+    # 金额差异越小，匹配度越高
+    amount_score = max(0, 100 - abs(float(amount_diff)) * 50)  # 每差0.02 USDT扣1分
+
+    # 日期差异越小，匹配度越高
+    date_score = max(0, 100 - abs(date_diff) * 10)  # 每差1天扣10分
+
+    # 综合匹配度（取平均值）
+    match_score = (amount_score + date_score) / 2
+    return Decimal(str(round(match_score, 2)))
+
+
+def ledger_amounts_usdt(ledgers, rates=None) -> list:
+    """
+    财务记录折合的 USDT 金额（整列一次折算）
+
+    rates 为汇率表（exchange_rate_service.RateTable），为 None 时只有 USDT 记录可以比较；
+    无法折算的记录为 None，不参与匹配。
+    """
+    if rates is None:
+        return [ledger.amount if ledger.currency == MATCH_CURRENCY else None for ledger in ledgers]
+    return rates.to_usdt(
+        [ledger.currency for ledger in ledgers],
+        [ledger.tx_date for ledger in ledgers],
+        [ledger.amount for ledger in ledgers]
+    )
+
+
+class LedgerCandidateIndex:
+    """
+    财务记录候选索引
+
+    - 按 (project_id, tx_date) 分桶，每条投手日报只需探测本项目 ±1 天的桶
+    - 每个项目维护一份按金额排序的索引，用于查找"最接近的候选记录"
+    - 金额统一使用折合的 USDT 金额（rates 为汇率表，见 ledger_amounts_usdt），无法折算的记录不参与匹配
+
+    所有查找结果与逐条遍历 ledgers 列表的结果完全一致：
+    同等条件下，列表中靠前的记录优先。
+    """
+
+    def __init__(self, ledgers, placeholder_ledger_id=None, rates=None):
+        self.ledgers = list(ledgers)
+        # 分块加载时由调用方指定全局的占位记录
+        self._placeholder_ledger_id = placeholder_ledger_id
+        # 与 ledgers 一一对应的折合 USDT 金额
+        self.amounts_usdt = ledger_amounts_usdt(self.ledgers, rates)
+
+        # (project_id, tx_date) -> [(列表位置, ledger)]，桶内按位置有序
+        self._buckets = defaultdict(list)
+        # project_id -> {金额: (列表位置, ledger)}，同金额只保留最靠前的一条
+        amounts_by_project = defaultdict(dict)
+
+        for position, ledger in enumerate(self.ledgers):
+            amount_usdt = self.amounts_usdt[position]
+            if amount_usdt is None:
+                continue
+            self._buckets[(ledger.project_id, ledger.tx_date)].append((position, ledger))
+            amounts_by_project[ledger.project_id].setdefault(amount_usdt, (position, ledger))
+
+        # project_id -> (升序金额列表, 对应的 (列表位置, ledger) 列表)
+        self._amount_index = {}
+        for project_id, entries in amounts_by_project.items():
+            amounts = sorted(entries)
+            self._amount_index[project_id] = (amounts, [entries[amount] for amount in amounts])
+
+        # 桶的数组形式：(project_id, tx_date) -> (列表位置数组, 金额(分)数组)，用于向量化过滤和打分
+        self._bucket_arrays = {}
+        for (project_id, tx_date), entries in self._buckets.items():
+            self._bucket_arrays[(project_id, tx_date)] = (
+                np.array([position for position, _ in entries], dtype=np.int64),
+                to_cents([self.amounts_usdt[position] for position, _ in entries]),
+            )
+
+    def iter_candidates(self, spend):
+        """按原列表顺序返回同项目、日期相差不超过1天、可以折算为 USDT 的财务记录"""
+        candidates = []
+        for offset in range(-MAX_DATE_DIFF, MAX_DATE_DIFF + 1):
+            key = (spend.project_id, spend.spend_date + timedelta(days=offset))
+            candidates.extend(self._buckets.get(key, ()))
+        candidates.sort(key=lambda item: item[0])
+        return [ledger for _, ledger in candidates]
+
+    def _match_block(self, spend, excluded_ledger_ids) -> tuple:
+        """
+        用数组一次过滤本项目 ±1 天的候选记录并打分
+
+        返回按原列表顺序排列的 (列表位置, amount_diffs(分), date_diffs)
+        """
+        spend_cents = int(to_cents(spend.amount_usdt))
+        positions, amount_diffs, date_diffs = [], [], []
+        examined = 0
+        for offset in range(-MAX_DATE_DIFF, MAX_DATE_DIFF + 1):
+            block = self._bucket_arrays.get((spend.project_id, spend.spend_date + timedelta(days=offset)))
+            if block is None:
+                continue
+            block_positions, block_cents = block
+            examined += block_cents.size
+            block_diffs = np.abs(block_cents - spend_cents)
+            within = block_diffs <= MAX_AMOUNT_DIFF_CENTS
+            if within.any():
+                positions.append(block_positions[within])
+                amount_diffs.append(block_diffs[within])
+                date_diffs.append(np.full(int(within.sum()), abs(offset), dtype=np.int64))
+        add_count("candidate_pairs", examined)
+        if not positions:
+            return [], np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        positions = np.concatenate(positions)
+        amount_diffs = np.concatenate(amount_diffs)
+        date_diffs = np.concatenate(date_diffs)
+
+        # 按原列表顺序排列，并跳过已经被匹配过的支出记录（满足金额条件的候选通常很少）
+        order = np.argsort(positions, kind="stable")
+        keep, kept_positions = [], []
+        for i in order:
+            position = int(positions[i])
+            if self.ledgers[position].id not in excluded_ledger_ids:
+                keep.append(i)
+                kept_positions.append(position)
+        return kept_positions, amount_diffs[keep], date_diffs[keep]
+
+    def iter_match_candidates(self, spend, excluded_ledger_ids):
+        """
+        按原列表顺序返回满足匹配条件的候选记录
+
+        每项为 (ledger, match_score, amount_diff, date_diff)
+        """
+        positions, amount_diffs, date_diffs = self._match_block(spend, excluded_ledger_ids)
+        scores, _ = score_candidates(amount_diffs, date_diffs, amounts_in_cents=True)
+        for position, score, date_diff in zip(positions, scores, date_diffs):
+            yield (
+                self.ledgers[position],
+                score_to_decimal(score),
+                abs(spend.amount_usdt - self.amounts_usdt[position]),
+                int(date_diff)
+            )
+
+    def find_best_match(self, spend, excluded_ledger_ids) -> Optional[tuple]:
+        """
+        寻找最佳匹配（匹配度最高，金额差异最小）
+
+        返回 (ledger, match_score, amount_diff, date_diff)，没有满足条件的记录时返回 None
+        """
+        positions, amount_diffs, date_diffs = self._match_block(spend, excluded_ledger_ids)
+        scores, best_index = score_candidates(amount_diffs, date_diffs, amounts_in_cents=True)
+        if best_index is None:
+            return None
+        position = positions[best_index]
+        return (
+            self.ledgers[position],
+            score_to_decimal(scores[best_index]),
+            abs(spend.amount_usdt - self.amounts_usdt[position]),
+            int(date_diffs[best_index])
+        )
+
+    def find_closest_candidate(self, spend) -> Optional[tuple]:
+        """
+        寻找同项目中金额最接近的候选记录（即使不满足匹配条件）
+
+        返回 (ledger, amount_diff, date_diff)，项目下没有可以折算为 USDT 的记录时返回 None
+        """
+        index = self._amount_index.get(spend.project_id)
+        if not index:
+            return None
+        amounts, entries = index
+
+        # 金额最接近的记录只可能是插入点两侧的记录
+        insert_at = bisect_left(amounts, spend.amount_usdt)
+        best = None
+        for i in (insert_at - 1, insert_at):
+            if 0 <= i < len(amounts):
+                amount_diff = abs(spend.amount_usdt - amounts[i])
+                position, ledger = entries[i]
+                if best is None or (amount_diff, position) < (best[0], best[1]):
+                    best = (amount_diff, position, ledger)
+
+        if best is None or best[0] >= NO_CANDIDATE_AMOUNT_DIFF:
+            return None
+        amount_diff, _, ledger = best
+        date_diff = abs((spend.spend_date - ledger.tx_date).days)
+        return ledger, amount_diff, date_diff
+
+    def placeholder_ledger_id(self):
+        """没有同项目记录时使用的占位记录 ID"""
+        if self._placeholder_ledger_id is not None:
+            return self._placeholder_ledger_id
+        return self.ledgers[0].id if self.ledgers else None
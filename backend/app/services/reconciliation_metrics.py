@@ -0,0 +1,212 @@
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional
+from sqlalchemy.orm import Session
+from app.models.reconciliation import ReconciliationRun
+
+try:
+    import resource
+except ImportError:  # Windows 上没有 resource 模块，不记录内存峰值
+    resource = None
+
+# 写入 5 可以把进程的内存峰值（VmHWM，即 ru_maxrss）重置为当前占用，只有 Linux 支持
+_CLEAR_REFS_PATH = "/proc/self/clear_refs"
+
+# 对账的各个阶段（与 reconciliation_runs 表的 *_ms 列对应）
+RUN_PHASES = ("load_spends", "load_ledgers", "match", "flush", "commit")
+
+# 运行记录中的计数项
+RUN_COUNTERS = (
+    "spends_loaded",
+    "ledgers_loaded",
+    "candidate_pairs",
+    "assignment_split_blocks",
+    "assignment_greedy_blocks",
+)
+
+# 当前上下文中正在记录的对账指标
+_current_metrics: ContextVar = ContextVar("reconciliation_run_metrics", default=None)
+
+
+class RunMetrics:
+    """
+    一次对账的各阶段耗时和计数
+
+    阶段耗时是独占时间：嵌套进入另一个阶段时，外层阶段暂停计时（例如 match 中的写入计入 flush）。
+    peak_rss_kb 为本次对账期间的内存峰值（见 reset_peak_rss），track_run() 结束时写入。
+    """
+
+    def __init__(self):
+        self.phase_seconds = dict.fromkeys(RUN_PHASES, 0.0)
+        self.counters = dict.fromkeys(RUN_COUNTERS, 0)
+        self.peak_rss_kb = None
+        self._phase = None
+        self._phase_started = None
+
+    def switch_phase(self, name: Optional[str]) -> Optional[str]:
+        """结束当前阶段的计时并切换到新阶段，返回切换前的阶段"""
+        now = time.perf_counter()
+        previous = self._phase
+        if previous is not None:
+            self.phase_seconds[previous] += now - self._phase_started
+        self._phase, self._phase_started = name, now
+        return previous
+
+    def as_dict(self) -> dict:
+        """转换为可跨进程传递的字典"""
+        return {
+            "phase_seconds": dict(self.phase_seconds),
+            "counters": dict(self.counters),
+            "peak_rss_kb": self.peak_rss_kb
+        }
+
+    def merge(self, other: dict) -> None:
+        """
+        累加子进程返回的指标
+
+        并行对账时各阶段耗时为所有子进程之和，内存峰值取主进程和各子进程中最大的一个。
+        """
+        for name, seconds in other["phase_seconds"].items():
+            self.phase_seconds[name] += seconds
+        for name, value in other["counters"].items():
+            self.counters[name] += value
+        if other.get("peak_rss_kb") is not None:
+            self.peak_rss_kb = max(self.peak_rss_kb or 0, other["peak_rss_kb"])
+
+
+@contextmanager
+def track_run():
+    """
+    在代码块内收集对账指标
+
+    用法:
+        with track_run() as metrics:
+            ...
+        print(metrics.phase_seconds)
+    """
+    metrics = RunMetrics()
+    peak_reset = reset_peak_rss()
+    token = _current_metrics.set(metrics)
+    try:
+        yield metrics
+    finally:
+        metrics.switch_phase(None)
+        if peak_reset:
+            # 合并子进程指标时可能已写入子进程的峰值
+            metrics.peak_rss_kb = max(metrics.peak_rss_kb or 0, current_peak_rss_kb())
+        _current_metrics.reset(token)
+
+
+@contextmanager
+def phase(name: str):
+    """把代码块的耗时计入指定阶段，不在 track_run() 范围内时不做任何事"""
+    metrics = _current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    previous = metrics.switch_phase(name)
+    try:
+        yield
+    finally:
+        metrics.switch_phase(previous)
+
+
+def add_count(name: str, value: int) -> None:
+    """累加计数项（已加载的投手日报/财务记录、检查过的候选对、未整块求最优分配的连通块）"""
+    metrics = _current_metrics.get()
+    if metrics is not None:
+        metrics.counters[name] += value
+
+
+def merge_metrics(other: dict) -> None:
+    """把子进程返回的指标（RunMetrics.as_dict()）累加到当前对账"""
+    metrics = _current_metrics.get()
+    if metrics is not None:
+        metrics.merge(other)
+
+
+def reset_peak_rss() -> bool:
+    """
+    把进程的内存峰值重置为当前占用，之后读到的 ru_maxrss 即为重置以来的峰值
+
+    只有 Linux 支持（写入 /proc/self/clear_refs），不支持或没有权限时返回 False。
+    峰值是整个进程共享的：同一进程中同时执行的其他对账会重置它，此时各自记录的峰值偏低。
+    """
+    if resource is None or not sys.platform.startswith("linux"):
+        return False
+    try:
+        with open(_CLEAR_REFS_PATH, "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def current_peak_rss_kb() -> int:
+    """进程的内存峰值（KB），取自 resource.getrusage，调用 reset_peak_rss() 后从重置时算起"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 上 ru_maxrss 的单位是字节，Linux 上是 KB
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def _to_ms(seconds: float) -> int:
+    return int(round(seconds * 1000))
+
+
+def record_run(
+    db: Session,
+    metrics: RunMetrics,
+    trigger: str,
+    mode: str,
+    started_at: datetime,
+    wall_seconds: float,
+    strategy: Optional[str] = None,
+    assignment: Optional[str] = None,
+    result: Optional[dict] = None,
+    error: Optional[Exception] = None,
+    sql_statement_count: Optional[int] = None
+) -> Optional[int]:
+    """
+    写入一条对账运行记录并提交，返回记录 ID
+
+    对账失败时先回滚未提交的部分再写入。运行记录只用于排查性能，
+    写入失败时回滚并返回 None，不影响对账本身的结果。
+    """
+    result = result or {}
+    run = ReconciliationRun(
+        trigger=trigger,
+        mode=mode,
+        strategy=strategy,
+        assignment=assignment,
+        status="failed" if error is not None else "success",
+        error=str(error)[:500] if error is not None else None,
+        started_at=started_at,
+        total_ms=_to_ms(wall_seconds),
+        load_spends_ms=_to_ms(metrics.phase_seconds["load_spends"]),
+        load_ledgers_ms=_to_ms(metrics.phase_seconds["load_ledgers"]),
+        match_ms=_to_ms(metrics.phase_seconds["match"]),
+        flush_ms=_to_ms(metrics.phase_seconds["flush"]),
+        commit_ms=_to_ms(metrics.phase_seconds["commit"]),
+        spends_loaded=metrics.counters["spends_loaded"],
+        ledgers_loaded=metrics.counters["ledgers_loaded"],
+        candidate_pairs=metrics.counters["candidate_pairs"],
+        assignment_split_blocks=metrics.counters["assignment_split_blocks"],
+        assignment_greedy_blocks=metrics.counters["assignment_greedy_blocks"],
+        matched_count=result.get("matched_count"),
+        unmatched_count=result.get("unmatched_count"),
+        deferred_count=result.get("deferred_count"),
+        sql_statement_count=sql_statement_count,
+        peak_rss_kb=metrics.peak_rss_kb,
+    )
+    try:
+        if error is not None:
+            db.rollback()
+        db.add(run)
+        db.commit()
+        return run.id
+    except Exception:
+        db.rollback()
+        return None
@@ -0,0 +1,191 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from typing import Optional
+from sqlalchemy import and_, create_engine, func as sql_func, select
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+from app.config import settings
+from app.db.query_counter import count_statements
+from app.models.spend_report import AdSpendDaily
+from app.models.finance_ledger import LedgerTransaction
+from app.services.exchange_rate_service import get_rate_table
+from app.services.reconciliation_matcher import LedgerCandidateIndex
+from app.services.reconciliation_locking import claim_spends, lock_candidate_ledgers, try_lock_projects
+from app.services.reconciliation_metrics import add_count, merge_metrics, phase, track_run
+from app.services.reconciliation_service import (
+    _completed_project_ids,
+    _load_matched_ledger_ids,
+    _load_placeholder_ledger_id,
+    _load_reconciliation_status,
+    _match_spends,
+)
+from app.services.reconciliation_window import (
+    advance_watermarks,
+    candidate_ledger_filter,
+    current_watermark,
+    load_late_spend_starts,
+)
+
+
+def _partition_projects(project_counts: list, shard_count: int) -> list:
+    """按待对账数量把项目均衡分配到各分片（数量大的项目优先分配到当前最轻的分片）"""
+    shards = [[] for _ in range(shard_count)]
+    loads = [0] * shard_count
+    for project_id, pending_count in sorted(project_counts, key=lambda item: (-item[1], item[0])):
+        lightest = loads.index(min(loads))
+        shards[lightest].append(project_id)
+        loads[lightest] += pending_count
+    return [shard for shard in shards if shard]
+
+
+def _reconcile_shard(
+    project_ids: list,
+    since: Optional[date],
+    assignment: str,
+    placeholder_ledger_id,
+    late_spend_starts: dict,
+    watermark: datetime
+) -> dict:
+    """
+    在子进程中对一组项目执行对账
+
+    每个子进程使用独立的引擎和会话；拿不到项目锁的项目说明正被其他对账占用，直接跳过。
+    完成的项目与对账结果在同一事务中推进水位线。
+    """
+    engine = create_engine(settings.database_url, poolclass=NullPool, pool_pre_ping=True)
+    db = Session(bind=engine, autoflush=False)
+    try:
+        with count_statements() as statements, track_run() as metrics:
+            locked_project_ids = try_lock_projects(db, project_ids)
+            skipped_project_ids = [project_id for project_id in project_ids if project_id not in locked_project_ids]
+
+            matched_count, unmatched_count, processed_spends, deferred_spends = 0, 0, [], []
+            if locked_project_ids:
+                pending_filter = and_(
+                    AdSpendDaily.status == "pending",
+                    AdSpendDaily.project_id.in_(locked_project_ids)
+                )
+                with phase("load_spends"):
+                    pending_spends = claim_spends(
+                        db, db.query(AdSpendDaily).filter(pending_filter), order_by=(AdSpendDaily.id,)
+                    )
+                    add_count("spends_loaded", len(pending_spends))
+
+                ledger_filter = and_(
+                    candidate_ledger_filter(since, late_spend_starts),
+                    LedgerTransaction.project_id.in_(locked_project_ids)
+                )
+                with phase("load_ledgers"):
+                    expense_ledgers = db.query(LedgerTransaction).filter(
+                        ledger_filter
+                    ).order_by(LedgerTransaction.id).all()
+                    add_count("ledgers_loaded", len(expense_ledgers))
+                    claimed_spends = pending_spends
+                    pending_spends, deferred_spends, blocked_ledger_ids = lock_candidate_ledgers(
+                        db, pending_spends, expense_ledgers
+                    )
+
+                    matched_ledger_ids = _load_matched_ledger_ids(
+                        db, select(LedgerTransaction.id).where(ledger_filter)
+                    ) | blocked_ledger_ids
+
+                with phase("load_spends"):
+                    reconciliation_status_by_spend = _load_reconciliation_status(
+                        db, select(AdSpendDaily.id).where(pending_filter)
+                    )
+
+                with phase("match"):
+                    ledger_index = LedgerCandidateIndex(expense_ledgers, placeholder_ledger_id, get_rate_table(db))
+                    matched_count, unmatched_count, processed_spends = _match_spends(
+                        db, pending_spends, ledger_index, matched_ledger_ids, reconciliation_status_by_spend, assignment
+                    )
+                advance_watermarks(db, _completed_project_ids(claimed_spends, deferred_spends), watermark)
+
+            # 提交同时释放项目锁
+            try:
+                with phase("commit"):
+                    db.commit()
+            except Exception:
+                db.rollback()
+                raise
+
+        return {
+            "matched_count": matched_count,
+            "unmatched_count": unmatched_count,
+            "processed_spend_ids": processed_spends,
+            "deferred_count": len(deferred_spends),
+            "skipped_project_ids": skipped_project_ids,
+            "sql_statement_count": statements.count,
+            "metrics": metrics.as_dict()
+        }
+    finally:
+        db.close()
+        engine.dispose()
+
+
+def run_parallel_reconciliation(db: Session, since: Optional[date], assignment: str, workers: int) -> dict:
+    """
+    按项目分片、多进程并行对账
+
+    匹配从不跨项目，因此各分片互不影响，结果与单进程对账一致。
+    """
+    with phase("load_spends"):
+        project_counts = db.query(
+            AdSpendDaily.project_id,
+            sql_func.count(AdSpendDaily.id)
+        ).filter(
+            AdSpendDaily.status == "pending"
+        ).group_by(AdSpendDaily.project_id).all()
+
+    # 占位记录取全部候选记录中的第一条支出记录，与单进程对账一致
+    with phase("load_ledgers"):
+        late_spend_starts = load_late_spend_starts(db, since)
+        placeholder_ledger_id = _load_placeholder_ledger_id(db, candidate_ledger_filter(since, late_spend_starts))
+    watermark = current_watermark(db)
+
+    # 结束当前事务，避免主进程的连接在子进程运行期间一直占用
+    db.commit()
+
+    shards = _partition_projects(project_counts, max(1, workers))
+
+    matched_count = 0
+    unmatched_count = 0
+    processed_spends = []
+    deferred_count = 0
+    skipped_project_ids = []
+    worker_statement_count = 0
+
+    if shards:
+        # 使用 spawn 启动子进程，避免继承父进程的数据库连接
+        with ProcessPoolExecutor(
+            max_workers=len(shards),
+            mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            futures = [
+                pool.submit(
+                    _reconcile_shard, shard, since, assignment, placeholder_ledger_id, late_spend_starts, watermark
+                )
+                for shard in shards
+            ]
+            for future in futures:
+                shard_result = future.result()
+                matched_count += shard_result["matched_count"]
+                unmatched_count += shard_result["unmatched_count"]
+                processed_spends.extend(shard_result["processed_spend_ids"])
+                deferred_count += shard_result["deferred_count"]
+                skipped_project_ids.extend(shard_result["skipped_project_ids"])
+                worker_statement_count += shard_result["sql_statement_count"]
+                merge_metrics(shard_result["metrics"])
+
+    processed_spends.sort()
+    return {
+        "matched_count": matched_count,
+        "unmatched_count": unmatched_count,
+        "total_processed": len(processed_spends),
+        "processed_spend_ids": processed_spends,
+        "deferred_count": deferred_count,
+        "shard_count": len(shards),
+        "skipped_project_ids": sorted(skipped_project_ids),
+        "worker_sql_statement_count": worker_statement_count
+    }
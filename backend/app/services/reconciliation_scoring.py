@@ -0,0 +1,45 @@
+from decimal import Decimal
+import numpy as np
+
+# 匹配度以 0.25 分为单位计算（金额差 0.01 USDT 扣 0.5 分、日期差 1 天扣 10 分，平均后都是 0.25 的整数倍），
+# 全程使用整数运算，结果与 calculate_match_score 保留两位小数后的值完全一致
+QUARTER_POINTS_PER_SIDE = 200  # 金额分、日期分各自满分 100 分 = 400 个 0.25 分，平均后各占 200
+QUARTER_POINTS_PER_DAY = 20  # 每差 1 天扣 10 分，平均后为 5 分 = 20 个 0.25 分
+
+
+def to_cents(amounts) -> np.ndarray:
+    """把金额（Decimal / float / 数组）转换为整数分"""
+    return np.rint(np.abs(np.asarray(amounts, dtype=np.float64)) * 100).astype(np.int64)
+
+
+def score_candidates(amount_diffs, date_diffs, amounts_in_cents: bool = False) -> tuple:
+    """
+    一次计算一组候选记录的匹配度，并找出最佳候选
+
+    参数:
+        amount_diffs: 金额差数组（USDT，或 amounts_in_cents=True 时为整数分）
+        date_diffs: 日期差数组（天）
+    返回:
+        (scores, best_index)：scores 为 float64 匹配度数组；
+        best_index 为匹配度最高、金额差最小、位置最靠前的候选下标，数组为空时为 None
+    """
+    amount_cents = np.abs(np.asarray(amount_diffs, dtype=np.int64)) if amounts_in_cents else to_cents(amount_diffs)
+    days = np.abs(np.asarray(date_diffs, dtype=np.int64))
+
+    quarter_points = (
+        np.maximum(0, QUARTER_POINTS_PER_SIDE - amount_cents)
+        + np.maximum(0, QUARTER_POINTS_PER_SIDE - QUARTER_POINTS_PER_DAY * days)
+    )
+    scores = quarter_points / 4
+
+    best_index = None
+    if quarter_points.size:
+        # 先取匹配度最高的候选，再在其中取金额差最小的（argmin 对相同值返回第一个）
+        top = np.flatnonzero(quarter_points == quarter_points.max())
+        best_index = int(top[np.argmin(amount_cents[top])])
+    return scores, best_index
+
+
+def score_to_decimal(score: float) -> Decimal:
+    """把向量化计算的匹配度转换为与 calculate_match_score 相同的 Decimal 表示"""
+    return Decimal(str(round(float(score), 2)))
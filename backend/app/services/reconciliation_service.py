@@ -1,183 +1,290 @@
-from datetime import date, timedelta
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
 from decimal import Decimal
+from typing import Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, or_, select, tuple_
+from app.config import settings
+from app.db.query_counter import count_statements
 from app.models.spend_report import AdSpendDaily
 from app.models.finance_ledger import LedgerTransaction
 from app.models.reconciliation import Reconciliation
+from app.services.exchange_rate_service import get_rate_table
+from app.services.reconciliation_assignment import solve_optimal_assignment
+from app.services.reconciliation_incremental import invalidate_candidate_cache
+from app.services.reconciliation_locking import claim_spends, lock_candidate_ledgers
+from app.services.reconciliation_matcher import MAX_DATE_DIFF, LedgerCandidateIndex, calculate_match_score
+from app.services.reconciliation_metrics import RunMetrics, add_count, phase, record_run, track_run
+from app.services.reconciliation_split import match_split_payments, split_match_rows
+from app.services.reconciliation_sql import run_sql_reconciliation
+from app.services.reconciliation_window import (
+    advance_watermarks,
+    candidate_ledger_filter,
+    current_watermark,
+    load_late_spend_starts,
+    lookback_start,
+)
+from app.services.reconciliation_writer import reconciliation_row, write_reconciliation_results
 
+# 对账执行策略：python 在内存中匹配；sql 在数据库中生成并排名候选对
+RECONCILE_STRATEGIES = ("python", "sql")
 
-def calculate_match_score(amount_diff: Decimal, date_diff: int) -> Decimal:
-    """计算匹配度（0-100）"""
-    # 金额差异越小，匹配度越高
-    amount_score = max(0, 100 - abs(float(amount_diff)) * 50)  # 每差0.02 USDT扣1分
-    
-    # 日期差异越小，匹配度越高
-    date_score = max(0, 100 - abs(date_diff) * 10)  # 每差1天扣10分
-    
-    # 综合匹配度（取平均值）
-    match_score = (amount_score + date_score) / 2
-    return Decimal(str(round(match_score, 2)))
+# 分配方式：greedy 按顺序逐条取最佳匹配；optimal 按连通块求全局最优分配
+RECONCILE_ASSIGNMENTS = ("greedy", "optimal")
 
 
-def run_reconciliation(db: Session) -> dict:
+class ReconciliationChunkError(Exception):
+    """分块对账中某一块提交失败；watermark 为最后一个已提交块的位置，可据此继续执行"""
+
+    def __init__(self, watermark: Optional[str], error: Exception):
+        self.watermark = watermark
+        self.error = error
+        super().__init__(f"分块对账失败（已提交到 {watermark or '起点'}）：{error}")
+
+
+def format_watermark(spend: AdSpendDaily) -> str:
+    """分块对账的断点，格式为 project_id:spend_date:id"""
+    return f"{spend.project_id}:{spend.spend_date.isoformat()}:{spend.id}"
+
+
+def parse_watermark(watermark: str) -> tuple:
+    """解析分块对账的断点"""
+    try:
+        project_id, spend_date, spend_id = watermark.split(":")
+        return int(project_id), date.fromisoformat(spend_date), int(spend_id)
+    except ValueError:
+        raise ValueError(f"无效的断点格式：{watermark}，应为 project_id:spend_date:id")
+
+
+def run_reconciliation(
+    db: Session,
+    strategy: str = "python",
+    assignment: str = "greedy",
+    chunk_size: Optional[int] = None,
+    resume_after: Optional[str] = None,
+    workers: Optional[int] = None,
+    trigger: str = "api"
+) -> dict:
     """
     执行对账逻辑
-    
+
+    参数:
+        strategy: 执行策略，python（默认）或 sql，两种策略的匹配结果一致
+        assignment: 分配方式，greedy（默认）或 optimal（匹配数量最多、总匹配度最高）
+        chunk_size: 指定后按 (project_id, spend_date) 分块流式对账，每块单独提交
+        resume_after: 分块对账的断点，从该位置之后继续
+        workers: 指定后按项目分片，用多进程并行对账
+        trigger: 触发方式，记录在运行记录中
+
+    候选财务记录为回看窗口（reconcile_lookback_days）内尚未匹配的支出记录，
+    加上各项目水位线之后新建或修改过的未匹配记录（回看窗口设为 0 时为全部未匹配记录）；对账完成的项目推进水位线。
+
+    无论成功与否，每次对账都会在 reconciliation_runs 中写入一条运行记录（各阶段耗时、
+    加载行数、候选对数量、SQL 语句数、内存峰值）。
+
     返回统计结果：
     {
         "matched_count": 匹配成功的数量,
         "unmatched_count": 匹配不成功的数量,
-        "total_processed": 处理的总数
+        "total_processed": 处理的总数,
+        "deferred_count": 候选记录被其他对账进程锁定、推迟到下次处理的数量,
+        "sql_statement_count": 本次对账发出的 SQL 语句数（并行对账时包括子进程，与运行记录一致）,
+        "assignment_split_blocks": optimal 分配时超过上限、按日期窗口切分求解的连通块数,
+        "assignment_greedy_blocks": 其中退回贪心匹配的连通块或窗口数,
+        "run_id": 运行记录 ID（写入失败时为 None）
     }
+    整批、并行和 sql 策略同时返回 processed_spend_ids；分块对账只返回数量，另外返回 chunk_count 和断点 watermark。
     """
-    # 1. 获取状态为 pending 的投手日报记录
-    pending_spends = db.query(AdSpendDaily).filter(
-        AdSpendDaily.status == "pending"
-    ).all()
+    if strategy not in RECONCILE_STRATEGIES:
+        raise ValueError(f"不支持的对账策略：{strategy}")
+    if strategy == "sql" and db.get_bind().dialect.name != "postgresql":
+        raise ValueError("sql 策略只支持 PostgreSQL")
+    if assignment not in RECONCILE_ASSIGNMENTS:
+        raise ValueError(f"不支持的分配方式：{assignment}")
+    if chunk_size is not None and strategy != "python":
+        raise ValueError("分块对账只支持 python 策略")
+    if workers is not None and (strategy != "python" or chunk_size is not None):
+        raise ValueError("并行对账只支持 python 策略，且不能与分块对账同时使用")
 
-    # 2. 获取最近7天内、方向为支出的财务记录
-    seven_days_ago = date.today() - timedelta(days=7)
-    expense_ledgers = db.query(LedgerTransaction).filter(
-        and_(
-            LedgerTransaction.direction == "expense",
-            LedgerTransaction.tx_date >= seven_days_ago
+    if workers is not None:
+        mode = "parallel"
+    elif chunk_size is not None:
+        mode = "streaming"
+    else:
+        mode = "batch"
+
+    since = lookback_start()
+    started_at = datetime.now(timezone.utc)
+    start = time.perf_counter()
+    result, error = None, None
+    # 进入 track_run() 之前出错时也能写入运行记录（指标为空）
+    statements, metrics = None, RunMetrics()
+    try:
+        with count_statements() as statements, track_run() as metrics:
+            if strategy == "sql":
+                result = run_sql_reconciliation(db, since, assignment)
+            elif workers is not None:
+                from app.services.reconciliation_parallel import run_parallel_reconciliation
+                result = run_parallel_reconciliation(db, since, assignment, workers)
+            elif chunk_size is not None:
+                result = _run_streaming_reconciliation(db, since, assignment, chunk_size, resume_after)
+            else:
+                result = _run_python_reconciliation(db, since, assignment)
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        # 整批对账改变了大量记录的状态，增量对账的候选缓存需要重新加载
+        invalidate_candidate_cache()
+        # 并行对账时包括子进程发出的语句
+        sql_statement_count = statements.count if statements is not None else 0
+        sql_statement_count += (result or {}).get("worker_sql_statement_count", 0)
+        run_id = record_run(
+            db,
+            metrics,
+            trigger=trigger,
+            mode=mode,
+            started_at=started_at,
+            wall_seconds=time.perf_counter() - start,
+            strategy=strategy,
+            assignment=assignment,
+            result=result,
+            error=error,
+            sql_statement_count=sql_statement_count
         )
-    ).all()
 
-    matched_count = 0
-    unmatched_count = 0
-    processed_spends = []
+    result["sql_statement_count"] = sql_statement_count
+    # optimal 分配时没有整块求最优解的连通块，不为 0 时说明结果可能不是全局最优
+    result["assignment_split_blocks"] = metrics.counters["assignment_split_blocks"]
+    result["assignment_greedy_blocks"] = metrics.counters["assignment_greedy_blocks"]
+    result["run_id"] = run_id
+    return result
 
-    # 获取已经匹配过的 ledger_id 列表（避免重复匹配）
-    matched_ledger_ids = set()
-    existing_reconciliations = db.query(Reconciliation).filter(
-        Reconciliation.status == "matched"
-    ).all()
-    for rec in existing_reconciliations:
-        matched_ledger_ids.add(rec.ledger_id)
 
-    # 3. 对每条投手日报记录进行匹配
-    for spend in pending_spends:
-        # 检查是否已经处理过这条 spend
-        existing_reconciliation = db.query(Reconciliation).filter(
-            Reconciliation.ad_spend_id == spend.id
-        ).first()
+def _load_placeholder_ledger_id(db: Session, ledger_filter):
+    """没有同项目候选记录时使用的占位记录：全部候选财务记录中 ID 最小的一条"""
+    return db.query(LedgerTransaction.id).filter(
+        ledger_filter
+    ).order_by(LedgerTransaction.id).limit(1).scalar()
 
-        if existing_reconciliation and existing_reconciliation.status == "matched":
-            continue  # 跳过已匹配的记录
 
-        best_match = None
-        best_match_score = Decimal("0")
-        min_amount_diff = Decimal("999999")
-        min_date_diff = 999
+def _completed_project_ids(spends: list, deferred_spends: list) -> set:
+    """本次已完成对账、可以推进水位线的项目（有投手日报被推迟的项目下次还要重新加载）"""
+    deferred_project_ids = {spend.project_id for spend in deferred_spends}
+    return {spend.project_id for spend in spends} - deferred_project_ids
 
-        # 遍历所有支出记录，寻找最佳匹配
-        for ledger in expense_ledgers:
-            # 跳过已经被匹配过的支出记录
-            if ledger.id in matched_ledger_ids:
-                continue
 
-            # 匹配规则1：project_id 相同
-            if spend.project_id != ledger.project_id:
-                continue
+def _load_matched_ledger_ids(db: Session, ledger_ids=None) -> set:
+    """获取已经匹配过的 ledger_id 列表（避免重复匹配），可用子查询限定范围"""
+    query = db.query(Reconciliation.ledger_id).filter(Reconciliation.status == "matched")
+    if ledger_ids is not None:
+        query = query.filter(Reconciliation.ledger_id.in_(ledger_ids))
+    return {rec.ledger_id for rec in query.all()}
 
-            # 匹配规则2：日期相差不超过1天
-            date_diff = abs((spend.spend_date - ledger.tx_date).days)
-            if date_diff > 1:
-                continue
 
-            # 匹配规则3：金额差不超过1 USDT
-            # 注意：ledger.amount 可能不是 USDT，需要处理币种转换
-            # 这里假设 ledger.currency == 'USDT' 时直接比较
-            if ledger.currency == 'USDT':
-                amount_diff = abs(spend.amount_usdt - ledger.amount)
-            else:
-                # 如果币种不同，跳过（需要汇率转换，这里简化处理）
-                continue
+def _load_reconciliation_status(db: Session, spend_ids) -> dict:
+    """一次性查询一批投手日报已有的对账状态，按 ad_spend_id 索引"""
+    reconciliation_status_by_spend = defaultdict(set)
+    existing_spend_reconciliations = db.query(
+        Reconciliation.ad_spend_id,
+        Reconciliation.status
+    ).filter(
+        Reconciliation.ad_spend_id.in_(spend_ids)
+    ).all()
+    for rec in existing_spend_reconciliations:
+        reconciliation_status_by_spend[rec.ad_spend_id].add(rec.status)
+    return reconciliation_status_by_spend
+
+
+def _match_spends(
+    db: Session,
+    pending_spends: list,
+    ledger_index: LedgerCandidateIndex,
+    matched_ledger_ids: set,
+    reconciliation_status_by_spend: dict,
+    assignment: str = "greedy"
+) -> tuple:
+    """
+    对一批投手日报执行匹配，并批量写入对账记录、更新匹配状态（不提交）
+
+    开启 reconcile_split_payments 时，一对一匹配之后仍未匹配的投手日报再与剩余财务记录做拆分付款匹配。
+    返回 (matched_count, unmatched_count, processed_spend_ids)
+    """
+    matched_count = 0
+    unmatched_count = 0
+    processed_spends = []
+    unmatched_spends = []
+    rows = []
 
-            if amount_diff > Decimal("1.0"):
+    optimal_matches = None
+    if assignment == "optimal":
+        # 收集所有满足硬性条件的候选对，按连通块求全局最优分配
+        candidate_pairs = {}
+        edges = []
+        for spend in pending_spends:
+            if "matched" in reconciliation_status_by_spend.get(spend.id, ()):
                 continue
+            for candidate in ledger_index.iter_match_candidates(spend, matched_ledger_ids):
+                ledger, match_score, amount_diff, _ = candidate
+                candidate_pairs[(spend.id, ledger.id)] = candidate
+                edges.append((spend.id, ledger.id, match_score, amount_diff))
+        optimal_matches = {
+            spend_id: candidate_pairs[(spend_id, ledger_id)]
+            for spend_id, ledger_id in solve_optimal_assignment(
+                edges, {spend.id: spend.spend_date for spend in pending_spends}
+            ).items()
+        }
 
-            # 计算匹配度
-            match_score = calculate_match_score(amount_diff, date_diff)
+    # 对每条投手日报记录进行匹配
+    for spend in pending_spends:
+        # 检查是否已经处理过这条 spend
+        if "matched" in reconciliation_status_by_spend.get(spend.id, ()):
+            continue  # 跳过已匹配的记录
 
-            # 选择最佳匹配（匹配度最高，金额差异最小）
-            if match_score > best_match_score or (match_score == best_match_score and amount_diff < min_amount_diff):
-                best_match = ledger
-                best_match_score = match_score
-                min_amount_diff = amount_diff
-                min_date_diff = date_diff
+        if optimal_matches is not None:
+            best = optimal_matches.get(spend.id)
+        else:
+            # 只探测本项目 ±1 天的候选记录，寻找最佳匹配
+            best = ledger_index.find_best_match(spend, matched_ledger_ids)
 
-        # 4. 创建对账记录
-        if best_match:
+        # 创建对账记录
+        if best:
             # 匹配成功
-            reconciliation = Reconciliation(
-                ad_spend_id=spend.id,
-                ledger_id=best_match.id,
-                amount_diff=min_amount_diff,
-                date_diff=min_date_diff,
-                match_score=best_match_score,
-                status="matched",
-                reason="自动匹配成功"
-            )
-            db.add(reconciliation)
+            best_match, best_match_score, min_amount_diff, min_date_diff = best
+            rows.append(reconciliation_row(
+                spend.id, best_match.id, min_amount_diff, min_date_diff, best_match_score,
+                "matched", "自动匹配成功"
+            ))
 
-            # 更新两边记录的 status 为 matched
-            spend.status = "matched"
-            best_match.status = "matched"
-            
-            # 将该 ledger 标记为已匹配
+            # 将该 ledger 标记为已匹配（两边记录的 status 在写入时批量更新）
             matched_ledger_ids.add(best_match.id)
 
             matched_count += 1
         else:
-            # 匹配不成功，创建一条空的对账记录（ledger_id 可以为空或者使用一个特殊值）
-            # 但根据模型定义，ledger_id 是必填的，所以我们需要找到一个候选记录
-            # 或者修改逻辑，先找最接近的候选记录作为参考
-            candidate_ledger = None
-            candidate_amount_diff = Decimal("999999")
-            candidate_date_diff = 999
-
-            # 寻找最接近的候选记录（即使不满足匹配条件）
-            for ledger in expense_ledgers:
-                if spend.project_id == ledger.project_id:
-                    date_diff = abs((spend.spend_date - ledger.tx_date).days)
-                    if ledger.currency == 'USDT':
-                        amount_diff = abs(spend.amount_usdt - ledger.amount)
-                        if amount_diff < candidate_amount_diff:
-                            candidate_ledger = ledger
-                            candidate_amount_diff = amount_diff
-                            candidate_date_diff = date_diff
-
-            if candidate_ledger:
+            # 匹配不成功，但根据模型定义 ledger_id 是必填的，
+            # 所以先找最接近的候选记录作为参考（即使不满足匹配条件）
+            candidate = ledger_index.find_closest_candidate(spend)
+
+            if candidate:
                 # 找到候选记录，但不符合匹配条件
-                reconciliation = Reconciliation(
-                    ad_spend_id=spend.id,
-                    ledger_id=candidate_ledger.id,
-                    amount_diff=candidate_amount_diff,
-                    date_diff=candidate_date_diff,
-                    match_score=calculate_match_score(candidate_amount_diff, candidate_date_diff),
-                    status="need_review",
-                    reason=f"自动匹配失败：金额差 {candidate_amount_diff} USDT，日期差 {candidate_date_diff} 天"
-                )
-                db.add(reconciliation)
+                candidate_ledger, candidate_amount_diff, candidate_date_diff = candidate
+                rows.append(reconciliation_row(
+                    spend.id, candidate_ledger.id, candidate_amount_diff, candidate_date_diff,
+                    calculate_match_score(candidate_amount_diff, candidate_date_diff),
+                    "need_review", f"自动匹配失败：金额差 {candidate_amount_diff} USDT，日期差 {candidate_date_diff} 天"
+                ))
+                unmatched_spends.append(spend)
                 unmatched_count += 1
             else:
                 # 如果没有找到任何候选记录（没有相同项目的支出记录），创建一条特殊的对账记录
                 # 使用第一个支出记录作为占位（如果存在）
-                if expense_ledgers:
-                    placeholder_ledger = expense_ledgers[0]
-                    reconciliation = Reconciliation(
-                        ad_spend_id=spend.id,
-                        ledger_id=placeholder_ledger.id,
-                        amount_diff=spend.amount_usdt,
-                        date_diff=999,
-                        match_score=Decimal("0"),
-                        status="need_review",
-                        reason="未找到相同项目的财务记录"
-                    )
-                    db.add(reconciliation)
+                placeholder_ledger_id = ledger_index.placeholder_ledger_id()
+                if placeholder_ledger_id is not None:
+                    rows.append(reconciliation_row(
+                        spend.id, placeholder_ledger_id, spend.amount_usdt, 999, Decimal("0"),
+                        "need_review", "未找到相同项目的财务记录"
+                    ))
                     unmatched_count += 1
                 else:
                     # 如果没有任何支出记录，跳过（不创建对账记录）
@@ -185,9 +292,76 @@ def run_reconciliation(db: Session) -> dict:
 
         processed_spends.append(spend.id)
 
+    # 一对一匹配不上的投手日报，尝试合并多条与一笔财务记录匹配，匹配成功的替换原来的 need_review 记录
+    if settings.reconcile_split_payments and unmatched_spends:
+        split_matches = match_split_payments(db, unmatched_spends, ledger_index.ledgers, matched_ledger_ids)
+        grouped_spend_ids = {spend.id for match in split_matches for spend in match.spends}
+        if grouped_spend_ids:
+            rows = [row for row in rows if row["ad_spend_id"] not in grouped_spend_ids]
+            for match in split_matches:
+                rows.extend(split_match_rows(match))
+                matched_ledger_ids.add(match.ledger.id)
+            matched_count += len(grouped_spend_ids)
+            unmatched_count -= len(grouped_spend_ids)
+
+    write_reconciliation_results(db, rows)
+    return matched_count, unmatched_count, processed_spends
+
+
+def _run_python_reconciliation(db: Session, since: Optional[date], assignment: str = "greedy") -> dict:
+    """内存匹配：加载 pending 投手日报和这些项目的候选支出记录，在 Python 中匹配"""
+    watermark = current_watermark(db)
+
+    # 1. 认领状态为 pending 的投手日报记录（按 ID 排序，保证匹配顺序稳定；跳过其他进程正在处理的记录）
+    with phase("load_spends"):
+        pending_spends = claim_spends(
+            db,
+            db.query(AdSpendDaily).filter(AdSpendDaily.status == "pending"),
+            order_by=(AdSpendDaily.id,)
+        )
+        add_count("spends_loaded", len(pending_spends))
+
+    # 2. 获取并锁定这些项目的候选支出记录（回看窗口内未匹配的记录 + 水位线之后有改动的记录）
+    with phase("load_ledgers"):
+        candidate_filter = candidate_ledger_filter(since, load_late_spend_starts(db, since))
+        placeholder_ledger_id = _load_placeholder_ledger_id(db, candidate_filter)
+        ledger_filter = and_(
+            candidate_filter,
+            LedgerTransaction.project_id.in_({spend.project_id for spend in pending_spends})
+        )
+        expense_ledgers = db.query(LedgerTransaction).filter(
+            ledger_filter
+        ).order_by(LedgerTransaction.id).all()
+        add_count("ledgers_loaded", len(expense_ledgers))
+        claimed_spends = pending_spends
+        pending_spends, deferred_spends, blocked_ledger_ids = lock_candidate_ledgers(
+            db, pending_spends, expense_ledgers
+        )
+
+        # 加锁之后再读取已匹配记录，可以看到其他进程已提交的匹配
+        matched_ledger_ids = _load_matched_ledger_ids(
+            db, select(LedgerTransaction.id).where(ledger_filter)
+        ) | blocked_ledger_ids
+
+    with phase("load_spends"):
+        reconciliation_status_by_spend = _load_reconciliation_status(
+            db, select(AdSpendDaily.id).where(AdSpendDaily.status == "pending")
+        )
+
+    # 3. 按 (project_id, tx_date) 建立候选索引（金额折算为 USDT），避免逐条遍历全部支出记录
+    with phase("match"):
+        ledger_index = LedgerCandidateIndex(expense_ledgers, placeholder_ledger_id, get_rate_table(db))
+        matched_count, unmatched_count, processed_spends = _match_spends(
+            db, pending_spends, ledger_index, matched_ledger_ids, reconciliation_status_by_spend, assignment
+        )
+
+    # 与对账结果在同一事务中推进水位线
+    advance_watermarks(db, _completed_project_ids(claimed_spends, deferred_spends), watermark)
+
     # 提交事务
     try:
-        db.commit()
+        with phase("commit"):
+            db.commit()
     except Exception as e:
         db.rollback()
         raise e
@@ -196,6 +370,144 @@ def run_reconciliation(db: Session) -> dict:
         "matched_count": matched_count,
         "unmatched_count": unmatched_count,
         "total_processed": len(processed_spends),
-        "processed_spend_ids": processed_spends
+        "processed_spend_ids": processed_spends,
+        "deferred_count": len(deferred_spends)
     }
 
+
+def _chunk_date_window(spends: list):
+    """一块投手日报的候选支出记录范围：各项目本块最早、最晚日期前后 MAX_DATE_DIFF 天内的记录"""
+    date_ranges = {}
+    for spend in spends:
+        earliest, latest = date_ranges.get(spend.project_id, (spend.spend_date, spend.spend_date))
+        date_ranges[spend.project_id] = (min(earliest, spend.spend_date), max(latest, spend.spend_date))
+    return or_(*(
+        and_(
+            LedgerTransaction.project_id == project_id,
+            LedgerTransaction.tx_date.between(
+                earliest - timedelta(days=MAX_DATE_DIFF),
+                latest + timedelta(days=MAX_DATE_DIFF)
+            )
+        )
+        for project_id, (earliest, latest) in date_ranges.items()
+    ))
+
+
+def _run_streaming_reconciliation(
+    db: Session,
+    since: Optional[date],
+    assignment: str,
+    chunk_size: int,
+    resume_after: Optional[str] = None
+) -> dict:
+    """
+    分块流式对账：内存占用与待对账总量无关
+
+    - 按 (project_id, spend_date, id) 键集分页读取 pending 投手日报
+    - 每块只加载本块各项目日期范围前后 MAX_DATE_DIFF 天内的候选支出记录
+    - 每块单独提交并返回断点，提交后清空会话中的对象；只累计数量，不保留已处理的投手日报 ID，
+      内存占用只与 chunk_size 有关，中断后从断点继续
+    - 每块用 FOR UPDATE SKIP LOCKED 认领，多个进程可同时执行，各自跳过对方锁定的记录
+    - 全部分块完成后推进已处理项目的水位线
+    匹配不跨项目，同一项目内按日期顺序处理。
+    匹配失败时作为参考的"金额最接近的记录"只在本块加载的日期范围内查找，可能与整批对账不同。
+    """
+    watermark = resume_after
+    position = parse_watermark(resume_after) if resume_after else None
+    ledger_watermark = current_watermark(db)
+    completed_project_ids = set()
+    deferred_project_ids = set()
+
+    # 占位记录取全部候选记录中的第一条支出记录，与整批对账一致
+    with phase("load_ledgers"):
+        candidate_filter = candidate_ledger_filter(since, load_late_spend_starts(db, since))
+        placeholder_ledger_id = _load_placeholder_ledger_id(db, candidate_filter)
+        rates = get_rate_table(db)
+
+    matched_count = 0
+    unmatched_count = 0
+    processed_count = 0
+    deferred_count = 0
+    chunk_count = 0
+
+    while True:
+        query = db.query(AdSpendDaily).filter(AdSpendDaily.status == "pending")
+        if position:
+            query = query.filter(
+                tuple_(AdSpendDaily.project_id, AdSpendDaily.spend_date, AdSpendDaily.id) > tuple_(*position)
+            )
+        with phase("load_spends"):
+            pending_spends = claim_spends(
+                db,
+                query,
+                order_by=(AdSpendDaily.project_id, AdSpendDaily.spend_date, AdSpendDaily.id),
+                limit=chunk_size
+            )
+            add_count("spends_loaded", len(pending_spends))
+        if not pending_spends:
+            break
+
+        # 提交后对象会过期，先记下本块的断点位置
+        last_spend = pending_spends[-1]
+        chunk_position = (last_spend.project_id, last_spend.spend_date, last_spend.id)
+        chunk_watermark = format_watermark(last_spend)
+        chunk_project_ids = {spend.project_id for spend in pending_spends}
+
+        try:
+            window_ledger_filter = and_(candidate_filter, _chunk_date_window(pending_spends))
+            with phase("load_ledgers"):
+                expense_ledgers = db.query(LedgerTransaction).filter(
+                    window_ledger_filter
+                ).order_by(LedgerTransaction.id).all()
+                add_count("ledgers_loaded", len(expense_ledgers))
+                pending_spends, deferred_spends, blocked_ledger_ids = lock_candidate_ledgers(
+                    db, pending_spends, expense_ledgers
+                )
+                deferred_project_ids.update(spend.project_id for spend in deferred_spends)
+
+                matched_ledger_ids = _load_matched_ledger_ids(
+                    db, select(LedgerTransaction.id).where(window_ledger_filter)
+                ) | blocked_ledger_ids
+
+            with phase("load_spends"):
+                reconciliation_status_by_spend = _load_reconciliation_status(
+                    db, [spend.id for spend in pending_spends]
+                )
+
+            with phase("match"):
+                ledger_index = LedgerCandidateIndex(expense_ledgers, placeholder_ledger_id, rates)
+                chunk_matched, chunk_unmatched, chunk_processed = _match_spends(
+                    db, pending_spends, ledger_index, matched_ledger_ids, reconciliation_status_by_spend, assignment
+                )
+            with phase("commit"):
+                db.commit()
+        except Exception as e:
+            db.rollback()
+            raise ReconciliationChunkError(watermark, e)
+
+        position = chunk_position
+        watermark = chunk_watermark
+
+        matched_count += chunk_matched
+        unmatched_count += chunk_unmatched
+        processed_count += len(chunk_processed)
+        deferred_count += len(deferred_spends)
+        chunk_count += 1
+        completed_project_ids.update(chunk_project_ids)
+
+        # 释放本块加载的对象，保持内存占用稳定
+        db.expunge_all()
+
+    # 分块之间项目锁会释放，只在全部分块完成后推进水位线；中途失败时保持原水位线，下次重新加载
+    advance_watermarks(db, completed_project_ids - deferred_project_ids, ledger_watermark)
+    with phase("commit"):
+        db.commit()
+
+    return {
+        "matched_count": matched_count,
+        "unmatched_count": unmatched_count,
+        "total_processed": processed_count,
+        "deferred_count": deferred_count,
+        "chunk_count": chunk_count,
+        "watermark": watermark
+    }
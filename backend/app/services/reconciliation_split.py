@@ -0,0 +1,218 @@
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from typing import Optional
+import numpy as np
+from sqlalchemy.orm import Session
+from app.models.reconciliation import Reconciliation
+from app.services.exchange_rate_service import get_rate_table
+from app.services.reconciliation_locking import lock_ledgers
+from app.services.reconciliation_matcher import (
+    MAX_AMOUNT_DIFF,
+    MAX_AMOUNT_DIFF_CENTS,
+    MAX_DATE_DIFF,
+    calculate_match_score,
+    ledger_amounts_usdt,
+)
+from app.services.reconciliation_metrics import add_count
+from app.services.reconciliation_scoring import to_cents
+from app.services.reconciliation_writer import reconciliation_row
+
+# 拆分付款匹配规则：一笔财务记录对应同项目多条投手日报（财务把几天的消耗合并打款）
+SPLIT_WINDOW_DAYS = 7  # 投手日报日期在财务交易日期之前 7 天到之后 MAX_DATE_DIFF 天之内
+SPLIT_MIN_SPENDS = 2  # 至少合并两条投手日报（单条的情况由一对一匹配处理）
+SPLIT_MAX_CANDIDATES = 24  # 每笔财务记录最多考虑的投手日报数，折半枚举每半最多 2^12 个子集
+
+
+class SplitMatch:
+    """一笔财务记录与多条投手日报的拆分付款匹配结果"""
+
+    def __init__(self, ledger, spends: list, amount_diff: Decimal):
+        self.ledger = ledger
+        self.spends = spends
+        self.amount_diff = amount_diff
+        self.group_id = uuid.uuid4().hex
+
+
+def _subset_sums(values) -> tuple:
+    """
+    枚举全部子集的和与元素个数
+
+    返回 (sums, sizes)，下标即子集的位掩码（第 k 位表示是否包含 values[k]）
+    """
+    sums = np.zeros(1, dtype=np.int64)
+    sizes = np.zeros(1, dtype=np.int64)
+    for value in values:
+        sums = np.concatenate([sums, sums + value])
+        sizes = np.concatenate([sizes, sizes + 1])
+    return sums, sizes
+
+
+def _unique_sums(sums, sizes, min_size: int) -> np.ndarray:
+    """元素个数不少于 min_size 的子集中，每个子集和只保留元素最少、位掩码最小的一个，按子集和升序返回位掩码"""
+    masks = np.flatnonzero(sizes >= min_size)
+    masks = masks[np.lexsort((masks, sizes[masks], sums[masks]))]
+    first = np.ones(masks.size, dtype=bool)
+    first[1:] = sums[masks][1:] != sums[masks][:-1]
+    return masks[first]
+
+
+def find_best_subset(
+    target_cents: int,
+    values_cents,
+    tolerance_cents: int = MAX_AMOUNT_DIFF_CENTS,
+    min_size: int = SPLIT_MIN_SPENDS
+) -> Optional[list]:
+    """
+    折半枚举（meet-in-the-middle）求和最接近目标金额的子集
+
+    参数均为整数分。两半各自枚举全部子集，右半按子集和排序后，
+    对左半每个子集二分查找最接近 target - 左半和 的右半子集。
+    在差额不超过 tolerance_cents、元素个数不少于 min_size 的子集中，
+    选差额最小、元素最少、位掩码最小的一个；返回元素下标列表，找不到时返回 None。
+    计算量为 O(2^(n/2) * n)，n 由调用方限制在 SPLIT_MAX_CANDIDATES 以内。
+    """
+    values = np.asarray(values_cents, dtype=np.int64)
+    half = values.size // 2
+    left_sums, left_sizes = _subset_sums(values[:half])
+    right_sums, right_sizes = _subset_sums(values[half:])
+
+    best_key, best_masks = None, None
+    # 右半的最少元素数取决于左半已有几个元素，按左半元素数 0、1、≥2 分三组查找
+    for left_size_group in range(min_size + 1):
+        if left_size_group < min_size:
+            left_masks = np.flatnonzero(left_sizes == left_size_group)
+        else:
+            left_masks = np.flatnonzero(left_sizes >= left_size_group)
+        right_masks = _unique_sums(right_sums, right_sizes, min_size - left_size_group)
+        if left_masks.size == 0 or right_masks.size == 0:
+            continue
+
+        sorted_right_sums = right_sums[right_masks]
+        remaining = target_cents - left_sums[left_masks]
+        insert_at = np.searchsorted(sorted_right_sums, remaining)
+        for position in (insert_at - 1, insert_at):
+            valid = (position >= 0) & (position < right_masks.size)
+            if not valid.any():
+                continue
+            candidate_left = left_masks[valid]
+            candidate_right = right_masks[position[valid]]
+            diffs = np.abs(left_sums[candidate_left] + right_sums[candidate_right] - target_cents)
+            total_sizes = left_sizes[candidate_left] + right_sizes[candidate_right]
+            within = diffs <= tolerance_cents
+            if not within.any():
+                continue
+            candidate_left, candidate_right = candidate_left[within], candidate_right[within]
+            diffs, total_sizes = diffs[within], total_sizes[within]
+            best = np.lexsort((candidate_right, candidate_left, total_sizes, diffs))[0]
+            key = (int(diffs[best]), int(total_sizes[best]), int(candidate_left[best]), int(candidate_right[best]))
+            if best_key is None or key < best_key:
+                best_key, best_masks = key, (key[2], key[3])
+
+    if best_masks is None:
+        return None
+    left_mask, right_mask = best_masks
+    return (
+        [k for k in range(half) if left_mask >> k & 1]
+        + [half + k for k in range(values.size - half) if right_mask >> k & 1]
+    )
+
+
+def _candidate_spends(ledger, amount_usdt: Decimal, spends: list) -> list:
+    """
+    同项目、日期在拆分窗口内、金额不超过财务记录金额的投手日报
+
+    超过 SPLIT_MAX_CANDIDATES 条时只保留日期最接近（再按 ID）的记录，保证每笔财务记录的计算量有上限。
+    """
+    earliest = ledger.tx_date - timedelta(days=SPLIT_WINDOW_DAYS)
+    latest = ledger.tx_date + timedelta(days=MAX_DATE_DIFF)
+    limit = amount_usdt + MAX_AMOUNT_DIFF
+    candidates = [
+        spend for spend in spends
+        if earliest <= spend.spend_date <= latest and 0 < spend.amount_usdt <= limit
+    ]
+    candidates.sort(key=lambda spend: (abs((ledger.tx_date - spend.spend_date).days), spend.id))
+    return sorted(candidates[:SPLIT_MAX_CANDIDATES], key=lambda spend: spend.id)
+
+
+def match_split_payments(db: Session, spends: list, ledgers: list, excluded_ledger_ids: set) -> list:
+    """
+    拆分付款匹配：为一对一匹配后仍未匹配的财务记录寻找合计金额相符的多条投手日报
+
+    参数:
+        spends: 一对一匹配后仍未匹配的投手日报（本次已认领）
+        ledgers: 已加载的候选财务记录，excluded_ledger_ids 中的记录（已匹配或被其他进程锁定）不参与
+    按财务记录 ID 顺序依次处理，已分组的投手日报不再参与后续分组。
+    使用前先锁定财务记录（FOR NO KEY UPDATE SKIP LOCKED）并复核尚未匹配，不修改 excluded_ledger_ids。
+    返回 SplitMatch 列表
+    """
+    spends_by_project = defaultdict(list)
+    for spend in spends:
+        spends_by_project[spend.project_id].append(spend)
+
+    # 财务记录金额折算为 USDT，无法折算的记录不参与
+    amounts_usdt = {
+        ledger.id: amount_usdt
+        for ledger, amount_usdt in zip(ledgers, ledger_amounts_usdt(ledgers, get_rate_table(db)))
+    }
+    open_ledgers = [
+        ledger for ledger in ledgers
+        if amounts_usdt[ledger.id] is not None
+        and ledger.project_id in spends_by_project
+        and ledger.id not in excluded_ledger_ids
+        and amounts_usdt[ledger.id] > 0
+    ]
+    if not open_ledgers:
+        return []
+
+    # 一对一匹配时只锁定了 ±1 天的候选记录，拆分窗口更宽，这里锁定其余记录并复核
+    locked_ids = lock_ledgers(db, [ledger.id for ledger in open_ledgers])
+    matched_ids = {
+        row.ledger_id for row in db.query(Reconciliation.ledger_id).filter(
+            Reconciliation.status == "matched",
+            Reconciliation.ledger_id.in_(sorted(locked_ids))
+        )
+    }
+
+    matches = []
+    grouped_spend_ids = set()
+    for ledger in sorted(open_ledgers, key=lambda ledger: ledger.id):
+        if ledger.id not in locked_ids or ledger.id in matched_ids:
+            continue
+        amount_usdt = amounts_usdt[ledger.id]
+        candidates = _candidate_spends(
+            ledger,
+            amount_usdt,
+            [spend for spend in spends_by_project[ledger.project_id] if spend.id not in grouped_spend_ids]
+        )
+        if len(candidates) < SPLIT_MIN_SPENDS:
+            continue
+        add_count("candidate_pairs", len(candidates))
+
+        chosen = find_best_subset(
+            int(to_cents(amount_usdt)),
+            to_cents([spend.amount_usdt for spend in candidates])
+        )
+        if chosen is None:
+            continue
+        group = [candidates[i] for i in chosen]
+        total = sum(spend.amount_usdt for spend in group)
+        matches.append(SplitMatch(ledger, group, abs(total - amount_usdt)))
+        grouped_spend_ids.update(spend.id for spend in group)
+    return matches
+
+
+def split_match_rows(match: SplitMatch) -> list:
+    """拆分付款匹配的对账结果：每条投手日报一行，共享 group_id"""
+    total = sum(spend.amount_usdt for spend in match.spends)
+    reason = f"拆分付款匹配成功：{len(match.spends)} 条投手日报合计 {total} USDT，金额差 {match.amount_diff} USDT"
+    rows = []
+    for spend in match.spends:
+        date_diff = abs((spend.spend_date - match.ledger.tx_date).days)
+        rows.append(reconciliation_row(
+            spend.id, match.ledger.id, match.amount_diff, date_diff,
+            calculate_match_score(match.amount_diff, date_diff),
+            "matched", reason, group_id=match.group_id
+        ))
+    return rows
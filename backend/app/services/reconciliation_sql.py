@@ -0,0 +1,328 @@
+from datetime import date
+from decimal import Decimal
+from itertools import groupby
+from typing import Optional
+from sqlalchemy.orm import Session
+from sqlalchemy import Integer, and_, any_, bindparam, case, func as sql_func, literal, null, select, union_all
+from sqlalchemy.dialects.postgresql import ARRAY
+from app.models.spend_report import AdSpendDaily
+from app.models.finance_ledger import LedgerTransaction
+from app.models.reconciliation import Reconciliation
+from app.models.exchange_rate import ExchangeRate
+from app.services.exchange_rate_service import BASE_CURRENCY
+from app.services.reconciliation_assignment import solve_optimal_assignment
+from app.services.reconciliation_locking import claim_spends, lock_candidate_ledgers
+from app.config import settings
+from app.services.reconciliation_metrics import add_count, phase
+from app.services.reconciliation_split import match_split_payments, split_match_rows
+from app.services.reconciliation_window import (
+    advance_watermarks,
+    candidate_ledger_filter,
+    current_watermark,
+    load_late_spend_starts,
+)
+from app.services.reconciliation_writer import reconciliation_row, write_reconciliation_results
+from app.services.reconciliation_matcher import (
+    MAX_AMOUNT_DIFF,
+    MAX_DATE_DIFF,
+    calculate_match_score,
+)
+
+# 候选行类型（同一 spend 内按此顺序返回）
+ROW_PAIR = "1_pair"  # 满足匹配条件的候选对，按优先级排名
+ROW_CLOSEST = "2_closest"  # 金额最接近的候选记录（不一定满足匹配条件）
+ROW_SPEND = "3_spend"  # 待对账的 spend 本身，ledger_id 为占位记录
+
+
+def build_candidate_query(since: Optional[date], spend_ids: list = None, late_spend_starts: dict = None):
+    """
+    构造数据库端的候选匹配查询（PostgreSQL）
+
+    spend_ids 不为空时只处理这些投手日报（本次已认领的记录）。
+    候选财务记录与内存匹配相同，见 reconciliation_window.candidate_ledger_filter。
+
+    在数据库内完成 ad_spend_daily 与 ledger_transactions 的关联：
+    - 非 USDT 财务记录按交易日期当天生效的汇率（exchange_rates 中该日期及之前最近的一条）折算为 USDT，
+      与 RateTable.to_usdt 相同保留两位小数；没有汇率的记录不参与匹配
+    - 按 project_id、日期差、金额差过滤候选对，并用窗口函数按匹配度排名
+    - 用窗口函数为每条 spend 选出金额最接近的候选记录
+    只把排名结果（ID 和差值）返回给 Python，而不是完整的 ORM 对象。
+    """
+    matched_spend_ids = select(Reconciliation.ad_spend_id).where(Reconciliation.status == "matched")
+    matched_ledger_ids = select(Reconciliation.ledger_id).where(Reconciliation.status == "matched")
+
+    spend_filter = and_(
+        AdSpendDaily.status == "pending",
+        AdSpendDaily.id.not_in(matched_spend_ids)
+    )
+    if spend_ids is not None:
+        spend_filter = and_(
+            spend_filter,
+            AdSpendDaily.id == any_(bindparam("claimed_spend_ids", spend_ids, type_=ARRAY(Integer)))
+        )
+
+    spends = select(
+        AdSpendDaily.id,
+        AdSpendDaily.project_id,
+        AdSpendDaily.spend_date,
+        AdSpendDaily.amount_usdt,
+    ).where(spend_filter).cte("pending_spends")
+
+    rate_as_of = select(ExchangeRate.rate_to_usdt).where(
+        ExchangeRate.currency == LedgerTransaction.currency,
+        ExchangeRate.rate_date <= LedgerTransaction.tx_date
+    ).order_by(ExchangeRate.rate_date.desc()).limit(1).scalar_subquery()
+    amount_usdt = case(
+        (LedgerTransaction.currency == BASE_CURRENCY, LedgerTransaction.amount),
+        else_=sql_func.round(LedgerTransaction.amount * rate_as_of, 2)
+    )
+
+    ledgers = select(
+        LedgerTransaction.id,
+        LedgerTransaction.project_id,
+        LedgerTransaction.tx_date,
+        amount_usdt.label("amount_usdt"),
+    ).where(candidate_ledger_filter(since, late_spend_starts)).cte("window_ledgers")
+
+    amount_diff = sql_func.abs(spends.c.amount_usdt - ledgers.c.amount_usdt)
+    date_diff = sql_func.abs(spends.c.spend_date - ledgers.c.tx_date)
+    # 与 calculate_match_score 相同的公式；金额精确到分，结果总是 0.25 的整数倍，不存在舍入差异
+    match_score = (
+        sql_func.greatest(0, 100 - amount_diff * 50) + sql_func.greatest(0, 100 - date_diff * 10)
+    ) / 2
+
+    # 1. 满足匹配条件的候选对：同项目、日期相差不超过1天、金额差不超过1 USDT
+    pairs = select(
+        spends.c.id.label("spend_id"),
+        literal(ROW_PAIR).label("row_type"),
+        ledgers.c.id.label("ledger_id"),
+        amount_diff.label("amount_diff"),
+        date_diff.label("date_diff"),
+        sql_func.row_number().over(
+            partition_by=spends.c.id,
+            order_by=(match_score.desc(), amount_diff.asc(), ledgers.c.id.asc())
+        ).label("candidate_rank"),
+    ).select_from(
+        spends.join(
+            ledgers,
+            and_(
+                ledgers.c.project_id == spends.c.project_id,
+                ledgers.c.amount_usdt.is_not(None),
+                ledgers.c.tx_date.between(spends.c.spend_date - MAX_DATE_DIFF, spends.c.spend_date + MAX_DATE_DIFF),
+                amount_diff <= MAX_AMOUNT_DIFF,
+            )
+        )
+    ).where(ledgers.c.id.not_in(matched_ledger_ids))
+
+    # 2. 金额最接近的候选记录（包括已匹配的记录，与内存匹配一致）
+    closest_ranked = select(
+        spends.c.id.label("spend_id"),
+        ledgers.c.id.label("ledger_id"),
+        amount_diff.label("amount_diff"),
+        date_diff.label("date_diff"),
+        sql_func.row_number().over(
+            partition_by=spends.c.id,
+            order_by=(amount_diff.asc(), ledgers.c.id.asc())
+        ).label("candidate_rank"),
+    ).select_from(
+        spends.join(
+            ledgers,
+            and_(
+                ledgers.c.project_id == spends.c.project_id,
+                ledgers.c.amount_usdt.is_not(None),
+            )
+        )
+    ).subquery("closest_ranked")
+
+    closest = select(
+        closest_ranked.c.spend_id,
+        literal(ROW_CLOSEST).label("row_type"),
+        closest_ranked.c.ledger_id,
+        closest_ranked.c.amount_diff,
+        closest_ranked.c.date_diff,
+        closest_ranked.c.candidate_rank,
+    ).where(closest_ranked.c.candidate_rank == 1)
+
+    # 3. 每条待对账的 spend，携带金额和占位记录（窗口内第一条支出记录）
+    placeholder_ledger_id = select(sql_func.min(ledgers.c.id)).scalar_subquery()
+    pending = select(
+        spends.c.id.label("spend_id"),
+        literal(ROW_SPEND).label("row_type"),
+        placeholder_ledger_id.label("ledger_id"),
+        spends.c.amount_usdt.label("amount_diff"),
+        null().label("date_diff"),
+        null().label("candidate_rank"),
+    )
+
+    combined = union_all(pairs, closest, pending).subquery("candidates")
+    return select(combined).order_by(
+        combined.c.spend_id,
+        combined.c.row_type,
+        combined.c.candidate_rank,
+    )
+
+
+def _assign_candidate_rows(rows: list, assignment: str, spend_dates: Optional[dict] = None) -> tuple:
+    """
+    按 spend_id 顺序依次为每条投手日报选择对账结果
+
+    spend_dates 为 {spend_id: 投手日报日期}，optimal 分配时用于切分过大的连通块
+
+    返回 (results, matched_count, unmatched_count, processed_spend_ids)
+    """
+    optimal_matches = None
+    if assignment == "optimal":
+        edges = [
+            (row.spend_id, row.ledger_id, calculate_match_score(row.amount_diff, row.date_diff), row.amount_diff)
+            for row in rows if row.row_type == ROW_PAIR
+        ]
+        optimal_matches = solve_optimal_assignment(edges, spend_dates)
+
+    matched_count = 0
+    unmatched_count = 0
+    processed_spends = []
+    matched_ledger_ids = set()
+    results = []
+
+    for spend_id, spend_rows in groupby(rows, key=lambda row: row.spend_id):
+        spend_rows = list(spend_rows)
+        pair_rows = [row for row in spend_rows if row.row_type == ROW_PAIR]
+        closest_row = next((row for row in spend_rows if row.row_type == ROW_CLOSEST), None)
+        spend_row = next(row for row in spend_rows if row.row_type == ROW_SPEND)
+
+        if optimal_matches is not None:
+            best = next((row for row in pair_rows if row.ledger_id == optimal_matches.get(spend_id)), None)
+        else:
+            # 按排名取第一个本次运行中尚未被占用的支出记录
+            best = next((row for row in pair_rows if row.ledger_id not in matched_ledger_ids), None)
+
+        if best:
+            results.append(reconciliation_row(
+                spend_id, best.ledger_id, best.amount_diff, best.date_diff,
+                calculate_match_score(best.amount_diff, best.date_diff),
+                "matched", "自动匹配成功"
+            ))
+            matched_ledger_ids.add(best.ledger_id)
+            matched_count += 1
+        elif closest_row:
+            # 找到候选记录，但不符合匹配条件
+            results.append(reconciliation_row(
+                spend_id, closest_row.ledger_id, closest_row.amount_diff, closest_row.date_diff,
+                calculate_match_score(closest_row.amount_diff, closest_row.date_diff),
+                "need_review", f"自动匹配失败：金额差 {closest_row.amount_diff} USDT，日期差 {closest_row.date_diff} 天"
+            ))
+            unmatched_count += 1
+        elif spend_row.ledger_id is not None:
+            # 没有相同项目的支出记录，使用占位记录
+            results.append(reconciliation_row(
+                spend_id, spend_row.ledger_id, spend_row.amount_diff, 999, Decimal("0"),
+                "need_review", "未找到相同项目的财务记录"
+            ))
+            unmatched_count += 1
+        else:
+            # 如果没有任何支出记录，跳过（不创建对账记录）
+            continue
+
+        processed_spends.append(spend_id)
+
+    return results, matched_count, unmatched_count, processed_spends
+
+
+def _apply_split_payments(db: Session, results: list, spends: list, ledgers: list, blocked_ledger_ids: set) -> tuple:
+    """对 need_review 的投手日报做拆分付款匹配，返回 (替换后的对账结果, 新匹配的投手日报数)"""
+    need_review_ids = {row["ad_spend_id"] for row in results if row["status"] == "need_review"}
+    unmatched_spends = [spend for spend in spends if spend.id in need_review_ids]
+    if not unmatched_spends:
+        return results, 0
+
+    excluded_ledger_ids = {row["ledger_id"] for row in results if row["status"] == "matched"} | blocked_ledger_ids
+    split_matches = match_split_payments(db, unmatched_spends, ledgers, excluded_ledger_ids)
+    grouped_spend_ids = {spend.id for match in split_matches for spend in match.spends}
+    if not grouped_spend_ids:
+        return results, 0
+
+    results = [row for row in results if row["ad_spend_id"] not in grouped_spend_ids]
+    for match in split_matches:
+        results.extend(split_match_rows(match))
+    return results, len(grouped_spend_ids)
+
+
+def run_sql_reconciliation(db: Session, since: Optional[date], assignment: str = "greedy") -> dict:
+    """
+    数据库端对账：候选对在 PostgreSQL 中生成和排名
+
+    Python 端只按 spend_id 顺序依次取第一个尚未被占用的候选记录，
+    与内存匹配的贪心规则完全一致；assignment="optimal" 时对候选对求全局最优分配。
+    生成候选对之前先用 FOR UPDATE SKIP LOCKED 认领投手日报并锁定候选支出记录，
+    候选范围内有记录被其他对账进程锁定的投手日报推迟到下次对账。
+    """
+    watermark = current_watermark(db)
+
+    with phase("load_spends"):
+        claimed_spends = claim_spends(
+            db,
+            db.query(
+                AdSpendDaily.id,
+                AdSpendDaily.project_id,
+                AdSpendDaily.spend_date,
+                AdSpendDaily.amount_usdt
+            ).filter(AdSpendDaily.status == "pending"),
+            order_by=(AdSpendDaily.id,)
+        )
+        add_count("spends_loaded", len(claimed_spends))
+
+    with phase("load_ledgers"):
+        late_spend_starts = load_late_spend_starts(db, since)
+        window_ledgers = db.query(
+            LedgerTransaction.id,
+            LedgerTransaction.project_id,
+            LedgerTransaction.tx_date,
+            LedgerTransaction.amount,
+            LedgerTransaction.currency
+        ).filter(
+            candidate_ledger_filter(since, late_spend_starts),
+            LedgerTransaction.project_id.in_({spend.project_id for spend in claimed_spends})
+        ).all()
+        add_count("ledgers_loaded", len(window_ledgers))
+        ready_spends, deferred_spends, blocked_ledger_ids = lock_candidate_ledgers(db, claimed_spends, window_ledgers)
+
+    # 候选对在数据库中生成和排名，计入匹配阶段；候选对数量为返回给 Python 的满足匹配条件的候选对
+    with phase("match"):
+        rows = db.execute(
+            build_candidate_query(since, [spend.id for spend in ready_spends], late_spend_starts)
+        ).all()
+        add_count("candidate_pairs", sum(1 for row in rows if row.row_type == ROW_PAIR))
+        results, matched_count, unmatched_count, processed_spends = _assign_candidate_rows(
+            rows, assignment, {spend.id: spend.spend_date for spend in ready_spends}
+        )
+
+        # 与内存匹配相同：一对一匹配不上的投手日报再做拆分付款匹配
+        if settings.reconcile_split_payments:
+            results, grouped_count = _apply_split_payments(db, results, ready_spends, window_ledgers, blocked_ledger_ids)
+            matched_count += grouped_count
+            unmatched_count -= grouped_count
+
+    # 批量写入对账结果，并更新两边记录的 status 为 matched
+    write_reconciliation_results(db, results)
+
+    # 与对账结果在同一事务中推进水位线（有投手日报被推迟的项目除外）
+    deferred_project_ids = {spend.project_id for spend in deferred_spends}
+    advance_watermarks(
+        db, {spend.project_id for spend in claimed_spends} - deferred_project_ids, watermark
+    )
+
+    # 提交事务
+    try:
+        with phase("commit"):
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
+
+    return {
+        "matched_count": matched_count,
+        "unmatched_count": unmatched_count,
+        "total_processed": len(processed_spends),
+        "processed_spend_ids": processed_spends,
+        "deferred_count": len(deferred_spends)
+    }
@@ -0,0 +1,122 @@
+from datetime import date, datetime, timedelta
+from typing import Optional
+from sqlalchemy import and_, func as sql_func, or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.models.spend_report import AdSpendDaily
+from app.models.finance_ledger import LedgerTransaction
+from app.models.reconciliation import ReconciliationWatermark
+from app.services.reconciliation_matcher import MAX_DATE_DIFF
+
+# 水位线取对账开始时的数据库时间再往前回退一段：开始前已写入但尚未提交的记录，
+# 提交后 created_at / updated_at 仍早于开始时间，回退保证这些记录下次对账时不会被漏掉
+WATERMARK_OVERLAP = timedelta(minutes=10)
+
+# 从未对账过的项目没有水位线，加载全部未匹配的支出记录
+_NO_WATERMARK = datetime(1970, 1, 1)
+
+
+def lookback_start(today: Optional[date] = None) -> Optional[date]:
+    """
+    回看窗口的起点：交易日期在此之后的未匹配财务记录每次都参与对账
+
+    reconcile_lookback_days 设为 0 时不限制回看窗口，返回 None，全部未匹配的财务记录都参与对账
+    """
+    if not settings.reconcile_lookback_days:
+        return None
+    return (today or date.today()) - timedelta(days=settings.reconcile_lookback_days)
+
+
+def load_late_spend_starts(db: Session, since: Optional[date]) -> dict:
+    """
+    迟报的投手日报：日期早于回看窗口、仍为 pending 的记录
+
+    返回 project_id -> 该项目需要额外加载的最早交易日期（最早的迟报日期往前 MAX_DATE_DIFF 天）；
+    不限制回看窗口（since 为 None）时没有迟报的记录，返回空字典
+    """
+    if since is None:
+        return {}
+    rows = db.query(
+        AdSpendDaily.project_id,
+        sql_func.min(AdSpendDaily.spend_date)
+    ).filter(
+        AdSpendDaily.status == "pending",
+        AdSpendDaily.spend_date < since + timedelta(days=MAX_DATE_DIFF)
+    ).group_by(AdSpendDaily.project_id).all()
+    return {
+        project_id: earliest - timedelta(days=MAX_DATE_DIFF)
+        for project_id, earliest in rows
+    }
+
+
+def candidate_ledger_filter(since: Optional[date], late_spend_starts: Optional[dict] = None):
+    """
+    对账候选的财务记录
+
+    方向为支出、尚未匹配；不限制回看窗口（since 为 None）时即为全部候选，否则还需满足以下任一条件：
+    - 交易日期在回看窗口内（since 之后）
+    - 在所属项目的水位线之后新建或修改过（窗口之外的旧记录有改动时也能重新参与匹配）
+    - 所属项目有迟报的投手日报，交易日期不早于该项目的 late_spend_starts
+    已匹配的记录不再加载，稳定运行时每次只读取当天新增的记录和少量仍未匹配的记录。
+    """
+    unmatched_expense = and_(
+        LedgerTransaction.direction == "expense",
+        LedgerTransaction.status.is_distinct_from("matched")
+    )
+    if since is None:
+        return unmatched_expense
+
+    project_watermark = select(ReconciliationWatermark.ledgers_synced_at).where(
+        ReconciliationWatermark.project_id == LedgerTransaction.project_id
+    ).scalar_subquery()
+    changed_at = sql_func.coalesce(LedgerTransaction.updated_at, LedgerTransaction.created_at)
+    reachable = [
+        LedgerTransaction.tx_date >= since,
+        changed_at > sql_func.coalesce(project_watermark, _NO_WATERMARK),
+    ]
+    for project_id, start in sorted((late_spend_starts or {}).items()):
+        reachable.append(and_(LedgerTransaction.project_id == project_id, LedgerTransaction.tx_date >= start))
+    return and_(unmatched_expense, or_(*reachable))
+
+
+def current_watermark(db: Session) -> datetime:
+    """本次对账的水位线（使用数据库时钟，与 created_at / updated_at 的来源一致）"""
+    return db.execute(select(sql_func.now())).scalar() - WATERMARK_OVERLAP
+
+
+def advance_watermarks(db: Session, project_ids, watermark: datetime) -> None:
+    """
+    把已完成对账的项目水位线推进到 watermark（不提交，随对账结果一起提交）
+
+    水位线只前进不后退。PostgreSQL 上用 INSERT ... ON CONFLICT 一条语句写入，
+    分块对账结束时不再持有项目锁，多个进程同时推进同一项目也不会冲突。
+    """
+    project_ids = sorted(set(project_ids))
+    if not project_ids:
+        return
+    if db.get_bind().dialect.name == "postgresql":
+        stmt = pg_insert(ReconciliationWatermark).values([
+            {"project_id": project_id, "ledgers_synced_at": watermark} for project_id in project_ids
+        ])
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[ReconciliationWatermark.project_id],
+            set_={
+                "ledgers_synced_at": sql_func.greatest(
+                    ReconciliationWatermark.ledgers_synced_at, stmt.excluded.ledgers_synced_at
+                ),
+                "updated_at": sql_func.now(),
+            }
+        ))
+        return
+
+    existing = {
+        row.project_id: row
+        for row in db.query(ReconciliationWatermark).filter(ReconciliationWatermark.project_id.in_(project_ids))
+    }
+    for project_id in project_ids:
+        row = existing.get(project_id)
+        if row is None:
+            db.add(ReconciliationWatermark(project_id=project_id, ledgers_synced_at=watermark))
+        elif row.ledgers_synced_at < watermark:
+            row.ledgers_synced_at = watermark
@@ -0,0 +1,122 @@
+import csv
+import io
+from collections import defaultdict
+from sqlalchemy import Integer, any_, bindparam, insert, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.models.spend_report import AdSpendDaily
+from app.models.finance_ledger import LedgerTransaction
+from app.models.reconciliation import Reconciliation
+from app.services.daily_rollup_service import move_spends_to_status
+from app.services.reconciliation_metrics import phase
+
+# 对账结果表写入的列（id、created_at 由数据库生成）
+RECONCILIATION_COLUMNS = (
+    "ad_spend_id", "ledger_id", "amount_diff", "date_diff", "match_score", "status", "reason", "group_id"
+)
+
+# 非 PostgreSQL 数据库上每条 UPDATE 的 IN 列表长度，保证绑定参数数量不超过上限
+UPDATE_BATCH_IDS = 4000
+
+
+def reconciliation_row(
+    ad_spend_id, ledger_id, amount_diff, date_diff, match_score, status, reason, group_id=None
+) -> dict:
+    """构造一条待写入的对账结果（列名 -> 值），拆分付款匹配的多行共享 group_id"""
+    return {
+        "ad_spend_id": ad_spend_id,
+        "ledger_id": ledger_id,
+        "amount_diff": amount_diff,
+        "date_diff": date_diff,
+        "match_score": match_score,
+        "status": status,
+        "reason": reason,
+        "group_id": group_id,
+    }
+
+
+def _is_postgresql(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def _copy_reconciliations(db: Session, rows: list) -> bool:
+    """用 COPY FROM STDIN 写入对账结果（仅 psycopg2），驱动不支持时返回 False"""
+    cursor = db.connection().connection.cursor()
+    try:
+        if not hasattr(cursor, "copy_expert"):
+            return False
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(["" if row[column] is None else row[column] for column in RECONCILIATION_COLUMNS])
+        buffer.seek(0)
+        cursor.copy_expert(
+            f"COPY {Reconciliation.__tablename__} ({', '.join(RECONCILIATION_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+        return True
+    finally:
+        cursor.close()
+
+
+def insert_reconciliations(db: Session, rows: list, use_copy: bool = None) -> int:
+    """
+    批量写入对账结果
+
+    默认使用多行 INSERT：Core insert 配合参数列表执行时，
+    SQLAlchemy 会把它渲染为 INSERT ... VALUES (...), (...) 批量语句（insertmanyvalues，每批 1000 行）；
+    PostgreSQL 上开启 reconcile_use_copy 时改用 COPY。不经过 ORM，会话中不会出现对应对象。
+    """
+    if not rows:
+        return 0
+    if use_copy is None:
+        use_copy = settings.reconcile_use_copy
+    if use_copy and _is_postgresql(db) and _copy_reconciliations(db, rows):
+        return len(rows)
+
+    db.execute(insert(Reconciliation.__table__), rows)
+    return len(rows)
+
+
+def update_statuses(db: Session, model, ids_by_status: dict) -> None:
+    """
+    按目标状态分组批量更新记录的 status
+
+    参数:
+        model: AdSpendDaily 或 LedgerTransaction 等带 status 列的模型
+        ids_by_status: {目标状态: [记录ID]}
+    PostgreSQL 上每个状态一条 UPDATE ... WHERE id = ANY(:ids)，其他数据库分批使用 IN 列表。
+    投手日报的状态是日汇总的维度之一，更新前先把这些记录移到新状态的日汇总。
+    """
+    table = model.__table__
+    for status, ids in ids_by_status.items():
+        ids = sorted(set(ids))
+        if not ids:
+            continue
+        if model is AdSpendDaily:
+            move_spends_to_status(db, ids, status)
+        if _is_postgresql(db):
+            stmt = update(table).where(
+                table.c.id == any_(bindparam("ids", type_=ARRAY(Integer)))
+            ).values(status=status)
+            db.execute(stmt, {"ids": ids})
+        else:
+            for start in range(0, len(ids), UPDATE_BATCH_IDS):
+                batch = ids[start:start + UPDATE_BATCH_IDS]
+                db.execute(update(table).where(table.c.id.in_(batch)).values(status=status))
+
+
+def write_reconciliation_results(db: Session, rows: list) -> None:
+    """写入一批对账结果，并把匹配成功的投手日报和财务记录更新为 matched（不提交）"""
+    with phase("flush"):
+        insert_reconciliations(db, rows)
+
+        spend_ids_by_status = defaultdict(list)
+        ledger_ids_by_status = defaultdict(list)
+        for row in rows:
+            if row["status"] == "matched":
+                spend_ids_by_status["matched"].append(row["ad_spend_id"])
+                ledger_ids_by_status["matched"].append(row["ledger_id"])
+        update_statuses(db, AdSpendDaily, spend_ids_by_status)
+        update_statuses(db, LedgerTransaction, ledger_ids_by_status)
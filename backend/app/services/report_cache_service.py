@@ -0,0 +1,154 @@
+import json
+import threading
+import zlib
+from collections import OrderedDict
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.db.upsert import upsert_rows
+from app.models.report_cache import ReportSnapshot
+from app.services.diagnostic_report_formatter import format_diagnostic_report
+from app.services.diagnostic_report_service import generate_diagnostic_report
+from app.services.report_dirty_service import GLOBAL_VERSION_MONTH, get_data_versions, get_dirty_months
+
+# 报表类型
+DIAGNOSTIC_REPORT = "diagnostic"
+
+
+class ReportCache:
+    """
+    进程内的报表缓存（按最近使用淘汰）
+
+    键为 (报表类型, year, month, format)，值为 (数据版本, 结果)；版本不一致的条目视为未命中。
+    同时累计命中、未命中次数，随响应返回便于观察命中率。
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple, version: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: tuple, version: str, data) -> None:
+        with self._lock:
+            self._entries[key] = (version, data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def record(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+_cache = ReportCache(settings.report_cache_size)
+
+
+def _previous_month(year: int, month: int) -> tuple:
+    if month == 1:
+        return year - 1, 12
+    return year, month - 1
+
+
+def diagnostic_data_version(db: Session, year: int, month: int) -> str:
+    """
+    诊断报告依赖的数据版本：本月、上月（ROI 对比和手续费）以及项目、投手信息的版本
+
+    任何一个变化后，缓存的诊断报告失效。月份的版本在生成月报、刷新待刷新单元时递增。
+    """
+    versions = get_data_versions(db, [(year, month), _previous_month(year, month), GLOBAL_VERSION_MONTH])
+    return ":".join(str(version) for version in versions)
+
+
+def _load_snapshot(db: Session, key: tuple, version: str):
+    report_type, year, month, report_format = key
+    snapshot = db.query(ReportSnapshot).filter(
+        ReportSnapshot.report_type == report_type,
+        ReportSnapshot.year == year,
+        ReportSnapshot.month == month,
+        ReportSnapshot.format == report_format
+    ).first()
+    if snapshot is None or snapshot.data_version != version:
+        return None
+    return json.loads(zlib.decompress(snapshot.payload).decode("utf-8"))
+
+
+def _save_snapshot(db: Session, key: tuple, version: str, data) -> None:
+    """写入报表快照并提交（同一报表已有快照时覆盖）"""
+    report_type, year, month, report_format = key
+    payload = zlib.compress(json.dumps(data, ensure_ascii=False, default=str).encode("utf-8"))
+    upsert_rows(db, ReportSnapshot, [{
+        "report_type": report_type,
+        "year": year,
+        "month": month,
+        "format": report_format,
+        "data_version": version,
+        "payload": payload
+    }], ("report_type", "year", "month", "format"))
+    try:
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
+
+
+def get_diagnostic_report(db: Session, year: int, month: int, report_format: str = "json") -> tuple:
+    """
+    返回诊断报告（report_format 为 text 时返回 {"report_text": 格式化文本}），优先使用缓存
+
+    先读一次数据版本，依次查进程内缓存、报表快照（report_snapshot_enabled 为 True 时），
+    都未命中或版本已变化时重新生成，并写回两级缓存。
+    在生成之前读取版本：生成期间数据又有变化时，缓存的条目带着旧版本，下次请求时不会命中。
+    本月或上月有待刷新单元时（投手日报、财务记录等已变化，尚未刷新月度绩效），不读也不写缓存，
+    每次重新生成；刷新这些单元后版本递增，重新开始缓存。
+    返回 (报告, 缓存信息 {"cache": "hit"/"miss", "cache_tier": "memory"/"snapshot"/None,
+    "data_version": 数据版本, "dirty": 是否有待刷新单元, "cache_stats": 进程内累计的命中统计})
+    """
+    key = (DIAGNOSTIC_REPORT, year, month, report_format)
+    version = diagnostic_data_version(db, year, month)
+    dirty = bool(get_dirty_months(db, [(year, month), _previous_month(year, month)]))
+
+    tier = "memory"
+    data = None if dirty else _cache.get(key, version)
+    if data is None and not dirty and settings.report_snapshot_enabled:
+        tier = "snapshot"
+        data = _load_snapshot(db, key, version)
+        if data is not None:
+            _cache.put(key, version, data)
+
+    hit = data is not None
+    if not hit:
+        tier = None
+        report = generate_diagnostic_report(db, year, month)
+        if report_format == "text":
+            data = {"report_text": format_diagnostic_report(report)}
+        else:
+            data = report
+        if not dirty:
+            _cache.put(key, version, data)
+            if settings.report_snapshot_enabled:
+                _save_snapshot(db, key, version, data)
+
+    _cache.record(hit)
+    return data, {
+        "cache": "hit" if hit else "miss",
+        "cache_tier": tier,
+        "data_version": version,
+        "dirty": dirty,
+        "cache_stats": _cache.stats()
+    }
@@ -0,0 +1,272 @@
+from collections import defaultdict
+from typing import Optional
+from sqlalchemy import and_, delete, event, func as sql_func, inspect, or_, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from app.models.spend_report import AdSpendDaily
+from app.models.finance_ledger import LedgerTransaction
+from app.models.operator_salary import OperatorSalary
+from app.models.project import Project
+from app.models.operator import Operator
+from app.models.exchange_rate import ExchangeRate
+from app.models.monthly_reports import MonthlyOperatorPerformance, MonthlyProjectPerformance, ReportDirtyCell
+from app.models.report_cache import ReportDataVersion
+
+# 绩效单元类型：月度项目绩效 / 月度投手绩效 / 月度渠道绩效
+PROJECT_CELL = "project"
+OPERATOR_CELL = "operator"
+CHANNEL_CELL = "channel"
+
+# 各模型中影响月度报表、诊断报告（手续费对比）的字段，只有这些字段变化时才标记
+_TRACKED_ATTRIBUTES = {
+    AdSpendDaily: ("spend_date", "project_id", "operator_id", "channel_id", "amount_usdt", "status"),
+    LedgerTransaction: ("tx_date", "project_id", "direction", "amount", "fee_amount", "currency"),
+    OperatorSalary: ("year", "month", "operator_id", "total_amount"),
+}
+
+# 报表中用到的项目、投手字段，变化时递增与月份无关的数据版本
+_DIRECTORY_ATTRIBUTES = {
+    Project: ("name",),
+    Operator: ("name", "project_id"),
+}
+
+# 汇率中影响折算的字段，变化时生效日期所在月份及之后的项目、投手绩效都要刷新（渠道绩效不涉及折算）
+_RATE_ATTRIBUTES = ("currency", "rate_date", "rate_to_usdt")
+
+# 与月份无关的数据（项目、投手信息）的版本对应的 (year, month)
+GLOBAL_VERSION_MONTH = (0, 0)
+
+# 本次 flush 收集到的待刷新单元、是否修改了项目或投手信息（session.info 中的键）
+_PENDING_CELLS_KEY = "report_dirty_cells"
+_PENDING_DIRECTORY_KEY = "report_directory_changed"
+_PENDING_RATE_DATE_KEY = "report_rate_changed_since"
+
+
+def spend_cells(project_id: int, operator_id: int, channel_id: int, spend_date) -> list:
+    """一条投手日报影响的绩效单元：所属项目、投手、渠道在消耗日期所在月份的绩效"""
+    return [
+        (PROJECT_CELL, project_id, spend_date.year, spend_date.month),
+        (OPERATOR_CELL, operator_id, spend_date.year, spend_date.month),
+        (CHANNEL_CELL, channel_id, spend_date.year, spend_date.month),
+    ]
+
+
+def _record_cells(record, values: dict) -> list:
+    """按给定的字段值计算一条记录影响的绩效单元"""
+    if isinstance(record, AdSpendDaily):
+        if values["spend_date"] is None:
+            return []
+        return spend_cells(values["project_id"], values["operator_id"], values["channel_id"], values["spend_date"])
+    if isinstance(record, LedgerTransaction):
+        if values["tx_date"] is None or values["project_id"] is None:
+            return []
+        return [(PROJECT_CELL, values["project_id"], values["tx_date"].year, values["tx_date"].month)]
+    if values["year"] is None or values["month"] is None:
+        return []
+    return [(OPERATOR_CELL, values["operator_id"], values["year"], values["month"])]
+
+
+def _current_values(record) -> dict:
+    return {name: getattr(record, name) for name in _TRACKED_ATTRIBUTES[type(record)]}
+
+
+def _changed_cells(record) -> list:
+    """
+    一条被修改的记录影响的绩效单元
+
+    修改了日期、项目等字段时，原来和现在所在的单元都要刷新；没有修改相关字段时返回空列表。
+    """
+    state = inspect(record)
+    current = _current_values(record)
+    histories = {name: state.attrs[name].history for name in current}
+    if not any(history.has_changes() for history in histories.values()):
+        return []
+    previous = {
+        name: history.deleted[0] if history.deleted else current[name]
+        for name, history in histories.items()
+    }
+    return _record_cells(record, current) + _record_cells(record, previous)
+
+
+def _dialect_insert(db):
+    dialect = db.get_bind().dialect.name if isinstance(db, Session) else db.dialect.name
+    return pg_insert if dialect == "postgresql" else sqlite_insert
+
+
+def bump_data_versions(db, months) -> None:
+    """
+    递增这些月份的报表数据版本（INSERT ... ON CONFLICT DO UPDATE，不提交）
+
+    只在重写月度绩效（生成月报、刷新待刷新单元）和修改项目、投手信息时调用，新建投手日报、财务记录时不调用，
+    避免同一月份的并发写入都等待同一行的锁。与重写的数据在同一事务中提交：读取到新版本时一定也能读取到新数据。
+    参数:
+        db: Session 或 Connection
+        months: (year, month) 的可迭代对象，GLOBAL_VERSION_MONTH 表示与月份无关的数据
+    """
+    rows = [{"year": year, "month": month, "version": 1} for year, month in sorted(set(months))]
+    if not rows:
+        return
+    table = ReportDataVersion.__table__
+    stmt = _dialect_insert(db)(table).values(rows)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["year", "month"],
+        set_={"version": table.c.version + 1, "updated_at": sql_func.now()}
+    ))
+
+
+def get_data_versions(db: Session, months: list) -> tuple:
+    """这些月份当前的报表数据版本（按 months 的顺序，从未变化过的月份为 0），一条查询"""
+    versions = dict(
+        ((row.year, row.month), row.version)
+        for row in db.query(ReportDataVersion.year, ReportDataVersion.month, ReportDataVersion.version).filter(
+            tuple_(ReportDataVersion.year, ReportDataVersion.month).in_(sorted(set(months)))
+        ).all()
+    )
+    return tuple(versions.get(month, 0) for month in months)
+
+
+def get_dirty_months(db: Session, months: list) -> set:
+    """这些月份中有待刷新单元的月份（数据已变化、月度绩效尚未刷新），一条查询"""
+    return {
+        (row.year, row.month)
+        for row in db.query(ReportDirtyCell.year, ReportDirtyCell.month).filter(
+            tuple_(ReportDirtyCell.year, ReportDirtyCell.month).in_(sorted(set(months)))
+        ).distinct().all()
+    }
+
+
+def mark_dirty_cells(db, cells) -> None:
+    """
+    标记待刷新的绩效单元（INSERT ... ON CONFLICT DO NOTHING，不提交）
+
+    单元已经标记过时不更新已有的行，同一项目、投手在同一月份的并发写入不会在这些行上互相等待。
+
+    不递增报表数据版本：有待刷新单元的月份不使用缓存的报表，刷新这些单元时再递增版本。
+
+    参数:
+        db: Session 或 Connection（在 flush 过程中使用连接写入，避免再次触发 flush）
+        cells: (entity_type, entity_id, year, month) 的可迭代对象
+    """
+    rows = [
+        {"entity_type": entity_type, "entity_id": entity_id, "year": year, "month": month}
+        for entity_type, entity_id, year, month in sorted(set(cells))
+        if entity_id is not None
+    ]
+    if not rows:
+        return
+    stmt = _dialect_insert(db)(ReportDirtyCell.__table__).values(rows)
+    db.execute(stmt.on_conflict_do_nothing(index_elements=["entity_type", "entity_id", "year", "month"]))
+
+
+def _changed_rate_dates(record) -> list:
+    """被修改的汇率影响的生效日期（修改前、后的日期），没有修改折算相关字段时返回空列表"""
+    state = inspect(record)
+    histories = [state.attrs[name].history for name in _RATE_ATTRIBUTES]
+    if not any(history.has_changes() for history in histories):
+        return []
+    rate_date_history = state.attrs["rate_date"].history
+    return [record.rate_date] + list(rate_date_history.deleted)
+
+
+def rate_cells(db, since) -> list:
+    """
+    汇率变化影响的绩效单元：since 所在月份及之后已生成的项目、投手绩效
+
+    参数:
+        db: Session 或 Connection
+        since: 发生变化的汇率中最早的生效日期
+    """
+    cells = []
+    for entity_type, model, id_column in (
+        (PROJECT_CELL, MonthlyProjectPerformance, MonthlyProjectPerformance.project_id),
+        (OPERATOR_CELL, MonthlyOperatorPerformance, MonthlyOperatorPerformance.operator_id),
+    ):
+        rows = db.execute(select(id_column, model.year, model.month).where(or_(
+            model.year > since.year,
+            and_(model.year == since.year, model.month >= since.month)
+        ))).all()
+        cells.extend((entity_type, entity_id, year, month) for entity_id, year, month in rows)
+    return cells
+
+
+def _directory_changed(record) -> bool:
+    """被修改的项目、投手是否修改了报表中用到的字段"""
+    state = inspect(record)
+    return any(state.attrs[name].history.has_changes() for name in _DIRECTORY_ATTRIBUTES[type(record)])
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_dirty_cells(session, flush_context, instances):
+    """
+    flush 前收集通过 ORM 新建、修改、删除的投手日报、财务记录、投手工资影响的绩效单元，
+    是否新建、修改、删除了报表中用到的项目、投手信息，以及变化的汇率中最早的生效日期
+    """
+    cells = set()
+    directory_changed = False
+    rate_dates = []
+    for record in session.dirty:
+        if type(record) in _TRACKED_ATTRIBUTES:
+            cells.update(_changed_cells(record))
+        elif type(record) in _DIRECTORY_ATTRIBUTES and _directory_changed(record):
+            directory_changed = True
+        elif isinstance(record, ExchangeRate):
+            rate_dates.extend(_changed_rate_dates(record))
+    for record in list(session.new) + list(session.deleted):
+        if type(record) in _TRACKED_ATTRIBUTES:
+            cells.update(_record_cells(record, _current_values(record)))
+        elif type(record) in _DIRECTORY_ATTRIBUTES:
+            directory_changed = True
+        elif isinstance(record, ExchangeRate):
+            rate_dates.append(record.rate_date)
+    if cells:
+        session.info.setdefault(_PENDING_CELLS_KEY, set()).update(cells)
+    if directory_changed:
+        session.info[_PENDING_DIRECTORY_KEY] = True
+    rate_dates = [day for day in rate_dates if day is not None]
+    if rate_dates:
+        pending = session.info.get(_PENDING_RATE_DATE_KEY)
+        session.info[_PENDING_RATE_DATE_KEY] = min(rate_dates + ([pending] if pending else []))
+
+
+@event.listens_for(Session, "after_flush")
+def _write_dirty_cells(session, flush_context):
+    """flush 写入记录后，在同一事务中标记收集到的绩效单元；修改了项目、投手信息时递增与月份无关的数据版本"""
+    cells = session.info.pop(_PENDING_CELLS_KEY, None) or set()
+    rate_since = session.info.pop(_PENDING_RATE_DATE_KEY, None)
+    if rate_since is not None:
+        cells.update(rate_cells(session.connection(), rate_since))
+    if cells:
+        mark_dirty_cells(session.connection(), cells)
+    if session.info.pop(_PENDING_DIRECTORY_KEY, False):
+        bump_data_versions(session.connection(), [GLOBAL_VERSION_MONTH])
+
+
+def claim_dirty_cells(db: Session, months: Optional[list] = None) -> list:
+    """
+    取出并删除待刷新的绩效单元（months 为 [(year, month)] 时只取这些月份，不提交）
+
+    DELETE ... RETURNING 在刷新开始时就删除这些单元，刷新失败回滚时恢复。PostgreSQL 上用
+    SELECT ... FOR UPDATE SKIP LOCKED 选出要删除的行，多个刷新请求同时执行时各自处理不同单元；
+    刷新期间新写入的记录再次标记同一单元时，ON CONFLICT DO NOTHING 会等待刷新提交，之后重新插入，不会丢失。
+    返回带 entity_type、entity_id、year、month 的行
+    """
+    ids = select(ReportDirtyCell.id)
+    if months is not None:
+        ids = ids.where(tuple_(ReportDirtyCell.year, ReportDirtyCell.month).in_(months))
+    if db.get_bind().dialect.name == "postgresql":
+        ids = ids.with_for_update(skip_locked=True)
+    return db.execute(
+        delete(ReportDirtyCell).where(ReportDirtyCell.id.in_(ids)).returning(
+            ReportDirtyCell.entity_type, ReportDirtyCell.entity_id, ReportDirtyCell.year, ReportDirtyCell.month
+        ),
+        execution_options={"synchronize_session": False}
+    ).all()
+
+
+def group_cells_by_month(cells: list) -> dict:
+    """把待刷新单元按月份分组：{(year, month): {"project": {ID}, "operator": {ID}, "channel": {ID}}}"""
+    months = defaultdict(lambda: {PROJECT_CELL: set(), OPERATOR_CELL: set(), CHANNEL_CELL: set()})
+    for cell in cells:
+        months[(cell.year, cell.month)][cell.entity_type].add(cell.entity_id)
+    return dict(months)
@@ -0,0 +1,211 @@
+import json
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.db.session import SessionLocal
+from app.models.report_job import ACTIVE_JOB_STATUSES, ReportJob
+from app.services.monthly_report_service import generate_monthly_report
+
+# 任务类型
+MONTHLY_JOB = "monthly"
+
+# 各任务类型的执行函数：(db, job) -> 可以序列化为 JSON 的结果
+_JOB_RUNNERS = {
+    MONTHLY_JOB: lambda db, job: generate_monthly_report(db, job.year, job.month),
+}
+
+# 当前进程的标识（主机名:进程号），执行任务时写入 report_jobs.worker
+_WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# 后台执行报表任务的线程池（首次提交任务时创建，与处理请求的线程池分开）
+_executor_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.report_job_workers, thread_name_prefix="report-job")
+        return _executor
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _is_stale(job: ReportJob) -> bool:
+    """未结束的任务超过 report_job_timeout_minutes 仍未完成（进程重启等导致中断）"""
+    last_active = job.started_at or job.created_at
+    if last_active is None:
+        return False
+    if last_active.tzinfo is None:
+        last_active = last_active.replace(tzinfo=timezone.utc)
+    return _now() - last_active > timedelta(minutes=settings.report_job_timeout_minutes)
+
+
+def job_to_dict(job: ReportJob) -> dict:
+    """任务的状态和结果（result 为生成结果，任务未成功时为 None）"""
+    return {
+        "id": job.id,
+        "job_type": job.job_type,
+        "year": job.year,
+        "month": job.month,
+        "status": job.status,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None
+    }
+
+
+def _active_job(db: Session, job_type: str, year: int, month: int) -> Optional[ReportJob]:
+    return db.query(ReportJob).filter(
+        ReportJob.job_type == job_type,
+        ReportJob.year == year,
+        ReportJob.month == month,
+        ReportJob.status.in_(ACTIVE_JOB_STATUSES)
+    ).first()
+
+
+def submit_report_job(db: Session, job_type: str, year: int, month: int) -> tuple:
+    """
+    提交报表任务，立即返回 (任务, 是否新建)
+
+    同一类型、同一月份已有未结束的任务时直接返回该任务，不重复生成；
+    两个请求同时提交时由部分唯一索引 uq_report_jobs_active 保证只有一个插入成功，另一个返回已插入的任务。
+    已超时的未结束任务标记为失败后重新提交。
+    """
+    for _ in range(2):
+        active = _active_job(db, job_type, year, month)
+        if active is not None and not _is_stale(active):
+            return active, False
+        if active is not None:
+            active.status = "failed"
+            active.error = "任务超时未完成（可能因进程重启中断），已重新提交"
+            active.finished_at = _now()
+
+        job = ReportJob(job_type=job_type, year=year, month=month, status="queued")
+        db.add(job)
+        try:
+            db.commit()
+        except IntegrityError:
+            # 其他请求刚刚提交了同一报表，重新查询并返回该任务
+            db.rollback()
+            continue
+        _get_executor().submit(run_report_job, job.id)
+        return job, True
+
+    return _active_job(db, job_type, year, month), False
+
+
+def submit_monthly_report_job(db: Session, year: int, month: int) -> tuple:
+    """提交月度报表生成任务，返回 (任务, 是否新建)"""
+    return submit_report_job(db, MONTHLY_JOB, year, month)
+
+
+def get_report_job(db: Session, job_id: int) -> Optional[ReportJob]:
+    return db.get(ReportJob, job_id)
+
+
+def run_report_job(job_id: int) -> None:
+    """
+    执行一个报表任务（在后台线程中执行，使用独立会话）
+
+    先把任务从 queued 改为 running（多个进程同时恢复同一任务时只有一个改成功），
+    执行完成后写入结果或失败原因；任务在执行期间被判定超时并重新提交时，不再覆盖它的状态。
+    """
+    db = SessionLocal()
+    try:
+        claimed = db.query(ReportJob).filter(
+            ReportJob.id == job_id,
+            ReportJob.status == "queued"
+        ).update({"status": "running", "started_at": _now(), "worker": _WORKER_ID}, synchronize_session=False)
+        db.commit()
+        if not claimed:
+            return
+
+        job = db.get(ReportJob, job_id)
+        try:
+            result = _JOB_RUNNERS[job.job_type](db, job)
+            values = {"status": "success", "result": json.dumps(result, ensure_ascii=False, default=str)}
+        except Exception as e:
+            db.rollback()
+            values = {"status": "failed", "error": str(e)[:500]}
+
+        db.query(ReportJob).filter(
+            ReportJob.id == job_id,
+            ReportJob.status == "running"
+        ).update({**values, "finished_at": _now()}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _worker_exited(worker: str) -> bool:
+    """
+    记录的执行进程（主机名:进程号）是否为本机上已退出的进程
+
+    进程号与当前进程相同时是上一次启动遗留的（容器中重启后进程号常常不变），同样视为已退出。
+    """
+    host, _, pid = worker.rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    if int(pid) == os.getpid():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        return False
+    return False
+
+
+def fail_orphaned_jobs() -> int:
+    """
+    服务启动时把本机已退出的进程遗留的 running 任务标记为失败，返回任务数
+
+    进程重启（崩溃、重新部署等）后这些任务不会再完成，标记失败后轮询方立即得到结果，可以重新提交。
+    其他主机上的任务和没有记录执行进程的任务不处理，仍按 report_job_timeout_minutes 判断超时。
+    """
+    db = SessionLocal()
+    try:
+        jobs = db.query(ReportJob).filter(
+            ReportJob.status == "running",
+            ReportJob.worker.like(f"{socket.gethostname()}:%")
+        ).all()
+        orphaned_ids = [job.id for job in jobs if _worker_exited(job.worker)]
+        if orphaned_ids:
+            db.query(ReportJob).filter(
+                ReportJob.id.in_(orphaned_ids),
+                ReportJob.status == "running"
+            ).update({
+                "status": "failed",
+                "error": "执行任务的进程已退出（进程重启等），任务未完成，请重新提交",
+                "finished_at": _now()
+            }, synchronize_session=False)
+            db.commit()
+        return len(orphaned_ids)
+    finally:
+        db.close()
+
+
+def resume_queued_jobs() -> int:
+    """服务启动时把尚未开始执行的任务（上次进程退出前提交的）放入线程池，返回任务数"""
+    db = SessionLocal()
+    try:
+        jobs = db.query(ReportJob).filter(ReportJob.status == "queued").order_by(ReportJob.id).all()
+        job_ids = [job.id for job in jobs if not _is_stale(job)]
+    finally:
+        db.close()
+    for job_id in job_ids:
+        _get_executor().submit(run_report_job, job_id)
+    return len(job_ids)
@@ -0,0 +1,80 @@
+"""
+匹配度计算性能对比
+对比逐条计算的 calculate_match_score 与向量化的 score_candidates，
+并校验两者在全部候选对上的结果完全一致（精确到两位小数）
+
+用法: python bench_match_score.py [候选对数量，默认 1000000]
+"""
+import sys
+import time
+from decimal import Decimal
+import numpy as np
+from app.services.reconciliation_matcher import calculate_match_score
+from app.services.reconciliation_scoring import score_candidates
+
+BLOCK_SIZE = 300  # 每个候选块的大小（约等于一条投手日报在 ±1 天内的候选记录数）
+
+
+def main():
+    pair_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    rng = np.random.default_rng(42)
+    # 金额差 0 ~ 2.50 USDT（覆盖得分为 0 的区间），日期差 0 ~ 11 天
+    amount_cents = rng.integers(0, 251, pair_count)
+    date_diffs = rng.integers(0, 12, pair_count)
+    amount_diffs = [Decimal(int(cents)) / 100 for cents in amount_cents]
+    day_list = date_diffs.tolist()
+
+    print(f"候选对数量: {pair_count}")
+    print("-" * 50)
+
+    start = time.perf_counter()
+    scalar_scores = [calculate_match_score(amount_diffs[i], day_list[i]) for i in range(pair_count)]
+    scalar_seconds = time.perf_counter() - start
+    print(f"逐条计算 calculate_match_score: {scalar_seconds:.3f} 秒")
+
+    score_candidates(amount_cents[:BLOCK_SIZE], date_diffs[:BLOCK_SIZE], amounts_in_cents=True)  # 预热
+    start = time.perf_counter()
+    vector_scores, _ = score_candidates(amount_cents, date_diffs, amounts_in_cents=True)
+    vector_seconds = time.perf_counter() - start
+    print(f"向量化 score_candidates（整批）: {vector_seconds:.3f} 秒，加速 {scalar_seconds / vector_seconds:.0f} 倍")
+
+    start = time.perf_counter()
+    block_best = []
+    for block_start in range(0, pair_count, BLOCK_SIZE):
+        block_end = block_start + BLOCK_SIZE
+        _, best_index = score_candidates(
+            amount_cents[block_start:block_end], date_diffs[block_start:block_end], amounts_in_cents=True
+        )
+        block_best.append(block_start + best_index)
+    block_seconds = time.perf_counter() - start
+    print(f"向量化 score_candidates（每块 {BLOCK_SIZE} 条，含 argmax）: {block_seconds:.3f} 秒")
+
+    # 校验：匹配度精确到两位小数一致
+    mismatches = sum(
+        1 for scalar, vector in zip(scalar_scores, vector_scores.tolist())
+        if scalar != Decimal(str(round(vector, 2)))
+    )
+
+    # 校验：每块的最佳候选与逐条比较的结果一致（匹配度最高，金额差最小，位置最靠前）
+    best_mismatches = 0
+    for block_number, block_start in enumerate(range(0, pair_count, BLOCK_SIZE)):
+        best = None
+        for i in range(block_start, min(block_start + BLOCK_SIZE, pair_count)):
+            if best is None or scalar_scores[i] > scalar_scores[best] or (
+                scalar_scores[i] == scalar_scores[best] and amount_diffs[i] < amount_diffs[best]
+            ):
+                best = i
+        if best != block_best[block_number]:
+            best_mismatches += 1
+
+    print("-" * 50)
+    if mismatches == 0 and best_mismatches == 0:
+        print("[OK] 两种实现的匹配度和最佳候选完全一致")
+        return True
+    print(f"[ERROR] 匹配度不一致 {mismatches} 条，最佳候选不一致 {best_mismatches} 块")
+    return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,40 @@
+"""
+重建日汇总表
+从 ad_spend_daily / ledger_transactions 重新汇总 daily_spend_rollup / daily_ledger_rollup，
+用于首次上线或修复增量维护产生的偏差
+
+用法: python rebuild_daily_rollups.py [开始日期 YYYY-MM-DD] [结束日期 YYYY-MM-DD，不含]
+不传日期时重建全部
+"""
+import sys
+import time
+from datetime import date
+from app.db.session import SessionLocal
+from app.services.daily_rollup_service import rebuild_daily_rollups
+
+
+def main():
+    start_date = date.fromisoformat(sys.argv[1]) if len(sys.argv) > 1 else None
+    end_date = date.fromisoformat(sys.argv[2]) if len(sys.argv) > 2 else None
+    print(f"重建范围: {start_date or '最早'} ~ {end_date or '最新'}")
+    print("-" * 50)
+
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        result = rebuild_daily_rollups(db, start_date, end_date)
+        db.commit()
+        print(f"[OK] 投手日报日汇总 {result['spend_rows']} 行，财务记录日汇总 {result['ledger_rows']} 行，"
+              f"耗时 {time.perf_counter() - start:.2f} 秒")
+        return True
+    except Exception as e:
+        db.rollback()
+        print(f"[ERROR] 重建失败: {e}")
+        return False
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,29 @@
+"""诊断报告"""
+from app.db.query_counter import count_statements
+from app.services.diagnostic_report_service import generate_diagnostic_report
+from app.services.monthly_report_service import generate_monthly_report
+from conftest import reset_database, seed_report_months
+
+MONTHS = [(2025, 1), (2025, 2)]
+
+
+def _count_report_statements(db, project_count: int) -> tuple:
+    db.rollback()
+    reset_database()
+    seed_report_months(db, project_count, MONTHS)
+    for year, month in MONTHS:
+        generate_monthly_report(db, year, month)
+    db.expire_all()
+    with count_statements() as statements:
+        report = generate_diagnostic_report(db, *MONTHS[-1])
+    return statements.count, report
+
+
+def test_statement_count_does_not_grow_with_data(db):
+    small_count, small_report = _count_report_statements(db, 3)
+    large_count, large_report = _count_report_statements(db, 12)
+
+    # 数据量增大 4 倍，查询数不变（项目、投手、手续费、日报数都是批量查询）
+    assert len(large_report["operator_analysis"]) > len(small_report["operator_analysis"])
+    assert small_count == large_count
+    assert large_count <= 10
@@ -0,0 +1,61 @@
+"""汇率表在报表中的使用"""
+from datetime import date
+from decimal import Decimal
+import pytest
+from app.models import ExchangeRate, MonthlyProjectPerformance, ReportDirtyCell
+from app.services.daily_rollup_service import rebuild_daily_rollups
+from app.services.diagnostic_report_service import generate_diagnostic_report
+from app.services.monthly_report_service import generate_monthly_report, refresh_dirty_cells
+from conftest import make_ledger, make_spend, seed_directory
+
+MONTHS = [(2025, 1), (2025, 2)]
+
+
+def _seed_months(db, cny_rate: str) -> None:
+    """项目 1 两个月消耗相同、2 月收入下降；1 月手续费 100 USDT，2 月手续费 700 CNY"""
+    seed_directory(db)
+    db.add(ExchangeRate(currency="CNY", rate_date=date(2024, 1, 1), rate_to_usdt=Decimal(cny_rate)))
+    db.add(make_spend(date(2025, 1, 10), "1000.00", operator_id=1, channel_id=1, status="matched"))
+    db.add(make_spend(date(2025, 2, 10), "1000.00", operator_id=1, channel_id=1, status="matched"))
+    db.add(make_ledger(date(2025, 1, 12), "2000.00", direction="income", fee_amount=Decimal("100")))
+    db.add(make_ledger(date(2025, 2, 12), "1200.00", direction="income"))
+    db.add(make_ledger(date(2025, 2, 13), "1.00", currency="CNY", fee_amount=Decimal("700")))
+    db.commit()
+    rebuild_daily_rollups(db)
+    db.commit()
+    for year, month in MONTHS:
+        generate_monthly_report(db, year, month)
+
+
+@pytest.mark.parametrize("cny_rate, fee_reason", [
+    ("0.14285714", None),
+    ("0.2", "手续费上升40.0%"),
+])
+def test_diagnostic_fees_converted_to_usdt(db, cny_rate, fee_reason):
+    _seed_months(db, cny_rate)
+
+    report = generate_diagnostic_report(db, 2025, 2)
+    [declining] = report["roi_declining_projects"]
+    fee_reasons = [reason for reason in declining["reasons"] if reason.startswith("手续费")]
+    # 700 CNY 按汇率折算后与上月的 100 USDT 比较，而不是直接与 100 相加比较
+    assert fee_reasons == ([fee_reason] if fee_reason else [])
+
+
+def test_rate_change_marks_months_from_rate_date_dirty(db):
+    _seed_months(db, "0.14285714")
+    assert db.query(ReportDirtyCell).count() == 0
+
+    db.add(ExchangeRate(currency="CNY", rate_date=date(2025, 2, 20), rate_to_usdt=Decimal("0.2")))
+    db.commit()
+    dirty = {(cell.entity_type, cell.entity_id, cell.year, cell.month) for cell in db.query(ReportDirtyCell).all()}
+    assert dirty == {("project", 1, 2025, 2), ("operator", 1, 2025, 2)}
+
+    refresh_dirty_cells(db)
+    db.expire_all()
+    february = db.query(MonthlyProjectPerformance).filter(
+        MonthlyProjectPerformance.project_id == 1,
+        MonthlyProjectPerformance.year == 2025,
+        MonthlyProjectPerformance.month == 2
+    ).one()
+    # 2 月月末按新汇率 1 USDT = 5 CNY 折算
+    assert february.total_spend_cny == Decimal("5000.00")
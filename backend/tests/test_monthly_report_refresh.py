@@ -0,0 +1,81 @@
+"""月度绩效待刷新单元的增量刷新"""
+from datetime import date, datetime
+from decimal import Decimal
+from app.models import (
+    AdSpendDaily,
+    MonthlyOperatorPerformance,
+    MonthlyProjectPerformance,
+    OperatorSalary,
+    ReportDirtyCell,
+)
+from app.services.daily_rollup_service import move_spends_to_status, rebuild_daily_rollups
+from app.services.monthly_report_service import generate_monthly_report, refresh_dirty_cells
+from app.services.report_dirty_service import PROJECT_CELL, mark_dirty_cells
+from conftest import seed_directory
+
+YEAR, MONTH = 2024, 10
+
+
+def _seed_month(db) -> int:
+    """项目 1 / 投手 1 在本月只有一条已匹配的投手日报和一条工资记录，生成月报后返回投手日报 ID"""
+    seed_directory(db)
+    spend = AdSpendDaily(
+        spend_date=date(YEAR, MONTH, 15), project_id=1, operator_id=1, channel_id=1,
+        platform="facebook", amount_usdt=Decimal("100.00"), status="matched"
+    )
+    db.add(spend)
+    db.add(OperatorSalary(
+        operator_id=1, year=YEAR, month=MONTH, salary_amount=Decimal("3000"), total_amount=Decimal("3000")
+    ))
+    db.commit()
+    rebuild_daily_rollups(db)
+    db.commit()
+    generate_monthly_report(db, YEAR, MONTH)
+    assert db.query(ReportDirtyCell).count() == 0
+    return spend.id
+
+
+def _performance(db, model, id_column, entity_id: int):
+    db.expire_all()
+    return db.query(model).filter(id_column == entity_id, model.year == YEAR, model.month == MONTH).one()
+
+
+def test_refresh_zeroes_cells_without_remaining_data(db):
+    spend_id = _seed_month(db)
+    project = _performance(db, MonthlyProjectPerformance, MonthlyProjectPerformance.project_id, 1)
+    assert project.total_spend_usdt == Decimal("100.00")
+
+    # 唯一的消耗记录退回 pending、工资记录删除后，项目和投手本月都没有数据
+    move_spends_to_status(db, [spend_id], "pending")
+    db.query(AdSpendDaily).filter(AdSpendDaily.id == spend_id).update({"status": "pending"}, synchronize_session=False)
+    db.delete(db.query(OperatorSalary).one())
+    db.commit()
+    assert db.query(ReportDirtyCell).count() > 0
+
+    result = refresh_dirty_cells(db)
+    assert result["months"] == [f"{YEAR:04d}-{MONTH:02d}"]
+    assert db.query(ReportDirtyCell).count() == 0
+
+    project = _performance(db, MonthlyProjectPerformance, MonthlyProjectPerformance.project_id, 1)
+    assert project.total_spend_usdt == 0
+    assert project.total_income_usdt == 0
+    assert project.net_profit_cny == 0
+
+    operator = _performance(db, MonthlyOperatorPerformance, MonthlyOperatorPerformance.operator_id, 1)
+    assert operator.total_spend_usdt == 0
+    assert operator.salary_cost_cny == 0
+    assert operator.total_cost_cny == 0
+
+
+def test_marking_existing_cell_leaves_row_untouched(db):
+    cell = (PROJECT_CELL, 1, YEAR, MONTH)
+    mark_dirty_cells(db, [cell])
+    db.query(ReportDirtyCell).update({"marked_at": datetime(2024, 1, 1)}, synchronize_session=False)
+    db.commit()
+
+    # 已标记的单元再次标记时 ON CONFLICT DO NOTHING，不更新（不锁定）已有的行
+    mark_dirty_cells(db, [cell])
+    db.commit()
+    db.expire_all()
+    [row] = db.query(ReportDirtyCell).all()
+    assert row.marked_at.replace(tzinfo=None) == datetime(2024, 1, 1)
@@ -0,0 +1,80 @@
+"""optimal 分配：连通块切分和超过上限时的处理"""
+from datetime import date, timedelta
+from decimal import Decimal
+import pytest
+from app.services import reconciliation_assignment
+from app.services.reconciliation_assignment import _greedy_block, solve_optimal_assignment
+from app.services.reconciliation_metrics import track_run
+
+START = date(2024, 11, 1)
+
+
+def _chain_edges(days: int) -> tuple:
+    """
+    同一项目连续 days 天，每天两条投手日报 a、b 和两笔财务记录 x、y：
+    a 与 x（100 分）、y（99 分）匹配，b 与当天的 x（99 分）、次日的 x（90 分）匹配，整体是一个连通块。
+    最优分配为 a -> y、b -> x；按顺序贪心匹配时 a 先取走 x，b 只能取次日的 x。
+    """
+    edges, spend_dates = [], {}
+    for day in range(days):
+        a, b, x, y, next_x = 4 * day, 4 * day + 1, 4 * day + 2, 4 * day + 3, 4 * day + 6
+        spend_dates[a] = spend_dates[b] = START + timedelta(days=day)
+        edges.append((a, x, Decimal("100"), Decimal("0")))
+        edges.append((a, y, Decimal("99"), Decimal("0.02")))
+        edges.append((b, x, Decimal("99"), Decimal("0.02")))
+        if day + 1 < days:
+            edges.append((b, next_x, Decimal("90"), Decimal("0")))
+    return edges, spend_dates
+
+
+def _total_score(edges: list, assignment: dict) -> Decimal:
+    scores = {(edge[0], edge[1]): edge[2] for edge in edges}
+    return sum(scores[pair] for pair in assignment.items())
+
+
+@pytest.fixture
+def small_block_limit(monkeypatch):
+    """调低候选对上限，用较小的数据覆盖多个窗口"""
+    monkeypatch.setattr(reconciliation_assignment, "MAX_ASSIGNMENT_BLOCK_EDGES", 100)
+
+
+def test_small_blocks_are_solved_optimally():
+    edges = [
+        (1, 10, Decimal("100"), Decimal("0")),
+        (1, 11, Decimal("99"), Decimal("0")),
+        (2, 10, Decimal("98"), Decimal("0")),
+    ]
+    with track_run() as metrics:
+        assert solve_optimal_assignment(edges) == {1: 11, 2: 10}
+    assert metrics.counters["assignment_split_blocks"] == 0
+    assert metrics.counters["assignment_greedy_blocks"] == 0
+
+
+def test_oversized_block_is_split_by_date_window(small_block_limit):
+    edges, spend_dates = _chain_edges(days=100)
+
+    with track_run() as metrics:
+        assignment = solve_optimal_assignment(edges, spend_dates)
+    assert metrics.counters["assignment_split_blocks"] == 1
+    assert metrics.counters["assignment_greedy_blocks"] == 0
+
+    # 每条财务记录最多分配一次，且只使用候选对
+    assert len(set(assignment.values())) == len(assignment)
+    assert set(assignment.items()) <= {(edge[0], edge[1]) for edge in edges}
+
+    # 按窗口求解的结果与整块最优解（a -> y、b -> x）相同，优于贪心匹配
+    expected = {}
+    for day in range(100):
+        expected[4 * day] = 4 * day + 3
+        expected[4 * day + 1] = 4 * day + 2
+    assert assignment == expected
+    assert _total_score(edges, assignment) > _total_score(edges, _greedy_block(edges))
+
+
+def test_oversized_block_without_dates_falls_back_to_greedy(small_block_limit):
+    edges, _ = _chain_edges(days=100)
+    with track_run() as metrics:
+        assignment = solve_optimal_assignment(edges)
+    assert assignment == _greedy_block(edges)
+    assert metrics.counters["assignment_split_blocks"] == 1
+    assert metrics.counters["assignment_greedy_blocks"] == 1
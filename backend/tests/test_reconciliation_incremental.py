@@ -0,0 +1,61 @@
+"""新建记录后的增量对账"""
+from datetime import date, timedelta
+from decimal import Decimal
+from app.models import AdSpendDaily, LedgerTransaction, Reconciliation
+from app.services import reconciliation_incremental
+from app.services.reconciliation_incremental import reconcile_new_spend
+from conftest import make_ledger, make_spend, seed_directory
+
+DAY = date.today() - timedelta(days=2)
+
+
+def _warm_cache(db) -> int:
+    """写入一笔财务记录，并用一条匹配不上的投手日报加载项目 1 的候选缓存，返回财务记录 ID"""
+    seed_directory(db)
+    ledger = make_ledger(DAY, "100.00")
+    spend = make_spend(DAY, "500.00")
+    db.add_all([ledger, spend])
+    db.commit()
+    assert reconcile_new_spend(spend.id) is None
+    assert 1 in reconciliation_incremental._candidate_cache
+    return ledger.id
+
+
+def _add_spend(db, amount: str) -> int:
+    spend = make_spend(DAY, amount)
+    db.add(spend)
+    db.commit()
+    return spend.id
+
+
+def test_claim_recomputes_changed_amount(db):
+    ledger_id = _warm_cache(db)
+    # 缓存加载之后修改金额，缓存中仍是 100.00
+    db.get(LedgerTransaction, ledger_id).amount = Decimal("100.50")
+    db.commit()
+
+    spend_id = _add_spend(db, "100.00")
+    result = reconcile_new_spend(spend_id)
+    assert result == {"ad_spend_id": spend_id, "ledger_id": ledger_id, "match_score": Decimal("87.5")}
+
+    db.expire_all()
+    rec = db.query(Reconciliation).filter(Reconciliation.ad_spend_id == spend_id).one()
+    assert rec.status == "matched"
+    assert Decimal(rec.amount_diff) == Decimal("0.50")
+    assert Decimal(rec.match_score) == Decimal("87.5")
+    # 缓存与数据库不一致，丢弃后下次重新加载
+    assert 1 not in reconciliation_incremental._candidate_cache
+
+
+def test_claim_rejects_ledger_no_longer_eligible(db):
+    ledger_id = _warm_cache(db)
+    db.get(LedgerTransaction, ledger_id).direction = "income"
+    db.commit()
+
+    spend_id = _add_spend(db, "100.00")
+    assert reconcile_new_spend(spend_id) is None
+
+    db.expire_all()
+    assert db.query(Reconciliation).count() == 0
+    assert db.get(AdSpendDaily, spend_id).status == "pending"
+    assert 1 not in reconciliation_incremental._candidate_cache
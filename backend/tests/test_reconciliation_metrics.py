@@ -0,0 +1,59 @@
+"""对账运行指标"""
+from contextlib import contextmanager
+import pytest
+from app.models import ReconciliationRun
+from app.services import reconciliation_incremental, reconciliation_service
+from app.services.reconciliation_metrics import RunMetrics, current_peak_rss_kb, reset_peak_rss, track_run
+
+
+def test_peak_rss_is_measured_per_run():
+    if not reset_peak_rss():
+        pytest.skip("当前平台不能重置进程内存峰值")
+
+    # 对账开始前的一次大量分配不计入本次对账的峰值
+    buffer = bytearray(256 * 1024 * 1024)
+    buffer[::4096] = b"x" * len(buffer[::4096])
+    before_run = current_peak_rss_kb()
+    del buffer
+
+    with track_run() as metrics:
+        small = bytearray(1024 * 1024)
+    del small
+    assert metrics.peak_rss_kb is not None
+    assert metrics.peak_rss_kb < before_run - 128 * 1024
+
+
+def test_merge_keeps_largest_peak():
+    metrics = RunMetrics()
+    metrics.merge({"phase_seconds": {"match": 1.0}, "counters": {"candidate_pairs": 3}, "peak_rss_kb": 2048})
+    metrics.merge({"phase_seconds": {"match": 0.5}, "counters": {"candidate_pairs": 2}, "peak_rss_kb": 1024})
+    assert metrics.peak_rss_kb == 2048
+    assert metrics.phase_seconds["match"] == 1.5
+    assert metrics.counters["candidate_pairs"] == 5
+
+
+@pytest.fixture
+def broken_track_run(monkeypatch):
+    """进入 track_run() 时就出错"""
+    @contextmanager
+    def broken():
+        raise RuntimeError("无法开始收集指标")
+        yield
+
+    monkeypatch.setattr(reconciliation_service, "track_run", broken)
+    monkeypatch.setattr(reconciliation_incremental, "track_run", broken)
+
+
+def test_run_is_recorded_when_tracking_fails_to_start(db, broken_track_run):
+    with pytest.raises(RuntimeError, match="无法开始收集指标"):
+        reconciliation_service.run_reconciliation(db)
+    run = db.query(ReconciliationRun).one()
+    assert run.status == "failed"
+    assert "无法开始收集指标" in run.error
+
+
+def test_incremental_run_is_recorded_when_tracking_fails_to_start(db, broken_track_run):
+    with pytest.raises(RuntimeError, match="无法开始收集指标"):
+        reconciliation_incremental._run_recorded(db, lambda: None)
+    run = db.query(ReconciliationRun).one()
+    assert (run.mode, run.status) == ("incremental", "failed")
@@ -0,0 +1,30 @@
+"""按项目分片的并行对账"""
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+from app.models import ReconciliationRun
+from app.services.reconciliation_service import run_reconciliation
+from conftest import make_ledger, make_spend, seed_directory
+
+TODAY = date.today()
+
+
+def test_statement_count_includes_workers(db):
+    rnd = random.Random(5)
+    seed_directory(db, 4)
+    for _ in range(40):
+        project_id = rnd.randint(1, 4)
+        spend_date = TODAY - timedelta(days=rnd.randint(0, 5))
+        amount = Decimal(rnd.randint(1000, 1050)) / 10
+        db.add(make_spend(spend_date, amount, project_id))
+        db.add(make_ledger(spend_date, amount, project_id))
+    db.commit()
+
+    result = run_reconciliation(db, workers=2)
+    assert result["shard_count"] == 2
+    assert result["matched_count"] == 40
+
+    run = db.get(ReconciliationRun, result["run_id"])
+    # 响应与运行记录中的语句数一致，都包括子进程发出的语句
+    assert result["sql_statement_count"] == run.sql_statement_count
+    assert result["sql_statement_count"] > result["worker_sql_statement_count"] > 0
@@ -0,0 +1,36 @@
+"""拆分付款匹配（一笔财务记录对应多条投手日报）"""
+from datetime import date, timedelta
+from app.config import settings
+from app.models import Reconciliation
+from app.services.reconciliation_service import run_reconciliation
+from conftest import make_ledger, make_spend, seed_directory
+
+DAY = date.today() - timedelta(days=3)
+
+
+def _seed(db):
+    seed_directory(db)
+    db.add_all([make_spend(DAY - timedelta(days=2), "40.00"), make_spend(DAY - timedelta(days=1), "60.00")])
+    db.add(make_ledger(DAY, "100.00"))
+    db.commit()
+
+
+def _statuses(db) -> list:
+    return sorted(rec.status for rec in db.query(Reconciliation).all())
+
+
+def test_split_payments_disabled_by_default(db):
+    assert settings.reconcile_split_payments is False
+    _seed(db)
+    result = run_reconciliation(db)
+    assert result["matched_count"] == 0
+    assert _statuses(db) == ["need_review", "need_review"]
+
+
+def test_split_payments_when_enabled(db, monkeypatch):
+    monkeypatch.setattr(settings, "reconcile_split_payments", True)
+    _seed(db)
+    result = run_reconciliation(db)
+    assert result["matched_count"] == 2
+    assert _statuses(db) == ["matched", "matched"]
+    assert len({rec.group_id for rec in db.query(Reconciliation).all()}) == 1
@@ -0,0 +1,48 @@
+"""sql 策略生成的候选查询（不需要 PostgreSQL，按 PostgreSQL 方言编译后检查）"""
+import re
+from datetime import date
+import pytest
+from sqlalchemy.dialects import postgresql
+from app.db.session import engine
+from app.services.reconciliation_service import run_reconciliation
+from app.services.reconciliation_sql import build_candidate_query
+
+
+def _compile(query) -> str:
+    return " ".join(str(query.compile(dialect=postgresql.dialect())).split())
+
+
+def test_candidate_query_ranks_pairs_with_window_functions():
+    sql = _compile(build_candidate_query(date(2024, 10, 31), spend_ids=[1, 2], late_spend_starts={1: date(2024, 9, 1)}))
+
+    # 候选对和金额最接近的记录各用一个窗口函数按 spend 排名，三部分用 UNION ALL 合并
+    assert sql.count("row_number() OVER (PARTITION BY pending_spends.id ORDER BY") == 2
+    assert sql.count("UNION ALL") == 2
+    assert "greatest(" in sql
+    # 只处理本次认领的投手日报
+    assert "ad_spend_daily.id = ANY (%(claimed_spend_ids)s::INTEGER[])" in sql
+    # 回看窗口、水位线和迟报范围与内存匹配使用同一个过滤条件
+    assert "reconciliation_watermarks.ledgers_synced_at" in sql
+    assert "ledger_transactions.tx_date >= %(tx_date_1)s" in sql
+
+
+def test_rate_subquery_is_correlated_with_each_ledger():
+    sql = _compile(build_candidate_query(None))
+
+    # 汇率子查询引用外层的财务记录（而不是在子查询内再扫描一遍 ledger_transactions）
+    assert re.search(
+        r"\(SELECT exchange_rates\.rate_to_usdt FROM exchange_rates "
+        r"WHERE exchange_rates\.currency = ledger_transactions\.currency "
+        r"AND exchange_rates\.rate_date <= ledger_transactions\.tx_date "
+        r"ORDER BY exchange_rates\.rate_date DESC LIMIT %\(\w+\)s\)",
+        sql
+    )
+    assert "round(ledger_transactions.amount * (SELECT" in sql
+    # 不限制回看窗口时没有水位线条件
+    assert "reconciliation_watermarks" not in sql
+
+
+@pytest.mark.skipif(engine.dialect.name == "postgresql", reason="只检查非 PostgreSQL 数据库上的报错")
+def test_sql_strategy_requires_postgresql(db):
+    with pytest.raises(ValueError, match="PostgreSQL"):
+        run_reconciliation(db, strategy="sql")
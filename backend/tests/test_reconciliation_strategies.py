@@ -0,0 +1,127 @@
+"""python 与 sql 两种对账策略的结果一致性"""
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+import pytest
+from app.db.session import engine
+from app.models import ExchangeRate, Reconciliation
+from app.services.reconciliation_service import run_reconciliation
+from conftest import make_ledger, make_spend, reset_database, seed_directory
+
+pytestmark = pytest.mark.skipif(
+    engine.dialect.name != "postgresql",
+    reason="sql 策略只支持 PostgreSQL，设置 TEST_DATABASE_URL 后运行"
+)
+
+TODAY = date.today()
+
+
+def _day(offset: int) -> date:
+    return TODAY - timedelta(days=offset)
+
+
+def _reconcile(db, strategy: str, seed, assignment: str = "greedy") -> set:
+    """在一套新建的表上写入 seed 的数据并对账，返回 (spend_id, ledger_id, match_score, amount_diff, status)"""
+    db.rollback()
+    reset_database()
+    seed(db)
+    db.commit()
+    run_reconciliation(db, strategy=strategy, assignment=assignment)
+    return {
+        (rec.ad_spend_id, rec.ledger_id, Decimal(rec.match_score), Decimal(rec.amount_diff), rec.status)
+        for rec in db.query(Reconciliation).all()
+    }
+
+
+def _assert_same_results(db, seed, assignment: str = "greedy") -> set:
+    python_rows = _reconcile(db, "python", seed, assignment)
+    sql_rows = _reconcile(db, "sql", seed, assignment)
+    assert python_rows == sql_rows
+    return python_rows
+
+
+def _seed_date_window(db):
+    seed_directory(db)
+    db.add_all([
+        make_spend(_day(5), "100.00"),   # 1：前一天的财务记录
+        make_spend(_day(5), "200.00"),   # 2：后一天的财务记录
+        make_spend(_day(5), "300.00"),   # 3：只有相差两天的记录，不匹配
+    ])
+    db.add_all([
+        make_ledger(_day(6), "100.00"),
+        make_ledger(_day(4), "200.00"),
+        make_ledger(_day(7), "300.00"),
+    ])
+
+
+def test_date_window_of_one_day(db):
+    rows = _assert_same_results(db, _seed_date_window)
+    matched = {(spend_id, ledger_id) for spend_id, ledger_id, _, _, status in rows if status == "matched"}
+    assert matched == {(1, 1), (2, 2)}
+    assert {row[4] for row in rows if row[0] == 3} == {"need_review"}
+
+
+def _seed_ties(db):
+    seed_directory(db)
+    db.add_all([
+        make_spend(_day(3), "50.00"),    # 1、2：同一笔财务记录的两个完全相同的候选
+        make_spend(_day(3), "50.00"),
+        make_spend(_day(2), "80.00"),    # 3：两笔完全相同的财务记录
+    ])
+    db.add_all([
+        make_ledger(_day(3), "50.00"),
+        make_ledger(_day(2), "80.00"),
+        make_ledger(_day(2), "80.00"),
+        make_ledger(_day(2), "80.50"),
+    ])
+
+
+@pytest.mark.parametrize("assignment", ["greedy", "optimal"])
+def test_tie_break(db, assignment):
+    rows = _assert_same_results(db, _seed_ties, assignment)
+    matched = {(spend_id, ledger_id) for spend_id, ledger_id, _, _, status in rows if status == "matched"}
+    # 同等条件下 ID 小的记录优先
+    assert (1, 1) in matched and (3, 2) in matched
+    assert {row[4] for row in rows if row[0] == 2} == {"need_review"}
+
+
+def _seed_currencies(db):
+    seed_directory(db)
+    db.add(ExchangeRate(currency="CNY", rate_date=_day(30), rate_to_usdt=Decimal("0.14")))
+    db.add_all([
+        make_spend(_day(3), "98.00"),    # 1：700 CNY 折合 98 USDT
+        make_spend(_day(3), "70.00"),    # 2：HKD 没有汇率，不参与匹配
+    ])
+    db.add_all([
+        make_ledger(_day(3), "700.00", currency="CNY"),
+        make_ledger(_day(3), "70.00", currency="HKD"),
+    ])
+
+
+def test_non_usdt_ledgers(db):
+    rows = _assert_same_results(db, _seed_currencies)
+    matched = {(spend_id, ledger_id) for spend_id, ledger_id, _, _, status in rows if status == "matched"}
+    assert matched == {(1, 1)}
+
+
+def _seed_random(db):
+    rnd = random.Random(7)
+    seed_directory(db, 3)
+    db.add(ExchangeRate(currency="CNY", rate_date=_day(30), rate_to_usdt=Decimal("0.14")))
+    for _ in range(150):
+        project_id = rnd.randint(1, 3)
+        db.add(make_spend(_day(rnd.randint(0, 6)), Decimal(rnd.randint(1000, 1100)) / 10, project_id))
+    for _ in range(150):
+        db.add(make_ledger(
+            _day(rnd.randint(0, 8)),
+            Decimal(rnd.randint(1000, 1100)) / 10,
+            project_id=rnd.randint(1, 3),
+            currency=rnd.choice(["USDT"] * 5 + ["CNY"]),
+            direction=rnd.choice(["expense"] * 5 + ["income"])
+        ))
+
+
+@pytest.mark.parametrize("assignment", ["greedy", "optimal"])
+def test_random_dataset(db, assignment):
+    rows = _assert_same_results(db, _seed_random, assignment)
+    assert any(row[4] == "matched" for row in rows)
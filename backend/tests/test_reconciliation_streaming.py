@@ -0,0 +1,84 @@
+"""分块流式对账"""
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+from app.models import AdSpendDaily, Reconciliation, ReconciliationRun
+from app.services.reconciliation_service import run_reconciliation
+from conftest import make_ledger, make_spend, reset_database, seed_directory
+
+TODAY = date.today()
+
+
+def _day(offset: int) -> date:
+    return TODAY - timedelta(days=offset)
+
+
+def _seed_random(db):
+    rnd = random.Random(11)
+    seed_directory(db, 3)
+    for _ in range(120):
+        db.add(make_spend(_day(rnd.randint(0, 10)), Decimal(rnd.randint(1000, 1060)) / 10, rnd.randint(1, 3)))
+    for _ in range(120):
+        db.add(make_ledger(_day(rnd.randint(0, 12)), Decimal(rnd.randint(1000, 1060)) / 10, rnd.randint(1, 3)))
+    db.commit()
+
+
+def _matched_pairs(db) -> set:
+    return {
+        (rec.ad_spend_id, rec.ledger_id, Decimal(rec.match_score))
+        for rec in db.query(Reconciliation).filter(Reconciliation.status == "matched").all()
+    }
+
+
+def test_chunk_size_does_not_change_matches(db):
+    _seed_random(db)
+    single = run_reconciliation(db, chunk_size=100000)
+    single_pairs = _matched_pairs(db)
+
+    db.rollback()
+    reset_database()
+    _seed_random(db)
+    chunked = run_reconciliation(db, chunk_size=7)
+    assert chunked["chunk_count"] > 1
+    assert _matched_pairs(db) == single_pairs
+    for key in ("matched_count", "unmatched_count", "total_processed"):
+        assert chunked[key] == single[key]
+    # 只返回数量，不累计已处理的投手日报 ID
+    assert "processed_spend_ids" not in chunked
+    assert chunked["total_processed"] == 120
+
+
+def test_chunk_loads_only_its_date_window(db):
+    seed_directory(db)
+    db.add(make_spend(_day(20), "100.00"))
+    db.add(make_spend(_day(2), "100.00"))
+    db.add_all([make_ledger(_day(offset), "300.00") for offset in range(0, 25)])
+    db.add(make_ledger(_day(3), "100.00"))
+    db.commit()
+
+    result = run_reconciliation(db, chunk_size=1)
+    assert result["chunk_count"] == 2
+    assert result["matched_count"] == 1
+
+    run = db.get(ReconciliationRun, result["run_id"])
+    # 每块只加载投手日报日期前后一天的记录：第一块 3 条，第二块 3 条加上金额相同的 1 条
+    assert run.ledgers_loaded == 7
+
+
+def test_resume_after_watermark(db):
+    _seed_random(db)
+    first = run_reconciliation(db, chunk_size=100000)
+    total = first["total_processed"]
+
+    db.rollback()
+    reset_database()
+    _seed_random(db)
+    spends = sorted(
+        (spend.project_id, spend.spend_date, spend.id)
+        for spend in db.query(AdSpendDaily).all()
+    )
+    project_id, spend_date, spend_id = spends[49]
+    resumed = run_reconciliation(
+        db, chunk_size=10, resume_after=f"{project_id}:{spend_date.isoformat()}:{spend_id}"
+    )
+    assert resumed["total_processed"] == total - 50
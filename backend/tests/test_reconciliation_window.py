@@ -0,0 +1,50 @@
+"""对账回看窗口"""
+from datetime import date, datetime, timedelta, timezone
+from app.config import settings
+from app.models import LedgerTransaction, Reconciliation
+from app.services.reconciliation_service import run_reconciliation
+from app.services.reconciliation_window import candidate_ledger_filter, load_late_spend_starts, lookback_start
+from conftest import make_ledger, make_spend, seed_directory
+
+TODAY = date(2024, 11, 30)
+
+
+def test_lookback_defaults_to_30_days():
+    assert settings.reconcile_lookback_days == 30
+    assert lookback_start(TODAY) == date(2024, 10, 31)
+
+
+def test_zero_lookback_is_unbounded(monkeypatch):
+    monkeypatch.setattr(settings, "reconcile_lookback_days", 0)
+    assert lookback_start(TODAY) is None
+    assert load_late_spend_starts(None, None) == {}
+
+
+def test_late_spend_starts(db):
+    since = lookback_start(TODAY)
+    seed_directory(db)
+    db.add(make_spend(date(2024, 9, 15), "100.00"))
+    db.commit()
+    # 早于回看窗口的 pending 投手日报：该项目额外加载迟报日期前一天之后的记录
+    assert load_late_spend_starts(db, since) == {1: date(2024, 9, 14)}
+
+
+def test_old_unmatched_ledger_skipped_until_late_spend_arrives(db):
+    today = date.today()
+    old_day = today - timedelta(days=400)
+    seed_directory(db)
+    db.add(make_spend(today, "50.00"))
+    db.add(make_ledger(today, "50.00"))
+    db.add(make_ledger(old_day, "100.00", created_at=datetime.now(timezone.utc) - timedelta(days=400)))
+    db.commit()
+    assert run_reconciliation(db)["matched_count"] == 1
+
+    # 稳定运行：窗口外、水位线之前的未匹配记录不再加载
+    candidates = db.query(LedgerTransaction).filter(candidate_ledger_filter(lookback_start(), {})).all()
+    assert candidates == []
+
+    # 迟报的投手日报到达后，窗口外的旧记录仍能匹配
+    db.add(make_spend(old_day, "100.00"))
+    db.commit()
+    assert run_reconciliation(db)["matched_count"] == 1
+    assert db.query(Reconciliation).filter(Reconciliation.status == "matched").count() == 2
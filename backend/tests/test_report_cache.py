@@ -0,0 +1,55 @@
+"""诊断报告缓存"""
+from datetime import date
+from decimal import Decimal
+from app.models import LedgerTransaction, ReportDataVersion
+from app.services import report_cache_service
+from app.services.monthly_report_service import generate_monthly_report, refresh_dirty_cells
+from app.services.report_cache_service import ReportCache, get_diagnostic_report
+from conftest import make_ledger, seed_report_months
+
+MONTHS = [(2025, 1), (2025, 2)]
+
+
+def _seed_cached_report(db, monkeypatch):
+    monkeypatch.setattr(report_cache_service, "_cache", ReportCache(16))
+    seed_report_months(db, 2, MONTHS)
+    for year, month in MONTHS:
+        generate_monthly_report(db, year, month)
+
+    _, first = get_diagnostic_report(db, 2025, 2)
+    _, second = get_diagnostic_report(db, 2025, 2)
+    assert first["cache"] == "miss"
+    assert second["cache"] == "hit"
+    return second
+
+
+def test_fee_change_bypasses_cache_until_refreshed(db, monkeypatch):
+    cached = _seed_cached_report(db, monkeypatch)
+
+    # 只修改手续费：诊断报告的手续费对比用到该字段，刷新之前每次都重新生成
+    ledger = db.query(LedgerTransaction).filter(
+        LedgerTransaction.tx_date >= date(2025, 2, 1)
+    ).order_by(LedgerTransaction.id).first()
+    ledger.fee_amount = (ledger.fee_amount or Decimal("0")) + Decimal("12.5")
+    db.commit()
+    for _ in range(2):
+        _, meta = get_diagnostic_report(db, 2025, 2)
+        assert meta["cache"] == "miss"
+        assert meta["dirty"] is True
+
+    refresh_dirty_cells(db)
+    _, refreshed = get_diagnostic_report(db, 2025, 2)
+    _, again = get_diagnostic_report(db, 2025, 2)
+    assert refreshed["cache"] == "miss"
+    assert refreshed["data_version"] != cached["data_version"]
+    assert again["cache"] == "hit"
+
+
+def test_inserts_do_not_write_data_versions(db, monkeypatch):
+    _seed_cached_report(db, monkeypatch)
+    versions = {(row.year, row.month): row.version for row in db.query(ReportDataVersion).all()}
+
+    db.add(make_ledger(date(2025, 2, 20), "50.00", fee_amount=Decimal("1")))
+    db.commit()
+    db.expire_all()
+    assert {(row.year, row.month): row.version for row in db.query(ReportDataVersion).all()} == versions
@@ -0,0 +1,52 @@
+"""报表任务"""
+import logging
+import os
+import socket
+import subprocess
+import sys
+from fastapi.testclient import TestClient
+from app import main
+from app.models import ReportJob
+from app.services.report_job_service import fail_orphaned_jobs
+
+
+def _exited_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_fail_orphaned_jobs_only_touches_exited_local_workers(db):
+    host = socket.gethostname()
+    jobs = {
+        "exited": ReportJob(job_type="monthly", year=2025, month=1, status="running", worker=f"{host}:{_exited_pid()}"),
+        "restarted": ReportJob(job_type="monthly", year=2025, month=2, status="running", worker=f"{host}:{os.getpid()}"),
+        "alive": ReportJob(job_type="monthly", year=2025, month=3, status="running", worker=f"{host}:{os.getppid()}"),
+        "other_host": ReportJob(job_type="monthly", year=2025, month=4, status="running", worker="other-host:1"),
+        "queued": ReportJob(job_type="monthly", year=2025, month=5, status="queued"),
+    }
+    db.add_all(jobs.values())
+    db.commit()
+
+    assert fail_orphaned_jobs() == 2
+    db.expire_all()
+    statuses = {name: job.status for name, job in jobs.items()}
+    assert statuses == {
+        "exited": "failed",
+        "restarted": "failed",
+        "alive": "running",
+        "other_host": "running",
+        "queued": "queued",
+    }
+    assert jobs["exited"].finished_at is not None
+
+
+def test_startup_logs_job_recovery_errors(monkeypatch, caplog):
+    def broken():
+        raise RuntimeError("report_jobs 表不存在")
+
+    monkeypatch.setattr(main, "fail_orphaned_jobs", broken)
+    with caplog.at_level(logging.ERROR, logger="app.main"):
+        with TestClient(main.app) as client:
+            assert client.get("/health").status_code == 200
+    assert "report_jobs 表不存在" in caplog.text